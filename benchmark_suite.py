@@ -0,0 +1,255 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(BASE_DIR, 'czwartek'), os.path.join(BASE_DIR, 'sroda')]
+
+import zadanie_wtorek
+from db_benchmark import NAMES, generate_inventory
+from parser_benchmark import DESCRIPTIONS, generate_sensor_csv
+from zadanie_models import InMemoryDatabaseHandler, MenuHandler
+from zadanie_parser import csv_data_reader, json_writer
+
+DEFAULT_BASELINE = os.path.join(BASE_DIR, 'benchmark_baseline.json')
+
+BENCHMARKS = OrderedDict()  # name -> function(workspace) returning (seconds, operations)
+
+
+def benchmark(name: str):
+    """Decorator registering a benchmark, the function measures its own hot part"""
+    def decorator(function):
+        BENCHMARKS[name] = function
+        return function
+    return decorator
+
+
+def sensor_descriptions(count: int) -> tuple:
+    """Names of count sensors, e.g. Temperature, Pressure, ..., Temperature-1"""
+    return tuple(DESCRIPTIONS[index % len(DESCRIPTIONS)] + (f'-{index // len(DESCRIPTIONS)}'
+                                                            if index >= len(DESCRIPTIONS) else '')
+                 for index in range(count))
+
+
+class Workspace:
+    """Synthetic data shared by the benchmarks, generated once per run"""
+
+    def __init__(self, directory: str, rows: int, descriptions: int, size: int, operations: int):
+        self.directory = directory
+        self.rows = rows
+        self.size = size
+        self.operations = operations
+        self.csv_path = os.path.join(directory, 'sensors.csv')
+        generate_sensor_csv(self.csv_path, rows, sensor_descriptions(descriptions))
+        self.records = generate_inventory(size)
+        rng = random.Random(size)
+        self.ids = [rng.randint(1, size) for _ in range(operations)]
+        self.__grouped_data = None
+
+    @property
+    def grouped_data(self) -> dict:
+        if self.__grouped_data is None:
+            self.__grouped_data = csv_data_reader(self.csv_path)
+        return self.__grouped_data
+
+    def database(self):
+        """Connected in-memory database with a copy of the synthetic inventory"""
+        db = InMemoryDatabaseHandler(self.records, verbose=False)
+        db.connect()
+        return db
+
+
+@benchmark('parser.csv_data_reader')
+def bench_csv_data_reader(workspace):
+    start = time.perf_counter()
+    csv_data_reader(workspace.csv_path)
+    return time.perf_counter() - start, workspace.rows
+
+
+@benchmark('parser.csv_data_reader.columnar')
+def bench_columnar_reader(workspace):
+    start = time.perf_counter()
+    csv_data_reader(workspace.csv_path, backend='columnar')
+    return time.perf_counter() - start, workspace.rows
+
+
+@benchmark('parser.json_writer')
+def bench_json_writer(workspace):
+    data = workspace.grouped_data
+    start = time.perf_counter()
+    json_writer(os.path.join(workspace.directory, 'output.json'), data, compact=True)
+    return time.perf_counter() - start, workspace.rows
+
+
+@benchmark('store.add_item')
+def bench_add_item(workspace):
+    db = InMemoryDatabaseHandler({}, verbose=False)
+    db.connect()
+    items = [(NAMES[index % len(NAMES)], index % 100 + 1) for index in range(workspace.operations)]
+    start = time.perf_counter()
+    for item_name, item_qty in items:
+        db.add_item(item_name, item_qty)
+    return time.perf_counter() - start, len(items)
+
+
+@benchmark('store.add_items')
+def bench_add_items(workspace):
+    db = InMemoryDatabaseHandler({}, verbose=False)
+    db.connect()
+    items = [(record.Name, record.Qty) for record in workspace.records.values()]
+    start = time.perf_counter()
+    db.add_items(items)
+    return time.perf_counter() - start, len(items)
+
+
+@benchmark('store.query_by_id')
+def bench_query_by_id(workspace):
+    db = workspace.database()
+    start = time.perf_counter()
+    for item_id in workspace.ids:
+        db.query_by_id(item_id)
+    return time.perf_counter() - start, len(workspace.ids)
+
+
+@benchmark('store.query_by_name')
+def bench_query_by_name(workspace):
+    db = workspace.database()
+    names = [workspace.records[item_id].Name for item_id in workspace.ids]
+    start = time.perf_counter()
+    for item_name in names:
+        db.query_by_name(item_name)
+    return time.perf_counter() - start, len(names)
+
+
+@benchmark('store.query_page')
+def bench_query_page(workspace):
+    db = workspace.database()
+    start = time.perf_counter()
+    for item_id in workspace.ids:
+        db.query_page(item_id % workspace.size, 20, sort_by='Qty')
+    return time.perf_counter() - start, len(workspace.ids)
+
+
+@benchmark('store.edit_quantity')
+def bench_edit_quantity(workspace):
+    db = workspace.database()
+    start = time.perf_counter()
+    for item_id in workspace.ids:
+        db.edit_quantity(item_id, item_id % 100 + 1)
+    return time.perf_counter() - start, len(workspace.ids)
+
+
+@benchmark('menu.run_script')
+def bench_menu_script(workspace):
+    db = workspace.database()
+    script = ['add', 'console']
+    script.extend(f'Item-{index}, {index % 100 + 1}' for index in range(workspace.operations // 2))
+    script.extend(['main', 'edit'])
+    script.extend(f'{item_id}, +1' for item_id in workspace.ids[:workspace.operations // 2])
+    result = MenuHandler(db).run_script(script)
+    return result.seconds, result.commands
+
+
+@benchmark('wtorek.run_batch')
+def bench_wtorek_batch(workspace):
+    inventory = OrderedDict(workspace.records)
+    commands = []
+    for index, item_id in enumerate(workspace.ids[:workspace.operations // 2]):
+        commands.extend(['2', f'Item-{index}, {index % 100 + 1}', '3', f'{item_id}, +1'])
+    result = zadanie_wtorek.run_batch(commands, inventory)
+    return result.seconds, result.commands
+
+
+def run_benchmarks(workspace, names, repeat: int = 3) -> dict:
+    """
+    Runs benchmarks and keeps the best of repeated runs, which is the least disturbed by other processes
+
+    :return: dict of name -> {'Ops/s', 'Seconds', 'Operations'}
+    """
+    results = OrderedDict()
+    for name in names:
+        seconds, operations = min((BENCHMARKS[name](workspace) for _ in range(repeat)),
+                                  key=lambda result: result[0] / result[1])
+        results[name] = {'Ops/s': operations / seconds, 'Seconds': seconds, 'Operations': operations}
+        print(name.ljust(34) + f'{seconds:.3f} s'.ljust(12) + f'{operations / seconds:,.0f} ops/s')
+    return results
+
+
+def compare(baseline: dict, results: dict, threshold: float) -> list:
+    """
+    Prints current results next to the baseline
+
+    :param threshold: allowed relative slowdown, e.g. 0.2 for 20%
+    :return: names of benchmarks slower than the baseline by more than threshold
+    """
+    print(format(' Comparison with baseline ', '-^60'))
+    print('Benchmark'.ljust(34) + 'Baseline'.ljust(14) + 'Current'.ljust(14) + 'Change')
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            print(name.ljust(34) + 'new')
+            continue
+        change = result['Ops/s'] / baseline[name]['Ops/s'] - 1
+        regressed = change < -threshold
+        if regressed:
+            regressions.append(name)
+        print(name.ljust(34) + f'{baseline[name]["Ops/s"]:,.0f}'.ljust(14) + f'{result["Ops/s"]:,.0f}'.ljust(14)
+              + f'{change:+.1%}' + (' REGRESSION' if regressed else ''))
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks of the parser, JSON writer, inventory store and menus')
+    parser.add_argument('--rows', type=int, default=200_000, help='number of rows in the sensor csv file')
+    parser.add_argument('--descriptions', type=int, default=4, help='number of sensors in the csv file')
+    parser.add_argument('--size', type=int, default=100_000, help='number of inventory records')
+    parser.add_argument('--operations', type=int, default=20_000, help='number of store operations and commands')
+    parser.add_argument('--repeat', type=int, default=3, help='runs of every benchmark, the best one is kept')
+    parser.add_argument('--filter', default='', help='run only benchmarks with names containing this text')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='JSON file with baseline results')
+    parser.add_argument('--save', action='store_true', help='store the results as the new baseline')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='relative slowdown reported as a regression, 0.2 means 20%%')
+    args = parser.parse_args()
+
+    parameters = {'Rows': args.rows, 'Descriptions': args.descriptions, 'Size': args.size,
+                  'Operations': args.operations}
+    selected = [name for name in BENCHMARKS if args.filter in name]
+
+    with tempfile.TemporaryDirectory() as directory:
+        print(format(' Generating data ', '-^60'))
+        workspace = Workspace(directory, args.rows, args.descriptions, args.size, args.operations)
+        print(format(' Benchmarks ', '-^60'))
+        results = run_benchmarks(workspace, selected, args.repeat)
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    regressions = []
+    if baseline is not None and not args.save:
+        if baseline['Parameters'] != parameters:
+            print(f'Baseline was recorded with {baseline["Parameters"]}, results are not compared')
+        else:
+            regressions = compare(baseline['Results'], results, args.threshold)
+
+    if args.save or baseline is None:
+        if baseline is not None and baseline['Parameters'] == parameters:
+            results = OrderedDict(baseline['Results'], **results)   # benchmarks skipped by --filter are kept
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump({'Parameters': parameters,
+                       'Environment': {'Python': platform.python_version(), 'Machine': platform.machine(),
+                                       'System': platform.platform(), 'CPUs': os.cpu_count()},
+                       'Results': results}, f, indent=2)
+        print(f'Baseline saved to {args.baseline}')
+
+    if regressions:
+        print(f'{len(regressions)} regressions: {", ".join(regressions)}')
+        sys.exit(1)
@@ -0,0 +1,301 @@
+import math
+from concurrent.futures import ProcessPoolExecutor
+
+from parallel_parser import ShardReport, expand_sources, parse_shard, split_shards, DEFAULT_SHARD_SIZE
+from timestamp_converter import to_epoch, from_epoch
+from zadanie_parser import ParserError, csv_row_reader
+
+DEFAULT_PERCENTILES = (0.5, 0.9, 0.99)
+
+
+class RunningStats:
+    """Count, min, max, mean and variance updated one value at a time (Welford's algorithm)"""
+
+    __slots__ = ('count', 'min', 'max', 'mean', '_m2')
+
+    def __init__(self):
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+        self.mean = 0.0
+        self._m2 = 0.0
+
+    def add(self, value: float):
+        """Adds a single value"""
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other: 'RunningStats'):
+        """Adds values summarized by other instance (Chan's parallel algorithm)"""
+        if not other.count:
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self._m2 += other._m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    @property
+    def variance(self) -> float:
+        """Population variance of added values"""
+        return self._m2 / self.count if self.count else 0.0
+
+
+class QuantileSketch:
+    """
+    Mergeable streaming sketch for approximate percentiles.
+
+    Values are counted in logarithmic buckets (DDSketch), so every returned percentile is within
+    relative_accuracy of a real value from the stream. Memory depends on the range of values,
+    not on their number.
+    """
+
+    def __init__(self, relative_accuracy: float = 0.01):
+        if not 0 < relative_accuracy < 1:
+            raise ValueError('Relative accuracy must be between 0 and 1!')
+        self.relative_accuracy = relative_accuracy
+        self.__gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.__log_gamma = math.log(self.__gamma)
+        self.__positive = {}    # bucket key -> count
+        self.__negative = {}    # bucket key of absolute value -> count
+        self.__zero_count = 0
+        self.count = 0
+
+    def __key(self, value: float) -> int:
+        return math.ceil(math.log(value) / self.__log_gamma)
+
+    def __bucket_value(self, key: int) -> float:
+        return 2 * self.__gamma ** key / (self.__gamma + 1)
+
+    def add(self, value: float):
+        """Adds a single value, raises ValueError for infinity and NaN which have no bucket"""
+        if not math.isfinite(value):
+            raise ValueError(f'Value {value} cannot be added to the sketch')
+        if value > 0:
+            key = self.__key(value)
+            self.__positive[key] = self.__positive.get(key, 0) + 1
+        elif value < 0:
+            key = self.__key(-value)
+            self.__negative[key] = self.__negative.get(key, 0) + 1
+        else:
+            self.__zero_count += 1
+        self.count += 1
+
+    def merge(self, other: 'QuantileSketch'):
+        """Adds values summarized by other sketch with the same accuracy"""
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError('Only sketches with the same accuracy can be merged')
+        for own, theirs in ((self.__positive, other.__positive), (self.__negative, other.__negative)):
+            for key, count in theirs.items():
+                own[key] = own.get(key, 0) + count
+        self.__zero_count += other.__zero_count
+        self.count += other.count
+
+    def quantile(self, q: float) -> float:
+        """
+        Returns approximate value at given quantile.
+
+        :param q: quantile between 0 and 1
+        :return: value or None for empty sketch
+        """
+        if not 0 <= q <= 1:
+            raise ValueError('Quantile must be between 0 and 1!')
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        for key in sorted(self.__negative, reverse=True):
+            seen += self.__negative[key]
+            if seen > rank:
+                return -self.__bucket_value(key)
+        seen += self.__zero_count
+        if seen > rank:
+            return 0.0
+        for key in sorted(self.__positive):
+            seen += self.__positive[key]
+            if seen > rank:
+                return self.__bucket_value(key)
+        return self.__bucket_value(max(self.__positive)) if self.__positive else 0.0
+
+
+class GroupAggregate:
+    """Running statistics and percentile sketch of a single group, infinite and NaN values are only counted"""
+
+    def __init__(self, relative_accuracy: float = 0.01):
+        self.stats = RunningStats()
+        self.sketch = QuantileSketch(relative_accuracy)
+        self.non_finite = 0
+
+    def add(self, value: float):
+        if not math.isfinite(value):
+            self.non_finite += 1
+            return
+        self.stats.add(value)
+        self.sketch.add(value)
+
+    def merge(self, other: 'GroupAggregate'):
+        self.stats.merge(other.stats)
+        self.sketch.merge(other.sketch)
+        self.non_finite += other.non_finite
+
+    def summary(self, percentiles=DEFAULT_PERCENTILES) -> dict:
+        """Statistics as a JSON serializable dict"""
+        return {'Count': self.stats.count,
+                'Min': self.stats.min,
+                'Max': self.stats.max,
+                'Mean': self.stats.mean,
+                'Variance': self.stats.variance,
+                'NonFinite': self.non_finite,
+                'Percentiles': {f'p{q * 100:g}': self.sketch.quantile(q) for q in percentiles}}
+
+
+class SensorAggregator:
+    """
+    Incremental aggregation of sensor readings per description and time window.
+
+    Readings are added as they arrive, only one GroupAggregate per group and window is kept.
+    Aggregators built from separate chunks of data can be merged.
+    """
+
+    def __init__(self, window_seconds: int = None, relative_accuracy: float = 0.01):
+        """
+        :param window_seconds: length of time windows, None aggregates whole groups
+        :param relative_accuracy: accuracy of approximate percentiles
+        """
+        if window_seconds is not None and window_seconds <= 0:
+            raise ValueError('Window must be greater than 0!')
+        self.window_seconds = window_seconds
+        self.relative_accuracy = relative_accuracy
+        self.__groups = {}  # (description, window start or None) -> GroupAggregate
+
+    def __len__(self):
+        return len(self.__groups)
+
+    def add(self, description: str, reading: dict):
+        """
+        Adds a single reading in csv_data_reader format.
+
+        :param description: name of the group
+        :param reading: dict with 'Value' and 'Timestamp' keys
+        """
+        window = None
+        if self.window_seconds:
+            epoch = to_epoch(reading['Timestamp'])
+            window = epoch - epoch % self.window_seconds
+        group = self.__groups.get((description, window))
+        if group is None:
+            group = self.__groups[(description, window)] = GroupAggregate(self.relative_accuracy)
+        group.add(reading['Value'])
+
+    def update(self, readings):
+        """
+        Adds readings from an iterable, e.g. csv_row_reader(path).
+
+        :param readings: iterable of (description, reading) tuples
+        :return: self
+        """
+        for description, reading in readings:
+            self.add(description, reading)
+        return self
+
+    def update_groups(self, data: dict):
+        """
+        Adds readings from grouped data in csv_data_reader format.
+
+        :return: self
+        """
+        for description, group in data.items():
+            for reading in group['Values']:
+                self.add(description, reading)
+        return self
+
+    def merge(self, other: 'SensorAggregator'):
+        """
+        Adds partial aggregates of other aggregator with the same window.
+
+        :return: self
+        """
+        if other.window_seconds != self.window_seconds or other.relative_accuracy != self.relative_accuracy:
+            raise ValueError('Only aggregators with the same window and accuracy can be merged')
+        for key, group in other.__groups.items():
+            if key not in self.__groups:
+                self.__groups[key] = GroupAggregate(self.relative_accuracy)
+            self.__groups[key].merge(group)
+        return self
+
+    def results(self, percentiles=DEFAULT_PERCENTILES) -> dict:
+        """
+        Returns statistics of every group.
+
+        :param percentiles: quantiles reported for every group
+        :return: dict of description -> list of summaries; with windows every summary has
+            'Window' key holding start of the window in output timestamp format
+        """
+        output = {}
+        for (description, window), group in sorted(self.__groups.items(),
+                                                   key=lambda item: (item[0][0], item[0][1] or 0)):
+            summary = group.summary(percentiles)
+            if window is not None:
+                summary = {'Window': from_epoch(window), **summary}
+            output.setdefault(description, []).append(summary)
+        return output
+
+
+def aggregate_file(path: str, window_seconds: int = None) -> SensorAggregator:
+    """
+    Aggregates a csv file without keeping the readings in memory.
+
+    :param path: path to source file with data
+    :param window_seconds: length of time windows, None aggregates whole groups
+    :return: SensorAggregator or None in case of failure
+    """
+    try:
+        return SensorAggregator(window_seconds).update(csv_row_reader(path))
+    except ParserError:
+        return None
+
+
+def aggregate_shard(path: str, start: int, end: int, window_seconds: int = None):
+    """Parses and aggregates a byte range of a csv file, returns (SensorAggregator, ShardReport)"""
+    groups, report = parse_shard(path, start, end)
+    aggregator = SensorAggregator(window_seconds)
+    for description, readings in groups.items():
+        for reading in readings:
+            aggregator.add(description, reading)
+    return aggregator, report
+
+
+def aggregate_files(sources, window_seconds: int = None, workers: int = None,
+                    shard_size: int = DEFAULT_SHARD_SIZE):
+    """
+    Aggregates many csv files in a process pool, merging partial aggregates of every shard.
+
+    :param sources: path, glob pattern or list of them
+    :param window_seconds: length of time windows, None aggregates whole groups
+    :param workers: number of worker processes, defaults to number of CPUs
+    :param shard_size: approximate number of bytes parsed by one worker task
+    :return: (SensorAggregator, list of ShardReport)
+    """
+    tasks = []
+    reports = []
+    for path in expand_sources(sources):
+        try:
+            tasks.extend((path, start, end, window_seconds) for start, end in split_shards(path, shard_size))
+        except OSError as e:
+            reports.append(ShardReport(path, 0, 0, 0, f'Unable to access file: {e}'))
+
+    aggregator = SensorAggregator(window_seconds)
+    if tasks:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for partial, report in executor.map(aggregate_shard, *zip(*tasks)):
+                aggregator.merge(partial)
+                reports.append(report)
+    return aggregator, reports
@@ -0,0 +1,154 @@
+import logging
+import mmap
+import struct
+
+# File layout (little endian):
+#   header  - magic, format version, number of groups
+#   index   - for every group: length of name, utf-8 name, offset of its records, number of records
+#   records - fixed width records of every group, stored one group after another
+MAGIC = b'SNSR'
+VERSION = 1
+HEADER = struct.Struct('<4sHI')
+INDEX_NAME = struct.Struct('<H')
+INDEX_ENTRY = struct.Struct('<QQ')
+TIMESTAMP_SIZE = 19
+RECORD = struct.Struct(f'<qd{TIMESTAMP_SIZE}s')   # ID, Value, Timestamp ('dd-mm-YYYY HH:MM:SS')
+
+
+class BinaryFormatError(Exception):
+    """Exception raised for files which are not in the sensor binary format"""
+    def __init__(self, msg):
+        self.msg = msg
+
+    def __str__(self):
+        return f'{self.__class__.__name__} - {self.msg}'
+
+
+def _pack_group(readings) -> bytes:
+    records = []
+    for reading in readings:
+        timestamp = reading['Timestamp'].encode('ascii')
+        if len(timestamp) > TIMESTAMP_SIZE:
+            raise ValueError(f'Timestamp too long: {reading["Timestamp"]}')
+        records.append(RECORD.pack(reading['ID'], reading['Value'], timestamp))
+    return b''.join(records)
+
+
+def binary_writer(path: str, data: dict):
+    """
+    Writes grouped sensor data to a compact binary file
+
+    Every reading takes a fixed 35 byte record, groups can be read separately with BinaryDataReader.
+
+    :param path: path to output file
+    :param data: grouped sensor reading data, in csv_data_reader format
+    :return: number of written bytes or None in case of failure
+    """
+    try:
+        names = [description.encode('utf-8') for description in data]
+        index_size = sum(INDEX_NAME.size + len(name) + INDEX_ENTRY.size for name in names)
+        offset = HEADER.size + index_size
+
+        index = [HEADER.pack(MAGIC, VERSION, len(names))]
+        for name, group in zip(names, data.values()):
+            count = len(group['Values'])
+            index.append(INDEX_NAME.pack(len(name)) + name + INDEX_ENTRY.pack(offset, count))
+            offset += count * RECORD.size
+
+        with open(path, 'wb') as binary_file:
+            binary_file.write(b''.join(index))
+            for group in data.values():
+                binary_file.write(_pack_group(group['Values']))
+        return offset
+    except (TypeError, ValueError, KeyError, struct.error) as e:
+        logging.error(f'Could not convert to binary format: {e}')
+    except (PermissionError, FileNotFoundError) as e:
+        logging.error(f'Could not access {path}: {e}')
+
+
+class BinaryDataReader:
+    """Memory-mapped reader of files written by binary_writer"""
+
+    def __init__(self, path: str):
+        self.__path = path
+        self.__file = None
+        self.__map = None
+        self.__index = {}   # description -> (offset, count)
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close()
+
+    def open(self):
+        """Maps the file into memory and reads the group index"""
+        self.__file = open(self.__path, 'rb')
+        try:
+            self.__map = mmap.mmap(self.__file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.__read_index()
+        except (ValueError, struct.error, UnicodeDecodeError) as e:
+            self.close()
+            raise BinaryFormatError(f'Invalid file {self.__path}: {e}')
+        except BinaryFormatError:
+            self.close()
+            raise
+
+    def close(self):
+        """Releases the mapping and closes the file"""
+        if self.__map is not None:
+            self.__map.close()
+            self.__map = None
+        if self.__file is not None:
+            self.__file.close()
+            self.__file = None
+
+    def __read_index(self):
+        magic, version, group_count = HEADER.unpack_from(self.__map, 0)
+        if magic != MAGIC or version != VERSION:
+            raise BinaryFormatError(f'Unsupported file {self.__path}')
+        position = HEADER.size
+        for _ in range(group_count):
+            (name_length,) = INDEX_NAME.unpack_from(self.__map, position)
+            position += INDEX_NAME.size
+            name = self.__map[position:position + name_length].decode('utf-8')
+            position += name_length
+            offset, count = INDEX_ENTRY.unpack_from(self.__map, position)
+            position += INDEX_ENTRY.size
+            if offset + count * RECORD.size > len(self.__map):
+                raise BinaryFormatError(f'Truncated file {self.__path}')
+            self.__index[name] = (offset, count)
+
+    def descriptions(self) -> list:
+        """Names of stored groups in file order"""
+        return list(self.__index)
+
+    def count(self, description: str) -> int:
+        """Number of readings in a group"""
+        return self.__index[description][1]
+
+    def iter_group(self, description: str):
+        """
+        Lazily decodes readings of a single group, other groups are not touched.
+
+        The generator has to be exhausted or closed before the reader is closed.
+
+        :param description: name of the group
+        :return: generator of reading dicts, raises KeyError for unknown group
+        """
+        offset, count = self.__index[description]
+        view = memoryview(self.__map)[offset:offset + count * RECORD.size]
+        try:
+            for item_id, value, timestamp in RECORD.iter_unpack(view):
+                yield {'ID': item_id, 'Value': value, 'Timestamp': timestamp.rstrip(b'\0').decode('ascii')}
+        finally:
+            view.release()
+
+    def group(self, description: str) -> list:
+        """Readings of a single group"""
+        return list(self.iter_group(description))
+
+    def to_dict(self) -> dict:
+        """Whole file in csv_data_reader format"""
+        return {description: {'Values': self.group(description)} for description in self.__index}
@@ -0,0 +1,173 @@
+import csv
+import logging
+from array import array
+from collections import defaultdict
+
+from instrumentation import instrumented
+from timestamp_converter import get_converter
+from zadanie_parser import ParserError, _column_positions, _file_size, _readings_count, fields_type, \
+    input_time_format, output_time_format
+
+try:
+    import numpy as np
+except ImportError:     # numpy is optional, array based grouping is used without it
+    np = None
+
+class SensorColumns:
+    """Typed column storage for parsed sensor readings"""
+
+    def __init__(self):
+        self.ids = array('q')
+        self.values = array('d')
+        self.timestamps = []
+        self.codes = array('i')     # categorical code of description for every reading
+        self.descriptions = {}      # description -> code, in order of first appearance
+
+    def __len__(self):
+        return len(self.ids)
+
+    def extend(self, ids, values, timestamps, descriptions):
+        """Appends already converted columns of a single chunk, ids may be a list of integers out of 64 bit range"""
+        if isinstance(ids, list) and isinstance(self.ids, array):
+            self.ids = self.ids.tolist()    # IDs out of 64 bit range are kept as Python integers
+        self.ids.extend(ids)
+        self.values.extend(values)
+        self.timestamps.extend(timestamps)
+        categories = self.descriptions
+        self.codes.extend(categories[description] if description in categories
+                          else categories.setdefault(description, len(categories))
+                          for description in descriptions)
+
+    def group_order(self, use_numpy: bool = True):
+        """
+        Returns reading positions sorted by description code (stable) and the size of each group.
+
+        :param use_numpy: use numpy if it is installed
+        :return: (list of positions, list of group sizes in code order)
+        """
+        if use_numpy and np is not None:
+            codes = np.frombuffer(self.codes, dtype=np.int32)
+            order = np.argsort(codes, kind='stable').tolist()
+            counts = np.bincount(codes, minlength=len(self.descriptions)).tolist()
+        else:
+            order = sorted(range(len(self.codes)), key=self.codes.__getitem__)
+            counts = [self.codes.count(code) for code in range(len(self.descriptions))]
+        return order, counts
+
+
+@instrumented('parser.cast_column', rows=lambda result, *args, **kwargs: len(result))
+def _cast_column(column, cast, typecode: str, key: str, first_index: int):
+    """
+    Converts column of strings to typed array, logging the first failing row like csv_data_reader.
+    Integers out of range of the typecode are returned as a list, like csv_data_reader accepts them.
+    """
+    try:
+        return array(typecode, map(cast, column))
+    except OverflowError:
+        if typecode not in 'bhilq':
+            raise
+        try:
+            return list(map(cast, column))
+        except (ValueError, TypeError):
+            pass
+    except (ValueError, TypeError):
+        pass
+    for index, value in enumerate(column, first_index):
+        try:
+            cast(value)
+        except (ValueError, TypeError) as e:
+            logging.error(f'Conversion error in row "{index}", field "{key}": {e}')
+            raise ParserError(f'Conversion error in row "{index}"')
+    raise ParserError(f'Conversion error in field "{key}"')
+
+
+@instrumented('parser.convert_timestamps', rows=lambda result, *args, **kwargs: len(result))
+def _convert_timestamps(column, convert_timestamp, first_index: int):
+    """Converts column of timestamps, logging the first failing row like csv_data_reader"""
+    try:
+        return list(map(convert_timestamp, column))
+    except ValueError:
+        for index, value in enumerate(column, first_index):
+            try:
+                convert_timestamp(value)
+            except ValueError as e:
+                logging.error(f'Time conversion error in row "{index}", field "Timestamp": {e}')
+                raise ParserError(f'Time conversion error in row "{index}"')
+        raise
+
+
+def read_columns(path: str, chunk_size: int = 1 << 22) -> SensorColumns:
+    """
+    Reads a csv file in chunks of lines into typed columns.
+
+    Quoted values spanning several lines are not supported.
+
+    :param path: path to source file with data
+    :param chunk_size: approximate number of bytes read at once
+    :return: SensorColumns, raises ParserError on failure
+    """
+    convert_timestamp = get_converter(input_time_format, output_time_format)
+    columns = SensorColumns()
+    try:
+        with open(path, newline='') as f:
+            header = next(csv.reader([f.readline()]), None)
+            positions = _column_positions(header)
+
+            first_index = 1
+            while True:
+                lines = f.readlines(chunk_size)
+                if not lines:
+                    break
+                rows = [row for row in csv.reader(lines) if row]     # blank lines are skipped like in DictReader
+                for index, row in enumerate(rows, first_index):
+                    if len(row) != len(header):
+                        logging.error(f'Row "{index}" has {len(row)} fields, expected {len(header)}')
+                        raise ParserError(f'Invalid number of fields in row "{index}"')
+
+                table = list(zip(*rows))
+                ids, descriptions, values, timestamps = (table[position] for position in positions)
+                columns.extend(_cast_column(ids, fields_type['ID'], 'q', 'ID', first_index),
+                               _cast_column(values, fields_type['Value'], 'd', 'Value', first_index),
+                               _convert_timestamps(timestamps, convert_timestamp, first_index),
+                               descriptions)
+                first_index += len(rows)
+    except (FileNotFoundError, PermissionError) as e:
+        logging.error(f'Unable to access file: {e}')
+        raise ParserError(f'Unable to access file: {path}')
+
+    return columns
+
+
+@instrumented('parser.columnar_data_reader', rows=_readings_count, size=_file_size)
+def columnar_data_reader(path: str, chunk_size: int = 1 << 22, use_numpy: bool = True) -> dict:
+    """
+    Reads a csv file into typed columns and groups them by description.
+
+    Returns the same structure as csv_data_reader. IDs are stored as 64 bit integers, a list of Python
+    integers is used instead once an ID out of that range is read.
+
+    :param path: path to source file with data
+    :param chunk_size: approximate number of bytes read at once
+    :param use_numpy: use numpy for grouping if it is installed
+    :return: dictionary or None in case of failure
+    """
+    try:
+        columns = read_columns(path, chunk_size)
+    except ParserError:
+        return None
+
+    order, counts = columns.group_order(use_numpy)
+    ids = list(map(columns.ids.__getitem__, order))
+    values = list(map(columns.values.__getitem__, order))
+    timestamps = list(map(columns.timestamps.__getitem__, order))
+
+    output_dict = defaultdict(lambda: {'Values': []})  # Default output dict structure
+    start = 0
+    for description, count in zip(columns.descriptions, counts):
+        end = start + count
+        output_dict[description]['Values'] = [
+            {'ID': item_id, 'Value': value, 'Timestamp': timestamp}
+            for item_id, value, timestamp in zip(ids[start:end], values[start:end], timestamps[start:end])]
+        start = end
+
+    return output_dict
@@ -0,0 +1,455 @@
+import contextlib
+import json
+import math
+import os
+import tempfile
+import unittest
+import statistics
+import columnar_reader
+import instrumentation
+import parse_cache
+import zadanie_parser
+from aggregation import QuantileSketch, RunningStats, SensorAggregator, aggregate_file, aggregate_files
+from follow_reader import SensorFollower
+from parse_cache import ParseCache
+from time_index import TimeIndex, open_index
+from binary_format import BinaryDataReader, binary_writer
+from parallel_parser import parse_files, split_shards
+from timestamp_converter import convert_timestamp, get_converter, slow_converter
+from zadanie_parser import ParserError, csv_data_reader, csv_data_stream, json_stream_writer, json_writer
+
+INPUT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'input_data.csv')
+
+
+class CzwartekTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def temp_path(self, name):
+        return os.path.join(self.temp_dir.name, name)
+
+    def write_csv(self, name, lines):
+        path = self.temp_path(name)
+        with open(path, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        return path
+
+    def test_stream_batches(self):
+        batches = list(csv_data_stream(INPUT_PATH, batch_size=3))
+        with self.subTest(msg='Testing stream - batch size limit'):
+            assert all(len(readings) <= 3 for _, readings in batches)
+        with self.subTest(msg='Testing stream - same readings as in-memory reader'):
+            streamed = {}
+            for description, readings in batches:
+                streamed.setdefault(description, []).extend(readings)
+            expected = {key: group['Values'] for key, group in csv_data_reader(INPUT_PATH).items()}
+            assert streamed == expected
+
+    def test_stream_writer(self):
+        output_path = self.temp_path('output.json')
+        written = json_stream_writer(output_path, csv_data_stream(INPUT_PATH, batch_size=5))
+        with self.subTest(msg='Testing stream writer - number of readings'):
+            assert written == 16
+        with self.subTest(msg='Testing stream writer - document equal to in-memory reader'):
+            with open(output_path) as f:
+                assert f.read() == json.dumps(csv_data_reader(INPUT_PATH))
+
+    def test_stream_writer_interleaved_groups(self):
+        path = self.write_csv('interleaved.csv', ['ID,Description,Value,Timestamp',
+                                                  '1,Temperature,2.1,2022-08-04 10:01:01',
+                                                  '2,Pressure,20.1,2022-08-04 10:01:01',
+                                                  '3,Temperature,2.3,2022-08-04 10:01:02'])
+        output_path = self.temp_path('output.json')
+        json_stream_writer(output_path, csv_data_stream(path))
+        with open(output_path) as f:
+            assert json.load(f) == json.loads(json.dumps(csv_data_reader(path)))
+        with self.subTest(msg='Testing stream writer - more descriptions than open spool files'):
+            path = self.write_csv('round_robin.csv', ['ID,Description,Value,Timestamp'] +
+                                  [f'{index},Sensor {index % 3},{index}.5,2022-08-04 10:01:0{index}'
+                                   for index in range(1, 10)])
+            assert json_stream_writer(output_path, csv_data_stream(path), max_open_files=2) == 9
+            with open(output_path) as f:
+                assert f.read() == json.dumps(csv_data_reader(path))
+
+    def test_invalid_data(self):
+        path = self.write_csv('invalid.csv', ['ID,Description,Value,Timestamp',
+                                              '1,Temperature,2.1,2022-08-04 10:01:01',
+                                              'a,Temperature,2.3,2022-08-04 10:01:02'])
+        output_path = self.temp_path('output.json')
+        with self.assertLogs(level='ERROR'):
+            with self.subTest(msg='Testing reader - invalid row'):
+                assert csv_data_reader(path) is None
+            with self.subTest(msg='Testing stream writer - invalid row'):
+                assert json_stream_writer(output_path, csv_data_stream(path)) is None
+                assert not os.path.exists(output_path)
+            with self.subTest(msg='Testing reader - missing file'):
+                assert csv_data_reader(self.temp_path('missing.csv')) is None
+
+    def test_timestamp_conversion(self):
+        with self.subTest(msg='Testing timestamp - fast path'):
+            assert convert_timestamp('2022-08-04 10:01:01') == '04-08-2022 10:01:01'
+        with self.subTest(msg='Testing timestamp - same results as strptime'):
+            fast = get_converter('%Y-%m-%d %H:%M:%S', '%d-%m-%Y %H:%M:%S')
+            slow = slow_converter('%Y-%m-%d %H:%M:%S', '%d-%m-%Y %H:%M:%S')
+            for value in ['2022-08-04 23:59:59', '2022-8-4 1:2:3', '2020-02-29 00:00:00',
+                          '2022-08-04  1:01:01', '0999-01-01 00:00:00']:
+                assert fast(value) == slow(value)
+        with self.subTest(msg='Testing timestamp - invalid values'):
+            for value in ['2022-02-30 10:01:01', '2022-08-04 24:01:01', '2022-08-04 10:60:01',
+                          '2022-08-04 10:01:1x', '04-08-2022 10:01:01', '']:
+                self.assertRaises(ValueError, convert_timestamp, value)
+        with self.subTest(msg='Testing timestamp - other formats use strptime'):
+            assert convert_timestamp('04/08/2022 10:01', '%d/%m/%Y %H:%M', '%Y%m%d%H%M') == '202208041001'
+
+    def test_columnar_backend(self):
+        path = self.write_csv('interleaved.csv', ['ID,Description,Value,Timestamp',
+                                                  '1,Temperature,2.1,2022-08-04 10:01:01',
+                                                  '2,Pressure,20.1,2022-08-04 10:01:01',
+                                                  '',
+                                                  '3,Temperature,-2.3,2022-08-04 10:01:02'])
+        for source in [INPUT_PATH, path]:
+            with self.subTest(msg=f'Testing columnar backend - same output as rows backend, {source}'):
+                assert csv_data_reader(source, backend='columnar') == csv_data_reader(source)
+                assert columnar_reader.columnar_data_reader(source, chunk_size=64, use_numpy=False) == \
+                    csv_data_reader(source)
+        with self.subTest(msg='Testing columnar backend - IDs out of 64 bit range'):
+            path = self.write_csv('big_ids.csv', ['ID,Description,Value,Timestamp',
+                                                  '1,Temperature,2.1,2022-08-04 10:01:01',
+                                                  f'{2 ** 63},Pressure,20.1,2022-08-04 10:01:01',
+                                                  f'{-2 ** 70},Temperature,-2.3,2022-08-04 10:01:02'])
+            assert csv_data_reader(path)['Pressure']['Values'][0]['ID'] == 2 ** 63
+            assert csv_data_reader(path, backend='columnar') == csv_data_reader(path)
+            assert columnar_reader.columnar_data_reader(path, chunk_size=64, use_numpy=False) == \
+                csv_data_reader(path)
+        with self.subTest(msg='Testing columnar backend - invalid data'):
+            invalid = self.write_csv('invalid.csv', ['ID,Description,Value,Timestamp',
+                                                     '1,Temperature,2.1,2022-08-04 10:01:01',
+                                                     '2,Temperature,abc,2022-08-04 10:01:02'])
+            with self.assertLogs(level='ERROR') as logs:
+                assert csv_data_reader(invalid, backend='columnar') is None
+            assert 'row "2", field "Value"' in logs.output[0]
+
+    def test_parallel_parser(self):
+        with self.subTest(msg='Testing shards - aligned on lines'):
+            shards = split_shards(INPUT_PATH, shard_size=100)
+            assert len(shards) > 1
+            with open(INPUT_PATH, 'rb') as f:
+                data = f.read()
+            assert all(data[end - 1:end] == b'\n' for _, end in shards[:-1])
+            assert shards[-1][1] == len(data)
+
+        with self.subTest(msg='Testing parallel parser - same output as csv_data_reader'):
+            grouped_data, reports = parse_files([INPUT_PATH], workers=2, shard_size=100)
+            assert grouped_data == csv_data_reader(INPUT_PATH)
+            assert sum(report.rows for report in reports) == 16
+            assert all(report.error is None for report in reports)
+
+        with self.subTest(msg='Testing parallel parser - invalid shard reported'):
+            invalid = self.write_csv('invalid.csv', ['ID,Description,Value,Timestamp',
+                                                     '1,Humidity,2.1,2022-08-04 10:01:01',
+                                                     'a,Humidity,2.3,2022-08-04 10:01:02'])
+            undecodable = self.temp_path('undecodable.csv')
+            with open(undecodable, 'wb') as f:
+                f.write(b'ID,Description,Value,Timestamp\n1,Humidity\xff,2.1,2022-08-04 10:01:01\n')
+            grouped_data, reports = parse_files([INPUT_PATH, invalid, undecodable, self.temp_path('missing.csv')])
+            assert grouped_data == csv_data_reader(INPUT_PATH)
+            assert [report.path for report in reports if report.error] == [invalid, undecodable,
+                                                                           self.temp_path('missing.csv')]
+            assert [report.error for report in reports if report.path == undecodable][0].startswith('Invalid encoding')
+
+    def test_compact_json(self):
+        output_path = self.temp_path('output.json')
+        json_writer(output_path, csv_data_reader(INPUT_PATH), compact=True)
+        with open(output_path) as f:
+            assert json.load(f) == csv_data_reader(INPUT_PATH)
+
+    def test_binary_format(self):
+        grouped_data = csv_data_reader(INPUT_PATH)
+        output_path = self.temp_path('output.bin')
+        with self.subTest(msg='Testing binary writer - file size'):
+            assert binary_writer(output_path, grouped_data) == os.path.getsize(output_path)
+        with BinaryDataReader(output_path) as reader:
+            with self.subTest(msg='Testing binary reader - groups'):
+                assert reader.descriptions() == ['Temperature', 'Pressure']
+                assert reader.count('Pressure') == 8
+            with self.subTest(msg='Testing binary reader - single group'):
+                assert reader.group('Pressure') == grouped_data['Pressure']['Values']
+            with self.subTest(msg='Testing binary reader - whole file'):
+                assert reader.to_dict() == grouped_data
+
+    def test_running_stats(self):
+        values = [2.1, -3.5, 0.0, 7.25, 1.0, 4.5]
+        stats, first, second = RunningStats(), RunningStats(), RunningStats()
+        for index, value in enumerate(values):
+            stats.add(value)
+            (first if index % 2 else second).add(value)
+        first.merge(second)
+        for result in [stats, first]:
+            with self.subTest(msg='Testing running stats - values equal to statistics module'):
+                assert result.count == 6 and result.min == -3.5 and result.max == 7.25
+                self.assertAlmostEqual(result.mean, statistics.mean(values))
+                self.assertAlmostEqual(result.variance, statistics.pvariance(values))
+
+    def test_quantile_sketch(self):
+        values = [float(value) for value in range(-500, 1500)]
+        sketch, merged = QuantileSketch(0.01), QuantileSketch(0.01)
+        for value in values:
+            sketch.add(value)
+        for part in [values[:700], values[700:]]:
+            partial = QuantileSketch(0.01)
+            for value in part:
+                partial.add(value)
+            merged.merge(partial)
+        with self.subTest(msg='Testing quantile sketch - non-finite values rejected'):
+            for value in [math.inf, -math.inf, math.nan]:
+                self.assertRaises(ValueError, sketch.add, value)
+            assert sketch.count == len(values)
+        for q in [0.0, 0.1, 0.5, 0.9, 0.99, 1.0]:
+            expected = values[int(q * (len(values) - 1))]
+            for result in [sketch, merged]:
+                with self.subTest(msg=f'Testing quantile sketch - quantile {q}'):
+                    assert abs(result.quantile(q) - expected) <= abs(expected) * 0.01 + 1e-9
+
+    def test_aggregation(self):
+        with self.subTest(msg='Testing aggregation - whole groups'):
+            results = aggregate_file(INPUT_PATH).results()
+            assert [group['Count'] for group in results['Temperature']] == [8]
+            assert results['Pressure'][0]['Max'] == 40.2
+        with self.subTest(msg='Testing aggregation - windows'):
+            results = aggregate_file(INPUT_PATH, window_seconds=5).results()
+            assert [(group['Window'], group['Count']) for group in results['Pressure']] == \
+                [('04-08-2022 10:01:05', 5), ('04-08-2022 10:01:10', 3)]
+        with self.subTest(msg='Testing aggregation - non-finite values counted separately'):
+            path = self.write_csv('non_finite.csv', ['ID,Description,Value,Timestamp',
+                                                    '1,Humidity,2.0,2022-08-04 10:01:01',
+                                                    '2,Humidity,inf,2022-08-04 10:01:02',
+                                                    '3,Humidity,nan,2022-08-04 10:01:03',
+                                                    '4,Humidity,4.0,2022-08-04 10:01:04'])
+            summary = aggregate_file(path).results()['Humidity'][0]
+            assert (summary['Count'], summary['NonFinite'], summary['Max'], summary['Mean']) == (2, 2, 4.0, 3.0)
+        with self.subTest(msg='Testing aggregation - merged shards equal to single pass'):
+            aggregator, reports = aggregate_files(INPUT_PATH, window_seconds=5, workers=2, shard_size=100)
+            assert len(reports) > 1
+            expected = SensorAggregator(5).update_groups(csv_data_reader(INPUT_PATH)).results()
+            merged = aggregator.results()
+            assert merged.keys() == expected.keys()
+            for description in expected:
+                assert len(merged[description]) == len(expected[description])
+                for merged_group, expected_group in zip(merged[description], expected[description]):
+                    self.assertAlmostEqual(merged_group.pop('Mean'), expected_group.pop('Mean'))
+                    self.assertAlmostEqual(merged_group.pop('Variance'), expected_group.pop('Variance'))
+                    assert merged_group == expected_group
+
+    def test_instrumentation(self):
+        instrumentation.reset()
+        with self.subTest(msg='Testing instrumentation - nothing recorded when disabled'):
+            csv_data_reader(INPUT_PATH)
+            assert instrumentation.report() == {}
+        instrumentation.enable()
+        try:
+            data = csv_data_reader(INPUT_PATH)
+            csv_data_reader(INPUT_PATH, backend='columnar')
+            json_writer(self.temp_path('output.json'), data, compact=True)
+        finally:
+            instrumentation.disable()
+        report = instrumentation.report()
+        readings = sum(len(group['Values']) for group in data.values())
+        with self.subTest(msg='Testing instrumentation - calls, rows and bytes'):
+            assert report['parser.csv_data_reader']['Count'] == 2
+            assert report['parser.csv_data_reader']['Rows'] == 2 * readings
+            assert report['parser.csv_data_reader']['Bytes'] == 2 * os.path.getsize(INPUT_PATH)
+            assert report['parser.parse_rows']['Rows'] == readings
+            assert report['timestamp.convert']['Count'] == 2 * readings
+            assert report['parser.cast_column']['Rows'] == 2 * readings
+            assert report['parser.json_writer']['Bytes'] == os.path.getsize(self.temp_path('output.json'))
+            assert sum(report['parser.parse_rows']['Histogram'].values()) == 1
+        with self.subTest(msg='Testing instrumentation - Prometheus text'):
+            path = self.temp_path('metrics.prom')
+            instrumentation.write_report(path, 'parser')
+            with open(path) as f:
+                lines = f.read().splitlines()
+            assert 'parser_operation_seconds_bucket{operation="parser.csv_data_reader",le="+Inf"} 2' in lines
+            assert f'parser_operation_rows_total{{operation="parser.parse_rows"}} {readings}' in lines
+        instrumentation.reset()
+
+    def test_follow_reader(self):
+        with open(INPUT_PATH) as f:
+            lines = [line + '\n' for line in f.read().splitlines()]
+        path = self.temp_path('growing.csv')
+        output = self.temp_path('output.json')
+        with open(path, 'w') as f:
+            f.writelines(lines[:5])
+            f.write(lines[5][:10])      # line still being written
+        follower = SensorFollower(path, output_path=output)
+        with self.subTest(msg='Testing follow - complete lines only'):
+            assert follower.poll() == 4
+            assert follower.poll() == 0
+        with open(path, 'a') as f:
+            f.write(lines[5][10:])
+            f.writelines(lines[6:10])
+        with self.subTest(msg='Testing follow - appended lines'):
+            assert follower.poll() == 5
+        with open(path, 'a') as f:
+            f.writelines(lines[10:])
+        with self.subTest(msg='Testing follow - resumed from checkpoint'):
+            resumed = SensorFollower(path, output_path=output)
+            assert resumed.offset == follower.offset
+            assert resumed.poll() == len(lines) - 10
+            assert json.loads(json.dumps(resumed.data)) == json.loads(json.dumps(csv_data_reader(INPUT_PATH)))
+        with self.subTest(msg='Testing follow - invalid line skipped'):
+            with open(path, 'a') as f:
+                f.write('99,Pressure,not a number,2022-08-04 10:02:00\n' + lines[1])
+            assert resumed.poll() == 1 and resumed.skipped == 1
+        with self.subTest(msg='Testing follow - undecodable line skipped'):
+            with open(path, 'ab') as f:
+                f.write(b'99,Pressure,1.5,2022-08-04 10:02:00 \xff\n' + lines[1].encode())
+            assert resumed.poll() == 1 and resumed.skipped == 2
+            assert resumed.poll() == 0
+        with self.subTest(msg='Testing follow - output written on demand'):
+            resumed.write_output()
+            with open(output) as f:
+                assert f.read() == json.dumps(resumed.data, separators=(',', ':'))
+        with self.subTest(msg='Testing follow - truncated file read again'):
+            with open(path, 'w') as f:
+                f.writelines(lines[:3])
+            assert resumed.poll() == 2 and resumed.readings == 2
+        with self.subTest(msg='Testing follow - invalid header not checkpointed'):
+            path = self.write_csv('bad_header.csv', ['ID,Name,Value,Timestamp', '1,Pressure,1.5,2022-08-04 10:02:00'])
+            follower = SensorFollower(path)
+            with self.assertLogs(level='ERROR'):
+                self.assertRaises(ParserError, follower.poll)
+            assert follower.offset == 0 and follower.skipped == 0
+            assert not os.path.exists(path + '.checkpoint')
+
+    def test_parse_cache(self):
+        directory = self.temp_path('cache')
+        source = self.temp_path('input.csv')
+        with open(INPUT_PATH) as f, open(source, 'w') as copy:
+            copy.write(f.read())
+        expected = csv_data_reader(INPUT_PATH)
+        cache = ParseCache(directory)
+        with self.subTest(msg='Testing cache - miss, then memory hit'):
+            assert cache.load(source) == expected
+            assert csv_data_reader(source, cache=cache) == expected
+            assert (cache.stats.misses, cache.stats.memory_hits) == (1, 1)
+        with self.subTest(msg='Testing cache - disk hit in a new cache'):
+            other = ParseCache(directory)
+            assert other.load(INPUT_PATH) == expected   # same content under another path
+            assert (other.stats.misses, other.stats.disk_hits) == (0, 1)
+        with self.subTest(msg='Testing cache - changed file parsed again'):
+            with open(source, 'a') as copy:
+                copy.write('\n99,Pressure,1.5,2022-08-04 10:02:00\n')
+            assert len(cache.load(source)['Pressure']['Values']) == len(expected['Pressure']['Values']) + 1
+            assert cache.stats.misses == 2
+        with self.subTest(msg='Testing cache - eviction by size'):
+            with open(source, 'a') as copy:
+                copy.write('100,Pressure,1.5,2022-08-04 10:02:01\n')
+            largest = max(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+            small = ParseCache(directory, max_bytes=largest + 100, memory_bytes=0)
+            small.load(source)
+            assert len(os.listdir(directory)) == 1 and small.stats.evictions == 2
+            assert small.load(source) == cache.load(source) and small.stats.disk_hits == 1
+        with self.subTest(msg='Testing cache - private directory'):
+            assert os.stat(directory).st_mode & 0o777 == 0o700
+            assert not parse_cache.DEFAULT_DIRECTORY.startswith(tempfile.gettempdir())
+            shared = self.temp_path('shared')
+            os.mkdir(shared)
+            os.chmod(shared, 0o777)
+            with self.assertLogs(level='WARNING'):
+                unsafe = ParseCache(shared)
+            assert unsafe.directory is None and unsafe.load(source) == cache.load(source)
+            assert os.listdir(shared) == []
+        with self.subTest(msg='Testing cache - failures are not cached'):
+            assert cache.load(self.temp_path('missing.csv')) is None
+        with self.subTest(msg='Testing cache - file changed while parsed is not cached'):
+            def append_and_parse(path, backend):
+                with open(path, 'a') as copy:
+                    copy.write('101,Pressure,1.5,2022-08-04 10:02:02\n')
+                return csv_data_reader(path, backend)
+
+            original = self.temp_path('original.csv')
+            with open(source) as f, open(original, 'w') as copy:
+                copy.write(f.read())
+            fresh = ParseCache(None)
+            parse_cache.csv_data_reader = append_and_parse
+            try:
+                fresh.load(source)
+            finally:
+                parse_cache.csv_data_reader = csv_data_reader
+            assert fresh.load(original) == csv_data_reader(original)    # content hashed before the change
+            assert fresh.load(source) == csv_data_reader(source) and fresh.stats.misses == 3
+        with self.subTest(msg='Testing cache - timestamp formats are part of the key'):
+            default = cache.load(source)
+            misses = cache.stats.misses
+            zadanie_parser.output_time_format = '%Y/%m/%d %H:%M:%S'
+            try:
+                assert cache.load(source) == csv_data_reader(source) != default
+            finally:
+                zadanie_parser.output_time_format = '%d-%m-%Y %H:%M:%S'
+            assert cache.load(source) is default and cache.stats.misses == misses + 1
+
+    def test_time_index(self):
+        source = self.temp_path('input.csv')
+        with open(INPUT_PATH) as f, open(source, 'w') as copy:
+            copy.write(f.read())
+        index = open_index(source)
+        with self.subTest(msg='Testing time index - same readings as csv_data_reader'):
+            expected = TimeIndex.from_data(csv_data_reader(INPUT_PATH))
+            assert {description: series.readings() for description, series in index.series.items()} == \
+                {description: series.readings() for description, series in expected.series.items()}
+        with self.subTest(msg='Testing time index - range, count and latest'):
+            selected = index.range('Pressure', '04-08-2022 10:01:06', '04-08-2022 10:01:09')
+            assert list(selected.ids) == [10, 11, 12, 13]
+            assert index.count('Temperature', end='04-08-2022 10:01:02') == 2
+            assert list(index.latest('Pressure', 2).ids) == [15, 16]
+            assert list(index.latest('Pressure', 20, before='04-08-2022 10:01:06').ids) == [9, 10]
+            assert len(index.range('Pressure', '04-08-2022 11:00:00')) == 0
+        with self.subTest(msg='Testing time index - downsampling like aggregation windows'):
+            windows = index.downsample('Pressure', 5)
+            assert [(window['Window'], window['Count'], window['Max']) for window in windows] == \
+                [('04-08-2022 10:01:05', 5, 40.2), ('04-08-2022 10:01:10', 3, 30.3)]
+        with self.subTest(msg='Testing time index - persisted next to the source'):
+            assert os.path.exists(source + '.tidx')
+            loaded = open_index(source)
+            assert list(loaded.series['Temperature'].values) == list(index.series['Temperature'].values)
+        with self.subTest(msg='Testing time index - rebuilt after the source changed'):
+            with open(source, 'a') as copy:
+                copy.write('\n17,Humidity,55.0,2022-08-04 09:00:00\n')
+            assert open_index(source).count('Humidity') == 1
+
+    def test_readers_validation(self):
+        header = 'ID,Description,Value,Timestamp'
+        row = '1,Pressure,1.5,2022-08-04 10:00:00'
+        cases = {'valid': ([header, row], True),
+                 'blank lines': ([header, '', row, ''], True),
+                 'header only': ([header], True),
+                 'reordered columns': (['Timestamp,Value,Description,ID', '2022-08-04 10:00:00,1.5,Pressure,1'], True),
+                 'extra column': ([header + ',Unit', row + ',hPa'], True),
+                 'empty file': ([''], False),
+                 'missing column': (['ID,Description,Value'], False),
+                 'duplicate column': ([header + ',ID', row + ',1'], False),
+                 'invalid column name': ([header + ',class', row + ',x'], False),
+                 'invalid value': ([header, '1,Pressure,abc,2022-08-04 10:00:00'], False),
+                 'invalid ID': ([header, 'x,Pressure,1.5,2022-08-04 10:00:00'], False),
+                 'invalid timestamp': ([header, '1,Pressure,1.5,2022-13-04 10:00:00'], False),
+                 'missing field': ([header, '1,Pressure,1.5'], False),
+                 'additional field': ([header, row + ',9'], False)}
+        for name, (lines, valid) in cases.items():
+            path = self.write_csv(name.replace(' ', '_') + '.csv', lines)
+            with self.subTest(msg=f'Testing readers - same validation, {name}'):
+                with self.assertLogs(level='ERROR') if not valid else contextlib.nullcontext():
+                    for backend in ('rows', 'columnar'):
+                        assert (csv_data_reader(path, backend) is not None) == valid
+                    try:
+                        index = TimeIndex.from_csv(path)
+                    except ParserError:
+                        index = None
+                assert (index is not None) == valid
+                if valid:
+                    assert {description: series.readings() for description, series in index.series.items()} == \
+                        {description: series.readings()
+                         for description, series in TimeIndex.from_data(csv_data_reader(path)).series.items()}
@@ -0,0 +1,233 @@
+import argparse
+import csv
+import json
+import logging
+import os
+import time
+from collections import defaultdict
+
+from zadanie_parser import ParserError, _column_positions, _parse_csv_rows, json_writer
+
+
+class SensorFollower:
+    """
+    Follows a sensor csv file which keeps growing, parsing only lines appended since the last poll
+
+    The byte offset, the header and the number of consumed rows are stored in a checkpoint file,
+    so a restarted follower continues where the previous one stopped. Only complete lines are
+    consumed, a line being written is left for the next poll. A file which got shorter or was
+    replaced is read again from the beginning.
+
+    Readings are grouped by description like in csv_data_reader. With an output path every poll
+    appends only its new readings to a spool file (output_path + '.readings', one JSON line per
+    reading) whose length is stored in the checkpoint, and the spool is loaded back on restart.
+    The grouped data is written with json_writer by write_output, at most every output_interval
+    seconds from poll, because writing it costs time proportional to all readings.
+    """
+
+    def __init__(self, path: str, checkpoint_path: str = None, output_path: str = None,
+                 output_interval: float = 10.0):
+        """
+        :param path: path to followed csv file
+        :param checkpoint_path: path to checkpoint file, path + '.checkpoint' by default
+        :param output_path: JSON file with grouped readings, nothing is written by default
+        :param output_interval: minimum seconds between writes of the output from poll,
+            None writes it only when write_output is called
+        """
+        self.path = path
+        self.checkpoint_path = checkpoint_path or path + '.checkpoint'
+        self.output_path = output_path
+        self.spool_path = output_path + '.readings' if output_path else None
+        self.output_interval = output_interval
+        self.skipped = 0    # invalid lines logged and left out
+        self.__written = time.monotonic()   # last write of the output
+        self.__reset()
+        self.__load()
+
+    @property
+    def data(self) -> dict:
+        """Readings grouped by description, the same structure as returned by csv_data_reader"""
+        return self.__data
+
+    @property
+    def offset(self) -> int:
+        """Number of consumed bytes of the file"""
+        return self.__offset
+
+    @property
+    def readings(self) -> int:
+        """Number of readings consumed so far"""
+        return self.__readings
+
+    def __reset(self):
+        self.__offset = 0
+        self.__header = None
+        self.__rows = 0         # data rows consumed, used as row numbers in error messages
+        self.__readings = 0
+        self.__inode = None
+        self.__spool = 0        # bytes of the spool file covered by the checkpoint
+        self.__data = defaultdict(lambda: {'Values': []})
+
+    def __load(self):
+        """Restores the checkpoint and the grouped data, anything inconsistent starts over"""
+        try:
+            with open(self.checkpoint_path, encoding='utf-8') as f:
+                checkpoint = json.load(f)
+            if self.spool_path:
+                with open(self.spool_path, 'rb') as f:
+                    spooled = f.read(checkpoint['Spool'])
+                readings = 0
+                for line in spooled.splitlines():
+                    description, reading = json.loads(line)
+                    self.__data[description]['Values'].append(reading)
+                    readings += 1
+                if readings != checkpoint['Readings']:
+                    raise ValueError('Spooled readings do not match the checkpoint')
+                self.__spool = checkpoint['Spool']
+            self.__offset = checkpoint['Offset']
+            self.__header = checkpoint['Header']
+            self.__rows = checkpoint['Rows']
+            self.__readings = checkpoint['Readings']
+            self.__inode = checkpoint['Inode']
+        except FileNotFoundError:
+            self.__reset()
+        except (ValueError, KeyError, TypeError) as e:
+            logging.warning(f'Checkpoint {self.checkpoint_path} not used, file is read from the beginning: {e}')
+            self.__reset()
+
+    def __save(self, readings: list):
+        """
+        Appends new readings to the spool and writes the checkpoint atomically. The spool is written
+        first and cut back to the checkpointed length, so readings of an interrupted poll are dropped.
+        """
+        if self.spool_path:
+            with open(self.spool_path, 'ab') as f:
+                f.truncate(self.__spool)
+                f.write(''.join(json.dumps([description, reading]) + '\n'
+                                for description, reading in readings).encode('utf-8'))
+                self.__spool = f.tell()
+        temp_path = self.checkpoint_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'Offset': self.__offset, 'Header': self.__header, 'Rows': self.__rows,
+                       'Readings': self.__readings, 'Inode': self.__inode, 'Spool': self.__spool}, f)
+        os.replace(temp_path, self.checkpoint_path)
+
+    def write_output(self):
+        """Writes all readings grouped by description to the output path with json_writer"""
+        if self.output_path:
+            json_writer(self.output_path, self.__data, compact=True)
+        self.__written = time.monotonic()
+
+    def poll(self) -> int:
+        """
+        Parses lines appended since the last call
+
+        :return: number of new readings, raises ParserError when the file or its header cannot be read
+        """
+        try:
+            stat = os.stat(self.path)
+        except OSError as e:
+            logging.error(f'Unable to access file: {e}')
+            raise ParserError(f'Unable to access file: {self.path}')
+        if stat.st_size < self.__offset or (self.__inode is not None and stat.st_ino != self.__inode):
+            logging.warning(f'{self.path} was truncated or replaced, reading it from the beginning')
+            self.__reset()
+        self.__inode = stat.st_ino
+        if stat.st_size == self.__offset:
+            return 0
+
+        with open(self.path, 'rb') as f:
+            f.seek(self.__offset)
+            chunk = f.read(stat.st_size - self.__offset)
+        end = chunk.rfind(b'\n') + 1
+        if not end:
+            return 0    # no complete line yet
+        try:
+            lines = chunk[:end].decode('utf-8').split('\n')[:-1]
+        except UnicodeDecodeError:
+            lines = [self.__decode(line) for line in chunk[:end].split(b'\n')[:-1]]
+
+        header = self.__header
+        if header is None:
+            if lines[0] is None:
+                logging.error('Header skipped, invalid encoding')
+                raise ParserError('CSV headers have incorrect keys')
+            header, lines = next(csv.reader(lines[:1]), None), lines[1:]
+            _column_positions(header)   # an invalid header raises before anything is checkpointed
+        readings = self.__parse(lines, header)
+
+        for description, reading in readings:
+            self.__data[description]['Values'].append(reading)
+        self.__header = header
+        self.__offset += end
+        self.__rows += len(lines)
+        self.__readings += len(readings)
+        self.__save(readings)
+        if self.output_interval is not None and time.monotonic() - self.__written >= self.output_interval:
+            self.write_output()
+        return len(readings)
+
+    @staticmethod
+    def __decode(line: bytes):
+        """Decodes a single line, None when it is not valid utf-8"""
+        try:
+            return line.decode('utf-8')
+        except UnicodeDecodeError:
+            return None
+
+    def __parse(self, lines, header) -> list:
+        """Parses complete lines, when a line is invalid the lines are parsed one by one skipping invalid ones"""
+        if None not in lines:
+            try:
+                return list(_parse_csv_rows(lines, header, self.__rows + 1))
+            except ParserError:
+                pass    # the header is valid, so an invalid line failed
+        readings = []
+        for index, line in enumerate(lines, self.__rows + 1):
+            if line is None:
+                logging.error(f'Line "{index}" skipped, invalid encoding')
+                self.skipped += 1
+                continue
+            try:
+                readings.extend(_parse_csv_rows([line], header, index))
+            except ParserError:
+                logging.error(f'Line "{index}" skipped')
+                self.skipped += 1
+        return readings
+
+    def follow(self, interval: float = 1.0, polls: int = None):
+        """
+        Polls the file every interval seconds
+
+        :param interval: seconds between polls
+        :param polls: number of polls, endless by default
+        :return: generator of numbers of new readings per poll
+        """
+        done = 0
+        while polls is None or done < polls:
+            yield self.poll()
+            done += 1
+            if polls is None or done < polls:
+                time.sleep(interval)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Follows a growing sensor csv file')
+    parser.add_argument('path', nargs='?', default='input_data.csv', help='followed csv file')
+    parser.add_argument('--output', default='json_output.json', help='JSON file with grouped readings')
+    parser.add_argument('--checkpoint', default=None, help='checkpoint file, path + .checkpoint by default')
+    parser.add_argument('--interval', type=float, default=1.0, help='seconds between polls')
+    parser.add_argument('--output-interval', type=float, default=10.0,
+                        help='minimum seconds between writes of the JSON output')
+    parser.add_argument('--once', action='store_true', help='consume appended lines and exit')
+    args = parser.parse_args()
+
+    follower = SensorFollower(args.path, args.checkpoint, args.output, args.output_interval)
+    try:
+        for new_readings in follower.follow(args.interval, 1 if args.once else None):
+            if new_readings:
+                print(f'{new_readings} new readings, {follower.readings} in total')
+    except KeyboardInterrupt:
+        pass
+    finally:
+        follower.write_output()
@@ -0,0 +1,149 @@
+import argparse
+import csv
+import glob
+import io
+import os
+from collections import namedtuple, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+from zadanie_parser import ParserError, _parse_csv_rows, json_writer
+
+# Result of parsing a single byte range of a file, error is None for successfully parsed shards.
+# Row numbers in error messages are counted from the start of the shard.
+ShardReport = namedtuple('ShardReport', 'path start end rows error')
+
+DEFAULT_SHARD_SIZE = 64 * 1024 * 1024
+
+
+def expand_sources(sources) -> list:
+    """
+    Expands glob patterns into a list of file paths.
+
+    :param sources: path, glob pattern or list of them
+    :return: list of paths, sorted within each pattern, duplicates removed
+    """
+    if isinstance(sources, (str, os.PathLike)):
+        sources = [sources]
+    paths = []
+    for source in sources:
+        matches = sorted(glob.glob(os.fspath(source))) or [os.fspath(source)]
+        paths.extend(match for match in matches if match not in paths)
+    return paths
+
+
+def split_shards(path: str, shard_size: int = DEFAULT_SHARD_SIZE) -> list:
+    """
+    Splits data part of a csv file into byte ranges aligned on line ends.
+
+    Quoted values spanning several lines are not supported.
+
+    :param path: path to csv file
+    :param shard_size: approximate number of bytes in one shard
+    :return: list of (start, end) byte offsets, header line excluded
+    """
+    if shard_size <= 0:
+        raise ValueError('Shard size must be greater than 0!')
+
+    with open(path, 'rb') as f:
+        f.readline()    # header
+        start = f.tell()
+        size = os.fstat(f.fileno()).st_size
+        shards = []
+        while start < size:
+            f.seek(min(start + shard_size, size))
+            f.readline()    # move to the end of the current line
+            end = min(f.tell(), size)
+            shards.append((start, end))
+            start = end
+    return shards
+
+
+def parse_shard(path: str, start: int, end: int):
+    """
+    Parses a byte range of a csv file, using the header from its first line.
+
+    :param path: path to csv file
+    :param start: offset of the first line of the range
+    :param end: offset just after the last line of the range
+    :return: (dict of description -> list of readings, ShardReport)
+    """
+    groups = {}
+    rows = 0
+    try:
+        with open(path, 'rb') as f:
+            header = next(csv.reader(_decode_lines(f.readline())), None)
+            f.seek(start)
+            data = _decode_lines(f.read(end - start))
+        if not header:
+            raise ParserError('CSV headers have incorrect keys')
+        for description, reading in _parse_csv_rows(data, fieldnames=header):
+            groups.setdefault(description, []).append(reading)
+            rows += 1
+    except ParserError as e:
+        return {}, ShardReport(path, start, end, rows, e.msg)
+    except UnicodeDecodeError as e:
+        return {}, ShardReport(path, start, end, rows, f'Invalid encoding: {e}')
+    except OSError as e:
+        return {}, ShardReport(path, start, end, rows, f'Unable to access file: {e}')
+
+    return groups, ShardReport(path, start, end, rows, None)
+
+
+def _decode_lines(data: bytes):
+    """Wraps raw bytes into text stream decoded like a file opened by csv_data_reader"""
+    return io.TextIOWrapper(io.BytesIO(data), newline='')
+
+
+def parse_files(sources, workers: int = None, shard_size: int = DEFAULT_SHARD_SIZE):
+    """
+    Parses many csv files in a process pool, splitting large files into shards.
+
+    Groups are merged in the order of files and shards, so the result does not depend on the
+    number of workers. Readings from a shard which failed to parse are skipped and the problem
+    is recorded in its report instead of aborting the other shards.
+
+    :param sources: path, glob pattern or list of them
+    :param workers: number of worker processes, defaults to number of CPUs
+    :param shard_size: approximate number of bytes parsed by one worker task
+    :return: (dictionary in csv_data_reader format, list of ShardReport)
+    """
+    shards = []     # (path, start, end) tasks and reports of inaccessible files, in order of sources
+    for path in expand_sources(sources):
+        try:
+            shards.extend((path, start, end) for start, end in split_shards(path, shard_size))
+        except OSError as e:
+            shards.append(ShardReport(path, 0, 0, 0, f'Unable to access file: {e}'))
+    tasks = [shard for shard in shards if not isinstance(shard, ShardReport)]
+
+    output_dict = defaultdict(lambda: {'Values': []})  # Default output dict structure
+    reports = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(parse_shard, *zip(*tasks)) if tasks else iter(())
+        for shard in shards:
+            if isinstance(shard, ShardReport):
+                reports.append(shard)
+                continue
+            groups, report = next(results)
+            for description, readings in groups.items():
+                output_dict[description]['Values'].extend(readings)
+            reports.append(report)
+
+    return output_dict, reports
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Parse sensor csv files in parallel')
+    parser.add_argument('sources', nargs='+', help='csv files or glob patterns')
+    parser.add_argument('--output', default='json_output.json', help='output JSON file')
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes')
+    parser.add_argument('--shard-size', type=int, default=DEFAULT_SHARD_SIZE, help='shard size in bytes')
+    args = parser.parse_args()
+
+    grouped_data, shard_reports = parse_files(args.sources, args.workers, args.shard_size)
+    for shard_report in shard_reports:
+        if shard_report.error:
+            print(f'{shard_report.path} [{shard_report.start}:{shard_report.end}] failed: {shard_report.error}')
+
+    if grouped_data:
+        print('Success! Converting data to JSON...')
+        json_writer(args.output, grouped_data)
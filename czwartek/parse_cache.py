@@ -0,0 +1,260 @@
+import hashlib
+import logging
+import os
+import pickle
+import stat
+import threading
+import time
+from collections import OrderedDict
+
+import zadanie_parser
+from zadanie_parser import csv_data_reader
+
+CACHE_VERSION = 1   # part of every key, bump when the structure of parsed data changes
+# per user, a shared directory would let other users plant pickles
+DEFAULT_DIRECTORY = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'),
+                                 'sensor_parse_cache')
+
+
+class CacheStats:
+    """Hit and miss counters of a ParseCache"""
+
+    def __init__(self):
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.load_seconds = 0.0     # spent on hits
+        self.parse_seconds = 0.0    # spent on misses
+
+    @property
+    def hits(self):
+        return self.memory_hits + self.disk_hits
+
+    def __str__(self):
+        mean_load = self.load_seconds / self.hits if self.hits else 0.0
+        mean_parse = self.parse_seconds / self.misses if self.misses else 0.0
+        return (f'{self.hits} hits ({self.memory_hits} memory, {self.disk_hits} disk), {self.misses} misses, '
+                f'{self.evictions} evictions, mean load {mean_load * 1000:.1f} ms, '
+                f'mean parse {mean_parse * 1000:.1f} ms')
+
+
+class ParseCache:
+    """
+    Cache of csv_data_reader results keyed by the content of the parsed file
+
+    Results are kept in memory and pickled to the cache directory, both limited by total size with
+    least recently used entries evicted first. A key is the hash of the file content, the reader
+    backend and the timestamp formats, so a changed file is parsed again and copies of a file share
+    one entry. The hash of a path is remembered together with its size and modification time, so an
+    unchanged file is not read to find its key. A result is not cached when the size or modification
+    time of the file changed while it was hashed and parsed.
+
+    Cached results are shared between callers and should be treated as read-only. Loading a pickle
+    may run code, so the directory is created with mode 0o700 and a directory which is not owned by
+    the current user or is accessible by other users is not used, results are then kept in memory.
+    """
+
+    def __init__(self, directory: str = DEFAULT_DIRECTORY, max_bytes: int = 1 << 30, memory_bytes: int = 1 << 28):
+        """
+        :param directory: directory of cached results, None keeps them in memory only
+            (per user by default)
+        :param max_bytes: total size of cached files in the directory
+        :param memory_bytes: total size of results kept in memory, measured as their pickled size
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.memory_bytes = memory_bytes
+        self.stats = CacheStats()
+        self.__memory = OrderedDict()   # key -> (result, size), least recently used first
+        self.__memory_size = 0
+        self.__digests = {}             # path -> (size, mtime, content hash)
+        self.__lock = threading.Lock()
+        if directory and not self.__private(directory):
+            self.directory = None
+
+    @staticmethod
+    def __private(directory):
+        """Creates directory accessible by the current user only, False for a directory other users could change"""
+        try:
+            os.makedirs(directory, mode=0o700, exist_ok=True)
+            info = os.lstat(directory)
+        except OSError as e:
+            logging.warning(f'Cache directory {directory} not used: {e}')
+            return False
+        if not stat.S_ISDIR(info.st_mode):
+            logging.warning(f'Cache directory {directory} not used, it is not a directory')
+            return False
+        if hasattr(os, 'getuid') and (info.st_uid != os.getuid() or info.st_mode & 0o077):
+            logging.warning(f'Cache directory {directory} not used, it has to be owned by the current user '
+                            f'with mode 0o700')
+            return False
+        return True
+
+    def load(self, path: str, backend: str = 'rows') -> dict:
+        """
+        Returns parsed file from the cache, parses and stores it on a miss
+
+        :param path: path to source file with data
+        :param backend: csv_data_reader backend used on a miss
+        :return: dictionary or None in case of failure, failures are not cached
+        """
+        start = time.perf_counter()
+        try:
+            digest, signature = self.__digest(path)
+        except OSError:
+            return csv_data_reader(path, backend)   # logs and reports the failure
+        formats = hashlib.blake2b(f'{zadanie_parser.input_time_format}\n{zadanie_parser.output_time_format}'.encode(),
+                                  digest_size=4).hexdigest()
+        key = f'{digest}-{backend}-{formats}-v{CACHE_VERSION}'
+
+        result = self.__memory_get(key)
+        if result is not None:
+            self.stats.memory_hits += 1
+            self.stats.load_seconds += time.perf_counter() - start
+            return result
+        result = self.__disk_get(key)
+        if result is not None:
+            self.stats.disk_hits += 1
+            self.stats.load_seconds += time.perf_counter() - start
+            return result
+
+        result = csv_data_reader(path, backend)
+        self.stats.misses += 1
+        if result is not None and not self.__changed(path, signature):
+            result = dict(result)
+            blob = pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+            self.__memory_put(key, result, len(blob))
+            self.__disk_put(key, blob)
+        self.stats.parse_seconds += time.perf_counter() - start
+        return result
+
+    def clear(self):
+        """Removes all cached results from memory and from the directory"""
+        with self.__lock:
+            self.__memory.clear()
+            self.__memory_size = 0
+            self.__digests.clear()
+        for name, _, _ in self.__disk_entries():
+            self.__remove(name)
+
+    def __digest(self, path):
+        """
+        Hash of the file content, remembered for unchanged size and modification time
+
+        :return: (hash, (size, modification time)) with the size and time taken before reading the file
+        """
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        signature = (stat.st_size, stat.st_mtime_ns)
+        known = self.__digests.get(path)
+        if known and known[:2] == signature:
+            return known[2], signature
+        content_hash = hashlib.blake2b(digest_size=20)
+        with open(path, 'rb') as f:
+            while True:
+                chunk = f.read(1 << 20)
+                if not chunk:
+                    break
+                content_hash.update(chunk)
+        digest = content_hash.hexdigest()
+        self.__digests[path] = (*signature, digest)
+        return digest, signature
+
+    def __changed(self, path, signature):
+        """True when the file is not the one which was hashed, its remembered hash is then dropped"""
+        path = os.path.abspath(path)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            stat = None
+        if stat is not None and (stat.st_size, stat.st_mtime_ns) == signature:
+            return False
+        logging.warning(f'{path} changed while it was parsed, the result is not cached')
+        self.__digests.pop(path, None)
+        return True
+
+    def __memory_get(self, key):
+        with self.__lock:
+            entry = self.__memory.get(key)
+            if entry is None:
+                return None
+            self.__memory.move_to_end(key)
+            return entry[0]
+
+    def __memory_put(self, key, result, size):
+        if size > self.memory_bytes:
+            return
+        with self.__lock:
+            if key in self.__memory:
+                return
+            self.__memory[key] = (result, size)
+            self.__memory_size += size
+            while self.__memory_size > self.memory_bytes:
+                _, (_, evicted_size) = self.__memory.popitem(last=False)
+                self.__memory_size -= evicted_size
+                self.stats.evictions += 1
+
+    def __disk_get(self, key):
+        if not self.directory:
+            return None
+        path = os.path.join(self.directory, key + '.pickle')
+        try:
+            with open(path, 'rb') as f:
+                blob = f.read()
+            result = pickle.loads(blob)
+            os.utime(path)      # modification time orders entries for eviction
+        except FileNotFoundError:
+            return None
+        except (OSError, pickle.UnpicklingError, EOFError, ValueError) as e:
+            logging.warning(f'Cached result {path} not used: {e}')
+            self.__remove(key + '.pickle')
+            return None
+        self.__memory_put(key, result, len(blob))
+        return result
+
+    def __disk_put(self, key, blob):
+        if not self.directory or len(blob) > self.max_bytes:
+            return
+        path = os.path.join(self.directory, key + '.pickle')
+        temp_path = f'{path}.{os.getpid()}.tmp'
+        try:
+            with open(temp_path, 'wb') as f:
+                f.write(blob)
+            os.replace(temp_path, path)
+        except OSError as e:
+            logging.warning(f'Result not cached in {self.directory}: {e}')
+            return
+        self.__evict()
+
+    def __disk_entries(self):
+        """(file name, size, modification time) of cached files"""
+        if not self.directory:
+            return []
+        entries = []
+        with os.scandir(self.directory) as scan:
+            for entry in scan:
+                if entry.name.endswith('.pickle'):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:   # removed by another process
+                        continue
+                    entries.append((entry.name, stat.st_size, stat.st_mtime_ns))
+        return entries
+
+    def __evict(self):
+        """Removes least recently used files until the directory fits in max_bytes"""
+        entries = sorted(self.__disk_entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        for name, size, _ in entries:
+            if total <= self.max_bytes:
+                break
+            self.__remove(name)
+            total -= size
+            self.stats.evictions += 1
+
+    def __remove(self, name):
+        try:
+            os.remove(os.path.join(self.directory, name))
+        except FileNotFoundError:
+            pass
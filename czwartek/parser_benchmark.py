@@ -0,0 +1,346 @@
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import random
+import resource
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+import instrumentation
+from aggregation import aggregate_file
+from binary_format import BinaryDataReader, binary_writer
+from follow_reader import SensorFollower
+from parse_cache import ParseCache
+from time_index import open_index
+from parallel_parser import parse_files
+from timestamp_converter import ISO_FORMAT, OUTPUT_FORMAT, get_converter, slow_converter
+from zadanie_parser import csv_data_reader, csv_data_stream, json_stream_writer, json_writer
+
+DESCRIPTIONS = ('Temperature', 'Pressure', 'Humidity', 'Voltage')
+
+
+def generate_sensor_csv(path: str, rows: int, descriptions=DESCRIPTIONS, run_length: int = 100):
+    """
+    Writes a synthetic sensor csv file in the format of input_data.csv
+
+    :param path: path to output file
+    :param rows: number of readings
+    :param descriptions: sensor names, written in runs of consecutive rows
+    :param run_length: number of consecutive rows of a single sensor
+    """
+    rng = random.Random(rows)
+    start = datetime(2022, 8, 4, 10, 0, 0)
+    with open(path, 'w') as f:
+        f.write('ID,Description,Value,Timestamp\n')
+        chunk = []
+        for index in range(1, rows + 1):
+            description = descriptions[(index // run_length) % len(descriptions)]
+            timestamp = (start + timedelta(seconds=index)).strftime('%Y-%m-%d %H:%M:%S')
+            chunk.append(f'{index},{description},{rng.uniform(-20, 40):.1f},{timestamp}\n')
+            if len(chunk) == 100000:
+                f.write(''.join(chunk))
+                chunk = []
+        f.write(''.join(chunk))
+
+
+def _peak_rss_mb():
+    # ru_maxrss survives exec on Linux, so it would report the parent's peak in spawned workers
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _run_stream(source, output):
+    start = time.perf_counter()
+    json_stream_writer(output, csv_data_stream(source))
+    return time.perf_counter() - start, _peak_rss_mb()
+
+
+def _run_in_memory(source, output):
+    start = time.perf_counter()
+    csv_data_reader(source)
+    return time.perf_counter() - start, _peak_rss_mb()
+
+
+def measure(function, source, output):
+    """Runs function in a fresh process, returns (seconds, peak RSS in MB)"""
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+        return executor.submit(function, source, output).result()
+
+
+def bench_streaming_memory(rows: int, in_memory_limit: int):
+    """Compares peak memory of the streaming and in-memory readers on growing files"""
+    print(format(' Streaming memory ', '-^60'))
+    print('Rows'.ljust(12) + 'Mode'.ljust(12) + 'Seconds'.ljust(12) + 'Rows/s'.ljust(12) + 'Peak RSS [MB]')
+    with tempfile.TemporaryDirectory() as temp_dir:
+        output = os.path.join(temp_dir, 'output.json')
+        for size in sorted({max(rows // 100, 1), max(rows // 10, 1), rows}):
+            source = os.path.join(temp_dir, f'sensors_{size}.csv')
+            generate_sensor_csv(source, size)
+            modes = [('stream', _run_stream)]
+            if size <= in_memory_limit:
+                modes.append(('in-memory', _run_in_memory))
+            for mode, function in modes:
+                seconds, peak_rss = measure(function, source, output)
+                print(str(size).ljust(12) + mode.ljust(12) + f'{seconds:.2f}'.ljust(12) +
+                      f'{size / seconds:.0f}'.ljust(12) + f'{peak_rss:.1f}')
+            os.remove(source)
+
+
+def bench_timestamp_conversion(count: int = 1_000_000):
+    """Compares strptime/strftime conversion with the registered fast converter"""
+    print(format(' Timestamp conversion ', '-^60'))
+    start = datetime(2022, 8, 4, 10, 0, 0)
+    values = [(start + timedelta(seconds=index)).strftime(ISO_FORMAT) for index in range(count)]
+    for name, converter in [('strptime', slow_converter(ISO_FORMAT, OUTPUT_FORMAT)),
+                            ('fast', get_converter(ISO_FORMAT, OUTPUT_FORMAT))]:
+        begin = time.perf_counter()
+        for value in values:
+            converter(value)
+        seconds = time.perf_counter() - begin
+        print(name.ljust(12) + f'{seconds:.2f} s'.ljust(12) + f'{count / seconds:.0f} conversions/s')
+
+
+def bench_instrumentation(rows: int):
+    """Compares csv_data_reader without the decorator and with instrumentation disabled and enabled"""
+    print(format(' Instrumentation ', '-^60'))
+    with tempfile.TemporaryDirectory() as temp_dir:
+        source = os.path.join(temp_dir, 'sensors.csv')
+        generate_sensor_csv(source, rows)
+        for mode, reader in [('undecorated', csv_data_reader.__wrapped__),
+                             ('disabled', csv_data_reader),
+                             ('enabled', csv_data_reader)]:
+            if mode == 'enabled':
+                instrumentation.enable()
+            start = time.perf_counter()
+            reader(source)
+            seconds = time.perf_counter() - start
+            instrumentation.disable()
+            print(mode.ljust(12) + f'{seconds:.2f} s'.ljust(12) + f'{rows / seconds:.0f} rows/s')
+    instrumentation.reset()
+
+
+def bench_follow(rows: int, polls: int = 10, appended: int = 10000):
+    """Compares polling a growing file with the follower with parsing the whole file again"""
+    print(format(' Follow mode ', '-^60'))
+    with tempfile.TemporaryDirectory() as temp_dir:
+        source = os.path.join(temp_dir, 'sensors.csv')
+        chunk_path = os.path.join(temp_dir, 'chunk.csv')
+        generate_sensor_csv(chunk_path, appended)
+        with open(chunk_path) as f:
+            next(f)
+            chunk = f.read()
+
+        for output_path in (None, os.path.join(temp_dir, 'output.json')):
+            print(f'output={"yes" if output_path else "no"}')
+            generate_sensor_csv(source, rows)
+            follower = SensorFollower(source, os.path.join(temp_dir, 'checkpoint'), output_path,
+                                      output_interval=None)   # the output is timed separately
+            start, cpu = time.perf_counter(), time.process_time()
+            follower.poll()
+            print('initial'.ljust(16) + f'{time.perf_counter() - start:.2f} s'.ljust(12)
+                  + f'{time.process_time() - cpu:.2f} s CPU, {follower.readings} readings')
+
+            latencies, cpu_times = [], []
+            for _ in range(polls):
+                with open(source, 'a') as f:
+                    f.write(chunk)
+                start, cpu = time.perf_counter(), time.process_time()
+                follower.poll()
+                latencies.append(time.perf_counter() - start)
+                cpu_times.append(time.process_time() - cpu)
+            print(f'poll (+{appended})'.ljust(16) + f'{sum(latencies) / polls * 1000:.1f} ms'.ljust(12)
+                  + f'{sum(cpu_times) / polls * 1000:.1f} ms CPU per poll')
+
+            start = time.perf_counter()
+            follower.poll()
+            print('idle poll'.ljust(16) + f'{(time.perf_counter() - start) * 1e6:.0f} us')
+            if output_path:
+                start = time.perf_counter()
+                follower.write_output()
+                print('write output'.ljust(16) + f'{time.perf_counter() - start:.2f} s')
+            os.remove(os.path.join(temp_dir, 'checkpoint'))
+
+        start, cpu = time.perf_counter(), time.process_time()
+        csv_data_reader(source)
+        print('full reparse'.ljust(16) + f'{time.perf_counter() - start:.2f} s'.ljust(12)
+              + f'{time.process_time() - cpu:.2f} s CPU, {follower.readings} readings')
+
+
+def bench_parse_cache(rows: int):
+    """Compares a cold parse with loading the result from memory and from the disk cache"""
+    print(format(' Parse cache ', '-^60'))
+    with tempfile.TemporaryDirectory() as temp_dir:
+        source = os.path.join(temp_dir, 'sensors.csv')
+        generate_sensor_csv(source, rows)
+        directory = os.path.join(temp_dir, 'cache')
+        cache = ParseCache(directory)
+        for mode in ('cold parse', 'memory hit'):
+            start = time.perf_counter()
+            cache.load(source)
+            print(mode.ljust(16) + f'{time.perf_counter() - start:.3f} s')
+        fresh_cache = ParseCache(directory)     # like another job, the file is hashed again
+        start = time.perf_counter()
+        fresh_cache.load(source)
+        print('disk hit'.ljust(16) + f'{time.perf_counter() - start:.3f} s')
+        print(f'Cached {sum(entry.stat().st_size for entry in os.scandir(directory)) / 2 ** 20:.1f} MB, '
+              f'{cache.stats}')
+
+
+def bench_time_index(rows: int, queries: int = 1000):
+    """Measures building and loading the time index and latency of time queries"""
+    print(format(f' Time index, {rows} readings ', '-^60'))
+    with tempfile.TemporaryDirectory() as temp_dir:
+        source = os.path.join(temp_dir, 'sensors.csv')
+        generate_sensor_csv(source, rows)
+        start = time.perf_counter()
+        open_index(source)
+        print('build + save'.ljust(20) + f'{time.perf_counter() - start:.2f} s')
+        start = time.perf_counter()
+        index = open_index(source)
+        print('load'.ljust(20) + f'{time.perf_counter() - start:.2f} s, '
+              f'{os.path.getsize(source + ".tidx") / 2 ** 20:.0f} MB')
+
+        # generated readings are one second apart, starting at 2022-08-04 10:00:00
+        first = datetime(2022, 8, 4, 10, 0, 0) - datetime(1970, 1, 1)
+        first = int(first.total_seconds())
+        rng = random.Random(rows)
+        starts = [first + rng.randrange(max(rows - 3600, 1)) for _ in range(queries)]
+        descriptions = [rng.choice(DESCRIPTIONS) for _ in range(queries)]
+        for name, query in [('count (1 h)', lambda d, s: index.count(d, s, s + 3600)),
+                            ('range (1 h)', lambda d, s: index.range(d, s, s + 3600)),
+                            ('range as dicts', lambda d, s: index.range(d, s, s + 3600).readings()),
+                            ('latest 100', lambda d, s: index.latest(d, 100, before=s)),
+                            ('downsample 1 h/60 s', lambda d, s: index.downsample(d, 60, s, s + 3600))]:
+            start = time.perf_counter()
+            for description, query_start in zip(descriptions, starts):
+                query(description, query_start)
+            print(name.ljust(20) + f'{(time.perf_counter() - start) / queries * 1e6:.1f} us per query')
+
+
+def bench_backends(rows: int):
+    """Compares throughput of the row and columnar csv_data_reader backends"""
+    print(format(' Reader backends ', '-^60'))
+    with tempfile.TemporaryDirectory() as temp_dir:
+        source = os.path.join(temp_dir, 'sensors.csv')
+        generate_sensor_csv(source, rows)
+        results = {}
+        for backend in ('rows', 'columnar'):
+            start = time.perf_counter()
+            results[backend] = csv_data_reader(source, backend=backend)
+            seconds = time.perf_counter() - start
+            print(backend.ljust(12) + f'{seconds:.2f} s'.ljust(12) + f'{rows / seconds:.0f} rows/s')
+        print('Identical output: ' + str(results['rows'] == results['columnar']))
+
+
+def bench_parallel(rows: int, files: int = 8):
+    """Compares parsing many files one by one with the sharded process pool parser"""
+    print(format(' Parallel ingestion ', '-^60'))
+    with tempfile.TemporaryDirectory() as temp_dir:
+        paths = []
+        for index in range(files):
+            paths.append(os.path.join(temp_dir, f'sensors_{index}.csv'))
+            generate_sensor_csv(paths[-1], rows // files)
+
+        start = time.perf_counter()
+        for path in paths:
+            csv_data_reader(path)
+        seconds = time.perf_counter() - start
+        print('sequential'.ljust(12) + f'{seconds:.2f} s'.ljust(12) + f'{rows / seconds:.0f} rows/s')
+
+        start = time.perf_counter()
+        parse_files(os.path.join(temp_dir, '*.csv'), shard_size=4 * 1024 * 1024)
+        seconds = time.perf_counter() - start
+        print(f'pool ({os.cpu_count()})'.ljust(12) + f'{seconds:.2f} s'.ljust(12) + f'{rows / seconds:.0f} rows/s')
+
+
+def bench_output_formats(rows: int):
+    """Compares size, write and read time of the JSON and binary output formats"""
+    print(format(' Output formats ', '-^60'))
+    print('Format'.ljust(14) + 'Size [MB]'.ljust(12) + 'Write [s]'.ljust(12) + 'Read [s]'.ljust(12) + 'Group [s]')
+    with tempfile.TemporaryDirectory() as temp_dir:
+        source = os.path.join(temp_dir, 'sensors.csv')
+        generate_sensor_csv(source, rows)
+        grouped_data = csv_data_reader(source)
+        description = next(iter(grouped_data))
+
+        def read_legacy(path):
+            with open(path) as f:
+                document = json.loads(json.load(f))
+            return document[description]['Values']
+
+        def read_compact(path):
+            with open(path) as f:
+                return json.load(f)[description]['Values']
+
+        def read_binary(path):
+            with BinaryDataReader(path) as reader:
+                return reader.group(description)
+
+        def read_binary_all(path):
+            with BinaryDataReader(path) as reader:
+                return reader.to_dict()
+
+        formats = [('json legacy', lambda path: json_writer(path, grouped_data), read_legacy, read_legacy),
+                   ('json compact', lambda path: json_writer(path, grouped_data, compact=True),
+                    read_compact, read_compact),
+                   ('binary', lambda path: binary_writer(path, grouped_data), read_binary_all, read_binary)]
+        for name, writer, reader, group_reader in formats:
+            path = os.path.join(temp_dir, name.replace(' ', '_'))
+            start = time.perf_counter()
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                writer(path)
+            write_seconds = time.perf_counter() - start
+            start = time.perf_counter()
+            reader(path)
+            read_seconds = time.perf_counter() - start
+            start = time.perf_counter()
+            group_reader(path)
+            group_seconds = time.perf_counter() - start
+            print(name.ljust(14) + f'{os.path.getsize(path) / 2 ** 20:.1f}'.ljust(12) + f'{write_seconds:.2f}'.ljust(12)
+                  + f'{read_seconds:.2f}'.ljust(12) + f'{group_seconds:.2f}')
+
+
+def bench_aggregation(rows: int, window_seconds: int = 60):
+    """Measures throughput and peak memory of streaming aggregation"""
+    print(format(' Aggregation ', '-^60'))
+    with tempfile.TemporaryDirectory() as temp_dir:
+        source = os.path.join(temp_dir, 'sensors.csv')
+        generate_sensor_csv(source, rows)
+        seconds, peak_rss = measure(_run_aggregation, source, window_seconds)
+        print(f'window {window_seconds} s'.ljust(14) + f'{seconds:.2f} s'.ljust(12)
+              + f'{rows / seconds:.0f} rows/s'.ljust(18) + f'{peak_rss:.1f} MB')
+
+
+def _run_aggregation(source, window_seconds):
+    start = time.perf_counter()
+    aggregate_file(source, window_seconds).results()
+    return time.perf_counter() - start, _peak_rss_mb()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Sensor parser benchmarks')
+    parser.add_argument('--rows', type=int, default=10_000_000, help='number of rows in the largest file')
+    parser.add_argument('--in-memory-limit', type=int, default=1_000_000,
+                        help='largest file parsed with the in-memory reader for comparison')
+    args = parser.parse_args()
+
+    bench_timestamp_conversion()
+    bench_backends(min(args.rows, args.in_memory_limit))
+    bench_instrumentation(min(args.rows, args.in_memory_limit))
+    bench_follow(min(args.rows, args.in_memory_limit))
+    bench_parse_cache(min(args.rows, args.in_memory_limit))
+    bench_time_index(args.rows)
+    bench_parallel(min(args.rows, args.in_memory_limit))
+    bench_output_formats(min(args.rows, args.in_memory_limit))
+    bench_aggregation(min(args.rows, args.in_memory_limit))
+    bench_streaming_memory(args.rows, args.in_memory_limit)
@@ -0,0 +1,287 @@
+import csv
+import logging
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+
+from timestamp_converter import from_epoch, to_epoch
+from zadanie_parser import ParserError, _column_positions, fields_type, input_time_format
+
+MAGIC = b'STIX'
+VERSION = 1
+HEADER = struct.Struct('<4sHQQI')      # magic, version, source size, source mtime in ns, number of groups
+GROUP = struct.Struct('<HQ')           # length of description, number of readings
+INDEX_SUFFIX = '.tidx'
+
+
+class TimeSeries:
+    """Readings of a single description in parallel typed arrays, sorted by timestamp"""
+
+    __slots__ = ('epochs', 'values', 'ids')
+
+    def __init__(self, epochs=None, values=None, ids=None):
+        """
+        :param epochs: array of seconds since 1970-01-01 (UTC)
+        :param values: array of reading values
+        :param ids: array of reading IDs
+        """
+        self.epochs = array('q') if epochs is None else epochs
+        self.values = array('d') if values is None else values
+        self.ids = array('q') if ids is None else ids
+
+    def __len__(self):
+        return len(self.epochs)
+
+    def slice(self, start: int, end: int) -> 'TimeSeries':
+        """Readings at positions start to end, the arrays are copied"""
+        return TimeSeries(self.epochs[start:end], self.values[start:end], self.ids[start:end])
+
+    def sort(self):
+        """Sorts readings by timestamp, readings with equal timestamps keep their order"""
+        epochs = self.epochs
+        if all(epochs[index] <= epochs[index + 1] for index in range(len(epochs) - 1)):
+            return
+        order = sorted(range(len(epochs)), key=epochs.__getitem__)
+        self.epochs = array('q', map(epochs.__getitem__, order))
+        self.values = array('d', map(self.values.__getitem__, order))
+        self.ids = array('q', map(self.ids.__getitem__, order))
+
+    def readings(self) -> list:
+        """Readings as dicts in the format of csv_data_reader output"""
+        return [{'ID': item_id, 'Value': value, 'Timestamp': from_epoch(epoch)}
+                for item_id, value, epoch in zip(self.ids, self.values, self.epochs)]
+
+
+def _epoch(timestamp) -> int:
+    """Seconds since 1970-01-01 of epoch number or timestamp in the output format"""
+    return to_epoch(timestamp) if isinstance(timestamp, str) else int(timestamp)
+
+
+class TimeIndex:
+    """
+    Readings grouped by description and sorted by time, answering time queries with binary search
+
+    Timestamps are kept as seconds since 1970-01-01, so queries need no string parsing. Query
+    bounds are epoch seconds or timestamps in the output format ('dd-mm-YYYY HH:MM:SS').
+    """
+
+    def __init__(self, series: dict = None, source_stat=(0, 0)):
+        """
+        :param series: dict of description -> TimeSeries sorted by timestamp
+        :param source_stat: (size, modification time in ns) of the indexed file, used to detect changes
+        """
+        self.series = series if series is not None else {}
+        self.source_stat = source_stat
+
+    def __len__(self):
+        return sum(len(series) for series in self.series.values())
+
+    def descriptions(self) -> list:
+        return list(self.series)
+
+    @classmethod
+    def from_data(cls, data: dict) -> 'TimeIndex':
+        """
+        Builds index from grouped readings
+
+        :param data: output of csv_data_reader
+        :return: TimeIndex
+        """
+        index = cls()
+        for description, group in data.items():
+            readings = group['Values']
+            series = TimeSeries(array('q', (to_epoch(reading['Timestamp']) for reading in readings)),
+                                array('d', (reading['Value'] for reading in readings)),
+                                array('q', (reading['ID'] for reading in readings)))
+            series.sort()
+            index.series[description] = series
+        return index
+
+    @classmethod
+    def from_csv(cls, path: str, chunk_size: int = 1 << 22) -> 'TimeIndex':
+        """
+        Builds index from a sensor csv file, reading it in chunks of lines
+
+        Timestamps are converted straight to epoch seconds. The header and the number of fields
+        are checked like in csv_data_reader, so both accept and reject the same files. Quoted
+        values spanning several lines are not supported.
+
+        :param path: path to source file with data
+        :param chunk_size: approximate number of bytes read at once
+        :return: TimeIndex, raises ParserError on failure
+        """
+        groups = {}     # description -> TimeSeries
+        try:
+            stat = os.stat(path)
+            with open(path, newline='') as f:
+                header = next(csv.reader([f.readline()]), None)
+                id_position, description_position, value_position, timestamp_position = _column_positions(header)
+
+                index = 0
+                while True:
+                    lines = f.readlines(chunk_size)
+                    if not lines:
+                        break
+                    for index, row in enumerate(csv.reader(lines), index + 1):
+                        if not row:
+                            continue
+                        if len(row) != len(header):
+                            logging.error(f'Row "{index}" does not have {len(header)} fields')
+                            raise ParserError(f'Invalid number of fields in row "{index}"')
+                        try:
+                            series = groups.get(row[description_position])
+                            if series is None:
+                                series = groups[row[description_position]] = TimeSeries()
+                            series.epochs.append(to_epoch(row[timestamp_position], input_time_format))
+                            series.values.append(fields_type['Value'](row[value_position]))
+                            series.ids.append(fields_type['ID'](row[id_position]))
+                        except (ValueError, TypeError, IndexError, OverflowError) as e:
+                            logging.error(f'Conversion error in row "{index}": {e}')
+                            raise ParserError(f'Conversion error in row "{index}"')
+        except (FileNotFoundError, PermissionError) as e:
+            logging.error(f'Unable to access file: {e}')
+            raise ParserError(f'Unable to access file: {path}')
+
+        for series in groups.values():
+            series.sort()
+        return cls(groups, (stat.st_size, stat.st_mtime_ns))
+
+    def __series(self, description):
+        series = self.series.get(description)
+        if series is None:
+            raise KeyError(description)
+        return series
+
+    def __bounds(self, series, start, end):
+        """Positions of the first reading at or after start and after the last one at or before end"""
+        first = 0 if start is None else bisect_left(series.epochs, _epoch(start))
+        last = len(series) if end is None else bisect_right(series.epochs, _epoch(end))
+        return first, max(first, last)
+
+    def range(self, description: str, start=None, end=None) -> TimeSeries:
+        """
+        Readings with start <= timestamp <= end
+
+        :param description: sensor description, raises KeyError when unknown
+        :param start: epoch seconds or timestamp string, no lower bound by default
+        :param end: epoch seconds or timestamp string, no upper bound by default
+        :return: TimeSeries sorted by timestamp
+        """
+        series = self.__series(description)
+        return series.slice(*self.__bounds(series, start, end))
+
+    def count(self, description: str, start=None, end=None) -> int:
+        """Number of readings with start <= timestamp <= end"""
+        first, last = self.__bounds(self.__series(description), start, end)
+        return last - first
+
+    def latest(self, description: str, count: int, before=None) -> TimeSeries:
+        """
+        The newest readings
+
+        :param description: sensor description, raises KeyError when unknown
+        :param count: maximum number of readings
+        :param before: only readings with timestamp <= before, all by default
+        :return: TimeSeries sorted by timestamp
+        """
+        series = self.__series(description)
+        _, last = self.__bounds(series, None, before)
+        return series.slice(max(last - count, 0), last)
+
+    def downsample(self, description: str, window_seconds: int, start=None, end=None) -> list:
+        """
+        Summaries of consecutive time windows, windows without readings are left out
+
+        :param description: sensor description, raises KeyError when unknown
+        :param window_seconds: length of a window, windows start at multiples of it since 1970-01-01
+        :param start: epoch seconds or timestamp string, no lower bound by default
+        :param end: epoch seconds or timestamp string, no upper bound by default
+        :return: list of dicts with 'Window' (start in output format), 'Count', 'Min', 'Max' and 'Mean'
+        """
+        if window_seconds <= 0:
+            raise ValueError('Window must be greater than 0!')
+        series = self.__series(description)
+        position, last = self.__bounds(series, start, end)
+        epochs = series.epochs
+        summaries = []
+        while position < last:
+            window = epochs[position] // window_seconds
+            window_end = bisect_left(epochs, (window + 1) * window_seconds, position, last)
+            values = series.values[position:window_end]
+            summaries.append({'Window': from_epoch(window * window_seconds), 'Count': len(values),
+                              'Min': min(values), 'Max': max(values), 'Mean': sum(values) / len(values)})
+            position = window_end
+        return summaries
+
+    def save(self, path: str):
+        """Writes index to a binary file, replacing it atomically"""
+        temp_path = path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, *self.source_stat, len(self.series)))
+            for description, series in self.series.items():
+                name = description.encode('utf-8')
+                f.write(GROUP.pack(len(name), len(series)))
+                f.write(name)
+                for column in (series.epochs, series.values, series.ids):
+                    if sys.byteorder == 'big':
+                        column = column[:]
+                        column.byteswap()
+                    column.tofile(f)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'TimeIndex':
+        """Reads index written by save, raises ValueError for invalid files"""
+        with open(path, 'rb') as f:
+            try:
+                magic, version, size, mtime, groups = HEADER.unpack(f.read(HEADER.size))
+            except struct.error:
+                raise ValueError('Truncated index file')
+            if magic != MAGIC or version != VERSION:
+                raise ValueError('Not a time index file')
+            series = {}
+            try:
+                for _ in range(groups):
+                    name_size, count = GROUP.unpack(f.read(GROUP.size))
+                    description = f.read(name_size).decode('utf-8')
+                    columns = [array(typecode) for typecode in 'qdq']
+                    for column in columns:
+                        column.fromfile(f, count)
+                        if sys.byteorder == 'big':
+                            column.byteswap()
+                    series[description] = TimeSeries(*columns)
+            except (struct.error, EOFError, UnicodeDecodeError):
+                raise ValueError('Truncated index file')
+        return cls(series, (size, mtime))
+
+
+def open_index(path: str, index_path: str = None) -> TimeIndex:
+    """
+    Returns time index of a sensor csv file, built and saved next to it when missing or outdated
+
+    :param path: path to source file with data
+    :param index_path: path to index file, path + '.tidx' by default
+    :return: TimeIndex, raises ParserError when the source cannot be parsed
+    """
+    index_path = index_path or path + INDEX_SUFFIX
+    try:
+        stat = os.stat(path)
+    except OSError as e:
+        logging.error(f'Unable to access file: {e}')
+        raise ParserError(f'Unable to access file: {path}')
+    try:
+        index = TimeIndex.load(index_path)
+        if index.source_stat == (stat.st_size, stat.st_mtime_ns):
+            return index
+    except FileNotFoundError:
+        pass
+    except ValueError as e:
+        logging.warning(f'Index {index_path} rebuilt: {e}')
+    index = TimeIndex.from_csv(path)
+    try:
+        index.save(index_path)
+    except OSError as e:
+        logging.warning(f'Index not saved to {index_path}: {e}')
+    return index
@@ -0,0 +1,135 @@
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+import instrumentation
+
+ISO_FORMAT = '%Y-%m-%d %H:%M:%S'        # format of input_data.csv timestamps
+OUTPUT_FORMAT = '%d-%m-%Y %H:%M:%S'     # format of timestamps in the JSON output
+
+_HOURS = frozenset(f'{hour:02d}' for hour in range(24))
+_MINUTES = frozenset(f'{minute:02d}' for minute in range(60))
+
+_converters = {}  # (input format, output format) -> fast converter function
+
+
+def register_converter(input_format: str, output_format: str):
+    """
+    Decorator registering a fast converter for the given pair of formats.
+
+    A converter takes a timestamp string and returns it reformatted. It has to raise ValueError
+    for invalid input, exactly like datetime.strptime would.
+
+    :param input_format: strptime format of the converted strings
+    :param output_format: strftime format of the returned strings
+    """
+    def decorator(function):
+        _converters[(input_format, output_format)] = function
+        return function
+    return decorator
+
+
+def slow_converter(input_format: str, output_format: str):
+    """Returns converter based on datetime.strptime/strftime, working for any pair of formats"""
+    def converter(value: str) -> str:
+        return datetime.strptime(value, input_format).strftime(output_format)
+    return converter
+
+
+def get_converter(input_format: str, output_format: str):
+    """
+    Returns the fastest available converter for the given pair of formats.
+
+    :param input_format: strptime format of the converted strings
+    :param output_format: strftime format of the returned strings
+    :return: function converting a single timestamp string
+    """
+    converter = _converters.get((input_format, output_format)) or slow_converter(input_format, output_format)
+    if instrumentation.enabled():   # wrapped only when enabled, so disabled conversions cost nothing extra
+        converter = instrumentation.instrumented('timestamp.convert')(converter)
+    return converter
+
+
+def convert_timestamp(value: str, input_format: str = ISO_FORMAT, output_format: str = OUTPUT_FORMAT) -> str:
+    """
+    Reformats a single timestamp string.
+
+    :param value: timestamp in input_format
+    :param input_format: strptime format of value
+    :param output_format: strftime format of the result
+    :return: timestamp in output_format, raises ValueError for invalid input
+    """
+    return get_converter(input_format, output_format)(value)
+
+
+@lru_cache(maxsize=4096)
+def _iso_date_to_output(date_part: str) -> str:
+    """Converts and validates 'YYYY-mm-dd' date, cached as sensor files repeat the same dates"""
+    return datetime.strptime(date_part, '%Y-%m-%d').strftime('%d-%m-%Y')
+
+
+_iso_to_output_slow = slow_converter(ISO_FORMAT, OUTPUT_FORMAT)
+
+
+@register_converter(ISO_FORMAT, OUTPUT_FORMAT)
+def iso_to_output(value: str) -> str:
+    """
+    Converts 'YYYY-mm-dd HH:MM:SS' into 'dd-mm-YYYY HH:MM:SS' using string slicing.
+
+    The time part is validated with lookups, the date part is validated once per distinct date.
+    Anything which does not match the fixed layout goes through the strptime path, so accepted
+    values and raised errors are the same as with datetime.strptime.
+    """
+    if (len(value) == 19 and value[10] == ' ' and value[13] == ':' and value[16] == ':'
+            and value[11:13] in _HOURS and value[14:16] in _MINUTES and value[17:19] in _MINUTES):
+        try:
+            return f'{_iso_date_to_output(value[:10])} {value[11:]}'
+        except ValueError:
+            pass
+    return _iso_to_output_slow(value)
+
+
+_EPOCH_ORDINAL = datetime(1970, 1, 1).toordinal()
+
+
+@lru_cache(maxsize=4096)
+def _output_date_to_days(date_part: str) -> int:
+    """Converts and validates 'dd-mm-YYYY' date into days since 1970-01-01, cached per date"""
+    return datetime.strptime(date_part, '%d-%m-%Y').toordinal() - _EPOCH_ORDINAL
+
+
+@lru_cache(maxsize=4096)
+def _iso_date_to_days(date_part: str) -> int:
+    """Converts and validates 'YYYY-mm-dd' date into days since 1970-01-01, cached per date"""
+    return datetime.strptime(date_part, '%Y-%m-%d').toordinal() - _EPOCH_ORDINAL
+
+
+# formats converted by string slicing in to_epoch -> converter of their date part
+_DATE_TO_DAYS = {OUTPUT_FORMAT: _output_date_to_days, ISO_FORMAT: _iso_date_to_days}
+
+
+def to_epoch(value: str, input_format: str = OUTPUT_FORMAT) -> int:
+    """
+    Converts timestamp string into seconds since 1970-01-01, treating it as UTC.
+
+    Timestamps in the output format ('dd-mm-YYYY HH:MM:SS') and in the ISO format of the input
+    files ('YYYY-mm-dd HH:MM:SS') are converted using string slicing, other formats go through strptime.
+
+    :param value: timestamp string
+    :param input_format: strptime format of value
+    :return: number of seconds, raises ValueError for invalid input
+    """
+    date_to_days = _DATE_TO_DAYS.get(input_format)
+    if (date_to_days and len(value) == 19 and value[10] == ' ' and value[13] == ':'
+            and value[16] == ':' and value[11:13] in _HOURS and value[14:16] in _MINUTES and value[17:19] in _MINUTES):
+        try:
+            return (date_to_days(value[:10]) * 86400 + int(value[11:13]) * 3600 + int(value[14:16]) * 60
+                    + int(value[17:19]))
+        except ValueError:
+            pass
+    parsed = datetime.strptime(value, input_format)
+    return (parsed.toordinal() - _EPOCH_ORDINAL) * 86400 + parsed.hour * 3600 + parsed.minute * 60 + parsed.second
+
+
+def from_epoch(seconds: int, output_format: str = OUTPUT_FORMAT) -> str:
+    """Formats seconds since 1970-01-01 (UTC) as timestamp string"""
+    return (datetime(1970, 1, 1) + timedelta(seconds=seconds)).strftime(output_format)
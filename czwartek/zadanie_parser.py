@@ -1,79 +1,212 @@
+import argparse
+import atexit
 import csv
 import json
-from collections import namedtuple, defaultdict
-from datetime import datetime
+import os
+import shutil
+import sys
+import tempfile
+from collections import namedtuple, defaultdict, OrderedDict
 import logging
 
+import instrumentation
+from instrumentation import instrumented
+from timestamp_converter import get_converter
+
 logging.basicConfig()
 
 ValueWithData = namedtuple('ValueWithTime', 'ID Value Timestamp')  # Grouped data tuplce
 fields_type = {'ID': int,
                'Value': float}
+input_time_format = '%Y-%m-%d %H:%M:%S'
+output_time_format = '%d-%m-%Y %H:%M:%S'
+REQUIRED_COLUMNS = ('ID', 'Description', 'Value', 'Timestamp')
+
+
+class ParserError(Exception):
+    """Exception raised when sensor data cannot be parsed"""
+    def __init__(self, msg):
+        self.msg = msg
+
+    def __str__(self):
+        return f'{self.__class__.__name__} - {self.msg}'
+
+
+def _readings_count(data, *args, **kwargs) -> int:
+    """Number of readings in grouped sensor data, used as rows of instrumented readers"""
+    return sum(len(group['Values']) for group in data.values()) if data else 0
+
+
+def _file_size(result, path, *args, **kwargs) -> int:
+    """Size of the file at path, used as bytes of instrumented readers and writers"""
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def _column_positions(header) -> list:
+    """
+    Validates csv header, shared by all readers so they accept and reject the same files
+
+    :param header: list of column names
+    :return: positions of REQUIRED_COLUMNS, raises ParserError for invalid header
+    """
+    try:
+        namedtuple('Row', header)
+    except (ValueError, TypeError):
+        logging.error('CSV headers have incorrect keys')
+        raise ParserError('CSV headers have incorrect keys')
+    for column in REQUIRED_COLUMNS:
+        if column not in header:
+            logging.error(f'Missing Attribute in "Row" namedtuple: \'Row\' object has no attribute \'{column}\'')
+            raise ParserError(f'Missing attribute {column}')
+    return [header.index(column) for column in REQUIRED_COLUMNS]
+
+
+@instrumented('parser.parse_rows')
+def _parse_csv_rows(csv_file, fieldnames=None, first_index: int = 1):
+    """
+    Parses rows of an opened csv file into (description, reading) pairs.
+
+    Every error is logged and raised as ParserError.
+
+    :param csv_file: opened file (or any iterable of csv lines)
+    :param fieldnames: csv header, read from the first line when not given
+    :param first_index: number of the first parsed row, used in error messages
+    :return: generator of (description, reading dict) tuples
+    """
+    csv_reader = csv.DictReader(csv_file, fieldnames=fieldnames)
+    convert_timestamp = get_converter(input_time_format, output_time_format)
+    _column_positions(csv_reader.fieldnames)
+    Row = namedtuple('Row', csv_reader.fieldnames)
+    last_field = csv_reader.fieldnames[-1]  # None in short rows, extra fields of long rows are under None
+
+    for index, row in enumerate(csv_reader, first_index):
+        if row[last_field] is None or None in row:
+            logging.error(f'Row "{index}" does not have {len(csv_reader.fieldnames)} fields')
+            raise ParserError(f'Invalid number of fields in row "{index}"')
+        type_cast = {}
+        try:
+            for key, value in row.items():
+                type_cast[key] = (lambda k, v: fields_type[k](v) if k in fields_type else v)(key, value)
+        except KeyError:
+            logging.error(f'Key {key} was not found, csv not parsed')
+            raise ParserError(f'Key {key} was not found')
+        except (ValueError, TypeError) as e:
+            logging.error(f'Conversion error in row "{index}", field "{key}": {e}')
+            raise ParserError(f'Conversion error in row "{index}"')
+
+        # Convert the data into output format
+        try:
+            type_cast = Row(**type_cast)
+            reading = {
+                'ID': type_cast.ID,
+                'Value': type_cast.Value,
+                'Timestamp': convert_timestamp(type_cast.Timestamp)
+            }
+        except AttributeError as e:
+            logging.error(f'Missing Attribute in "Row" namedtuple: {e}')
+            raise ParserError(f'Missing attribute in row "{index}"')
+        except ValueError as e:
+            logging.error(f'Time conversion error in row "{index}", field "{key}": {e}')
+            raise ParserError(f'Time conversion error in row "{index}"')
+
+        yield type_cast.Description, reading
+
+
+def csv_row_reader(path: str):
+    """
+    Lazily reads a csv file, one parsed row at a time.
+
+    Only the current row is kept in memory. Any error is logged and raised as ParserError.
+
+    :param path: path to source file with data
+    :return: generator of (description, reading dict) tuples
+    """
+    try:
+        with open(path, newline='') as f:
+            yield from _parse_csv_rows(f)
+    except (FileNotFoundError, PermissionError) as e:
+        logging.error(f'Unable to access file: {e}')
+        raise ParserError(f'Unable to access file: {path}')
 
 
-def csv_data_reader(path: str) -> dict:
+@instrumented('parser.csv_data_reader', rows=_readings_count, size=_file_size)
+def csv_data_reader(path: str, backend: str = 'rows', cache=None) -> dict:
     """
     Reads a csv file and converts it to a dictionary.
 
     Any exception will make the function return None
 
     :param path: path to source file with data
+    :param backend: 'rows' parses the file row by row, 'columnar' reads it in chunks into typed arrays
+    :param cache: ParseCache returning the result of an earlier parse of the same content, read-only
     :return: dictionary or None in case of failure
     """
+    if cache is not None:
+        return cache.load(path, backend)
+    if backend == 'columnar':
+        from columnar_reader import columnar_data_reader
+        return columnar_data_reader(path)
+    elif backend != 'rows':
+        raise ValueError(f'Unknown backend: {backend}')
+
     output_dict = defaultdict(lambda: {'Values': []})  # Default output dict structure
     try:
-        with open(path) as f:
-            csv_reader = csv.DictReader(f)
-            try:
-                Row = namedtuple('Row', csv_reader.fieldnames)
-            except ValueError:
-                logging.error('CSV headers have incorrect keys')
-                return None
-
-            for index, row in enumerate(csv_reader, 1):
-                type_cast = {}
-                try:
-                    for key, value in row.items():
-                        type_cast[key] = (lambda k, v: fields_type[k](v) if k in fields_type else v)(key, value)
-                except KeyError:
-                    logging.error(f'Key {key} was not found, csv not parsed')
-                    return None
-                except (ValueError, TypeError) as e:
-                    logging.error(f'Conversion error in row "{index}", field "{key}": {e}')
-                    return None
-
-                # Convert the data into output format
-                try:
-                    type_cast = Row(**type_cast)
-                    # get dict key or init it with default if it doesn't exist
-                    temp_dict = output_dict[type_cast.Description]
-
-                    temp_dict['Values'].append({
-                        'ID': type_cast.ID,
-                        'Value': type_cast.Value,
-                        'Timestamp': datetime.strptime(type_cast.Timestamp, '%Y-%m-%d %H:%M:%S').strftime(
-                            '%d-%m-%Y %H:%M:%S')
-                    })
-                except AttributeError as e:
-                    logging.error(f'Missing Attribute in "Row" namedtuple: {e}')
-                    return None
-                except ValueError as e:
-                    logging.error(f'Time conversion error in row "{index}", field "{key}": {e}')
-                    return None
-
-        return output_dict
-    except (FileNotFoundError, PermissionError) as e:
-        logging.error(f'Unable to access file: {e}')
+        for description, reading in csv_row_reader(path):
+            # get dict key or init it with default if it doesn't exist
+            output_dict[description]['Values'].append(reading)
+    except ParserError:
+        return None
+
+    return output_dict
+
+
+def csv_data_stream(path: str, batch_size: int = 10000):
+    """
+    Reads a csv file and yields readings grouped by description in batches.
+
+    Consecutive rows with the same description are collected into one batch, so memory usage
+    depends on batch_size only, not on the size of the file. A description may appear in many
+    batches if the rows in the file are interleaved.
+
+    :param path: path to source file with data
+    :param batch_size: maximum number of readings in a single batch
+    :return: generator of (description, list of readings) tuples, raises ParserError on failure
+    """
+    if batch_size <= 0:
+        raise ValueError('Batch size must be greater than 0!')
+
+    batch_description, batch = None, []
+    for description, reading in csv_row_reader(path):
+        if batch and (description != batch_description or len(batch) >= batch_size):
+            yield batch_description, batch
+            batch = []
+        batch_description = description
+        batch.append(reading)
 
+    if batch:
+        yield batch_description, batch
 
-def json_writer(path: str, data: dict):
+
+@instrumented('parser.json_writer', rows=lambda result, path, data, *args, **kwargs: _readings_count(data),
+              size=_file_size)
+def json_writer(path: str, data: dict, compact: bool = False):
     """
     Writes grouped sensor data to JSON file
 
     :param path: path to output file
     :param data: grouped sensor reading data
+    :param compact: write the data itself without indentation and without printing it,
+        instead of the legacy indented document encoded as a JSON string
     """
     try:
+        if compact:
+            with open(path, 'w') as json_file:
+                json.dump(data, json_file, separators=(',', ':'))
+            return
+
         output_json_string = json.dumps(data, indent=4)
         print(output_json_string)
 
@@ -85,8 +218,92 @@ def json_writer(path: str, data: dict):
         logging.error(f'Could not access {path}: {e}')
 
 
+@instrumented('parser.json_stream_writer', rows=lambda result, *args, **kwargs: result or 0, size=_file_size)
+def json_stream_writer(path: str, batches, max_open_files: int = 64) -> int:
+    """
+    Writes batches of grouped sensor data to JSON file incrementally
+
+    Readings are spooled to one temporary file per description while the batches are consumed,
+    then the output document is assembled from the spool files. The resulting file holds the same
+    document as json.dumps(csv_data_reader(...)), but memory usage stays flat. At most
+    max_open_files spool files are open at once, least recently used ones are closed and
+    reopened for appending when their description comes back.
+
+    :param path: path to output file
+    :param batches: iterable of (description, list of readings), e.g. csv_data_stream(...)
+    :param max_open_files: number of spool files kept open
+    :return: number of written readings or None in case of failure
+    """
+    spool_dir = tempfile.TemporaryDirectory()
+    spools = {}                 # description -> spool file path, in order of first appearance
+    open_spools = OrderedDict()  # description -> open spool file, least recently used first
+    written = 0
+    try:
+        for description, readings in batches:
+            spool_path = spools.get(description)
+            if spool_path is None:
+                spool_path = spools[description] = os.path.join(spool_dir.name, f'{len(spools)}.json')
+            if not readings:
+                continue
+            spool = open_spools.pop(description, None)
+            if spool is None:
+                if len(open_spools) >= max_open_files:
+                    open_spools.popitem(last=False)[1].close()
+                spool = open(spool_path, 'a', encoding='utf-8')
+            open_spools[description] = spool
+            if spool.tell():
+                spool.write(', ')
+            spool.write(', '.join(json.dumps(reading) for reading in readings))
+            written += len(readings)
+        while open_spools:
+            open_spools.popitem()[1].close()
+
+        with open(path, 'w', encoding='utf-8') as json_file:
+            json_file.write('{')
+            for group_index, (description, spool_path) in enumerate(spools.items()):
+                if group_index:
+                    json_file.write(', ')
+                json_file.write(f'{json.dumps(description)}: {{"Values": [')
+                if os.path.exists(spool_path):     # descriptions with empty batches only have no spool
+                    with open(spool_path, encoding='utf-8') as spool:
+                        shutil.copyfileobj(spool, json_file)
+                json_file.write(']}')
+            json_file.write('}')
+        return written
+    except ParserError:
+        return None  # already logged by the reader
+    except TypeError as e:
+        logging.error(f'Could not convert to JSON: {e}')
+    except (PermissionError, FileNotFoundError) as e:
+        logging.error(f'Could not access {path}: {e}')
+    finally:
+        for spool in open_spools.values():
+            spool.close()
+        spool_dir.cleanup()
+
+
 if __name__ == '__main__':
-    grouped_data = csv_data_reader('input_data.csv')
+    parser = argparse.ArgumentParser(description='Converts input_data.csv to json_output.json grouped by description')
+    parser.add_argument('--stream', action='store_true', help='constant memory mode for large input files')
+    parser.add_argument('--cache', action='store_true', help='reuse parsed data of unchanged input from the cache')
+    parser.add_argument('--profile', default=None, metavar='FILE',
+                        help='write metrics of the run at exit, Prometheus text for .prom files, JSON otherwise')
+    args = parser.parse_args()
+
+    if args.profile:
+        instrumentation.enable()
+        atexit.register(instrumentation.write_report, args.profile, 'parser')
+
+    if args.stream:
+        if json_stream_writer('json_output.json', csv_data_stream('input_data.csv')) is not None:
+            print('Success! Data streamed to JSON')
+        sys.exit()
+
+    if args.cache:
+        from parse_cache import ParseCache
+        grouped_data = csv_data_reader('input_data.csv', cache=ParseCache())
+    else:
+        grouped_data = csv_data_reader('input_data.csv')
 
     if grouped_data:
         # Data converted to json
@@ -0,0 +1,347 @@
+import threading
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from collections.abc import ItemsView, Mapping, ValuesView
+from contextlib import nullcontext
+from itertools import compress, islice, repeat
+from random import randint
+
+from instrumentation import instrumented
+from zadanie_models import AbstractDB, DatabaseError, _result_rows, fold_quantities, IdSequence, InventoryItem, \
+    QTY_MAX
+
+class CompactRecords(Mapping):
+    """Read-only mapping of ID -> InventoryItem, items are created from the arrays on access"""
+
+    def __init__(self, db: 'CompactDatabaseHandler'):
+        self.__db = db
+
+    def __getitem__(self, item_id):
+        return self.__db.query_by_id(item_id)
+
+    def __iter__(self):
+        return (item_id for item_id, _ in self.__db.iter_items(snapshot=False))
+
+    def __len__(self):
+        return self.__db.count()
+
+    def items(self):
+        return CompactItems(self)
+
+    def values(self):
+        return CompactValues(self)
+
+    def iter_items(self):
+        return self.__db.iter_items(snapshot=False)
+
+
+class CompactItems(ItemsView):
+    def __iter__(self):
+        return self._mapping.iter_items()
+
+
+class CompactValues(ValuesView):
+    def __iter__(self):
+        return (record for _, record in self._mapping.iter_items())
+
+
+class CompactDatabaseHandler(AbstractDB):
+    """
+    Memory efficient in-memory database storage, based on AbstractDB
+
+    Records live in three parallel typed arrays: IDs in ascending order, codes of names and
+    quantities. Every distinct name is stored once in a string table. Quantity edits change the
+    arrays in place, deleted records are marked with quantity 0 and removed in bulk once they
+    outnumber the rest. Quantities have to be integers up to QTY_MAX.
+
+    Lookups by ID use binary search, queries by name or quantity scan the arrays.
+    """
+
+    def __init__(self, records=None, next_id=None, verbose=True, thread_safe=False):
+        """
+        :param records: initial records as mapping of ID -> InventoryItem, demo items by default
+        :param next_id: next ID of the sequence, defaults to the highest record ID + 1
+        :param verbose: print status messages
+        :param thread_safe: guard the arrays with a lock
+        """
+        super().__init__()
+        self.__connected = False
+        self.__verbose = verbose
+        self.__lock = threading.RLock() if thread_safe else nullcontext()
+        self.__ids = array('q')
+        self.__codes = array('i')
+        self.__qtys = array('q')
+        self.__names = []           # code -> name
+        self.__name_codes = {}      # name -> code
+        self.__deleted = 0          # records marked with quantity 0
+        if records is None:
+            records = {index: InventoryItem(value, randint(1, 5))
+                       for index, value in enumerate(['Box', 'Shoes', 'Hammer', 'Screwdriver'], 1)}
+        self.__ids_sequence = IdSequence(next_id or 1)
+        try:
+            for item_id, record in sorted(records.items()):
+                item_name, item_qty = record
+                self.__append(item_id, item_name, item_qty)
+                self.__ids_sequence.advance(item_id)
+        except (ValueError, TypeError, OverflowError):
+            raise DatabaseError('Invalid data, records not loaded')
+        self.__records = CompactRecords(self)
+
+    def __enter__(self):
+        self.connect()
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.disconnect()
+
+    def connect(self):
+        """Connects to database"""
+        self.__connected = True
+        self.__message('DB connection established!')
+
+    def disconnect(self):
+        """Disconnects database"""
+        self.__connected = False
+        self.__message('DB connection closed!')
+
+    def connected(self):
+        """Return database connection status (boolean value)"""
+        return self.__connected
+
+    @instrumented(rows=_result_rows)
+    def query_all(self):
+        """Get all records from database as a live mapping, use iter_items for a consistent snapshot"""
+        if self.__connected:
+            return self.__records
+        else:
+            raise DatabaseError('Database not connected')
+
+    @instrumented()
+    def query_by_id(self, item_id):
+        """Get object with given ID"""
+        if not self.__connected:
+            raise DatabaseError('Database not connected')
+        with self.__lock:
+            position = self.__position(item_id)
+            return InventoryItem(self.__names[self.__codes[position]], self.__qtys[position])
+
+    @instrumented()
+    def count(self):
+        """Number of records"""
+        if self.__connected:
+            return len(self.__ids) - self.__deleted
+        else:
+            raise DatabaseError('Database not connected')
+
+    @instrumented()
+    def iter_items(self, snapshot=True):
+        """
+        Iterate (ID, record) pairs lazily
+
+        A snapshot copies the arrays, about 20 bytes per record, so writes may continue meanwhile.
+
+        :param snapshot: iterate records as they were at the time of the call
+        :return: iterator of (ID, InventoryItem)
+        """
+        if not self.__connected:
+            raise DatabaseError('Database not connected')
+        with self.__lock:
+            arrays = (self.__ids, self.__codes, self.__qtys)
+            if snapshot:
+                arrays = tuple(values[:] for values in arrays)
+        return self.__iterate(*arrays)
+
+    def __iterate(self, ids, codes, qtys):
+        names = self.__names
+        for item_id, code, item_qty in zip(ids, codes, qtys):
+            if item_qty:
+                yield item_id, InventoryItem(names[code], item_qty)
+
+    @instrumented(rows=_result_rows)
+    def query_page(self, offset=0, limit=None, sort_by='ID', descending=False):
+        """Get records at positions offset to offset + limit in given order, ID order needs no sorting"""
+        if sort_by != 'ID':
+            return super().query_page(offset, limit, sort_by, descending)
+        if not self.__connected:
+            raise DatabaseError('Database not connected')
+        with self.__lock:
+            arrays = (self.__ids, self.__codes, self.__qtys)
+            if descending:
+                arrays = tuple(reversed(values) for values in arrays)
+            items = self.__iterate(*arrays)
+            return OrderedDict(islice(items, offset, None if limit is None else offset + limit))
+
+    @instrumented(rows=_result_rows)
+    def query_by_name(self, item_name):
+        """Get all records with given name (scan of the code array)"""
+        if not self.__connected:
+            raise DatabaseError('Database not connected')
+        with self.__lock:
+            code = self.__name_codes.get(item_name)
+            return OrderedDict((item_id, InventoryItem(item_name, item_qty))
+                               for item_id, record_code, item_qty in zip(self.__ids, self.__codes, self.__qtys)
+                               if record_code == code and item_qty)
+
+    @instrumented(rows=_result_rows)
+    def query_by_qty_range(self, min_qty=None, max_qty=None):
+        """Get records with min_qty <= Qty <= max_qty sorted by quantity (scan of the quantity array)"""
+        if not self.__connected:
+            raise DatabaseError('Database not connected')
+        with self.__lock:
+            selected = [(item_qty, item_id, code)
+                        for item_id, code, item_qty in zip(self.__ids, self.__codes, self.__qtys)
+                        if item_qty and (min_qty is None or item_qty >= min_qty)
+                        and (max_qty is None or item_qty <= max_qty)]
+            selected.sort(key=lambda row: row[:2])
+            return OrderedDict((item_id, InventoryItem(self.__names[code], item_qty))
+                               for item_qty, item_id, code in selected)
+
+    @property
+    def next_id(self):
+        """ID which will be given to the next added item"""
+        return self.__ids_sequence.next_id
+
+    @instrumented()
+    def add_item(self, item_name, item_qty):
+        """Add item to database, returns its ID"""
+        if not self.__valid(item_name, item_qty):
+            raise DatabaseError('Invalid data, record not added')
+        with self.__lock:
+            item_id = self.__ids_sequence.allocate()
+            self.__append(item_id, item_name, item_qty)
+            self.changes.publish([(item_id, None, InventoryItem(item_name, item_qty))])
+        return item_id
+
+    @instrumented(rows=_result_rows)
+    def add_items(self, items):
+        """
+        Add many items to database in one call
+
+        Either all items are added or none of them.
+
+        :param items: iterable of (name, quantity) pairs
+        :return: range of new IDs
+        """
+        try:
+            items = [(item_name, item_qty) for item_name, item_qty in items]
+        except (ValueError, TypeError):
+            raise DatabaseError('Invalid data, records not added')
+        if not all(self.__valid(item_name, item_qty) for item_name, item_qty in items):
+            raise DatabaseError('Invalid data, records not added')
+        with self.__lock:
+            ids = self.__ids_sequence.reserve(len(items))
+            self.__ids.extend(ids)
+            self.__codes.extend(self.__code(item_name) for item_name, _ in items)
+            self.__qtys.extend(item_qty for _, item_qty in items)
+            self.changes.publish(zip(ids, repeat(None), (InventoryItem(*item) for item in items)))
+        return ids
+
+    @instrumented()
+    def apply_changes(self, items, operations):
+        """
+        Apply a batch of changes atomically
+
+        The whole batch is validated and applied under the lock, a batch which fails validation changes nothing.
+
+        :param items: list of (name, quantity) pairs to add
+        :param operations: list of (ID, SET_QUANTITY or ADD_QUANTITY, value), quantity 0 removes the item
+        :return: range of IDs of added items
+        """
+        if not self.__connected:
+            raise DatabaseError('Database not connected')
+        try:
+            items = [(item_name, item_qty) for item_name, item_qty in items]
+        except (ValueError, TypeError):
+            raise DatabaseError('Invalid data, records not added')
+        if not all(self.__valid(item_name, item_qty) for item_name, item_qty in items):
+            raise DatabaseError('Invalid data, records not added')
+        with self.__lock:
+            quantities = fold_quantities(operations, lambda item_id: self.__qtys[self.__position(item_id)])
+            for item_id, item_qty in quantities.items():
+                if not isinstance(item_qty, int) or not -QTY_MAX - 1 <= item_qty <= QTY_MAX:
+                    raise DatabaseError(f'Invalid data, quantity of item {item_id} is not a 64 bit integer, '
+                                        f'no changes applied')
+            ids = self.add_items(items)
+            for item_id, item_qty in quantities.items():
+                self.__set_quantity(self.__position(item_id), item_qty)
+        return ids
+
+    @instrumented()
+    def edit_quantity(self, item_id, item_qty=0):
+        """Edit item quantity in place, 0 removes the item"""
+        try:
+            with self.__lock:
+                self.__set_quantity(self.__position(item_id), item_qty)
+        except (ValueError, TypeError, KeyError, OverflowError):
+            raise DatabaseError('Invalid data, record not edited')
+
+    @instrumented()
+    def increment_quantity(self, item_id, delta):
+        """Atomically add delta to item quantity, item is deleted when quantity drops to 0"""
+        try:
+            with self.__lock:
+                position = self.__position(item_id)
+                item_qty = self.__qtys[position] + delta
+                self.__set_quantity(position, item_qty)
+                return item_qty
+        except (ValueError, TypeError, KeyError, OverflowError):
+            raise DatabaseError('Invalid data, record not edited')
+
+    def __message(self, msg):
+        if self.__verbose:
+            print(msg)
+
+    @staticmethod
+    def __valid(item_name, item_qty):
+        try:
+            hash(item_name)
+        except TypeError:
+            return False
+        return isinstance(item_qty, int) and 0 < item_qty <= QTY_MAX
+
+    def __code(self, item_name):
+        """Code of name in the string table, new names are appended"""
+        code = self.__name_codes.get(item_name)
+        if code is None:
+            code = self.__name_codes[item_name] = len(self.__names)
+            self.__names.append(item_name)
+        return code
+
+    def __append(self, item_id, item_name, item_qty):
+        if not self.__valid(item_name, item_qty):
+            raise ValueError('Invalid record')
+        self.__ids.append(item_id)
+        self.__codes.append(self.__code(item_name))
+        self.__qtys.append(item_qty)
+
+    def __position(self, item_id):
+        """Index of a live record in the arrays, raises KeyError; lock has to be held"""
+        position = bisect_left(self.__ids, item_id)
+        if position == len(self.__ids) or self.__ids[position] != item_id or not self.__qtys[position]:
+            raise KeyError(item_id)
+        return position
+
+    def __set_quantity(self, position, item_qty):
+        """Change quantity in place, 0 marks the record as deleted; lock has to be held"""
+        if not isinstance(item_qty, int):
+            raise TypeError('Quantity must be an integer')
+        item_name = self.__names[self.__codes[position]]
+        previous = InventoryItem(item_name, self.__qtys[position])
+        self.__qtys[position] = item_qty
+        record = InventoryItem(item_name, item_qty) if item_qty else None
+        self.changes.publish([(self.__ids[position], previous, record)])
+        if item_qty == 0:
+            self.__deleted += 1
+            if self.__deleted > max(1024, len(self.__ids) // 2):
+                self.__purge()
+            self.__message('Item deleted!')
+        else:
+            self.__message('Item edited!')
+
+    def __purge(self):
+        """Removes records marked as deleted, array order is kept"""
+        self.__ids = array('q', compress(self.__ids, self.__qtys))
+        self.__codes = array('i', compress(self.__codes, self.__qtys))
+        self.__qtys = array('q', compress(self.__qtys, self.__qtys))
+        self.__deleted = 0
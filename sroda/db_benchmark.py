@@ -0,0 +1,480 @@
+import argparse
+import contextlib
+import csv
+import gc
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import instrumentation
+from compact_database import CompactDatabaseHandler
+from concurrent.futures import ProcessPoolExecutor
+from file_database import FileDatabaseHandler, SYNC_ALWAYS, SYNC_BATCH, SYNC_NEVER
+from inventory_io import export_csv, import_csv, import_json
+from shared_database import SharedMemoryDatabaseHandler
+from table_view import print_table
+from zadanie_models import AbstractDB, InMemoryDatabaseHandler, InventoryItem, MenuHandler
+
+NAMES = ('Box', 'Shoes', 'Hammer', 'Screwdriver', 'Wrench', 'Drill', 'Saw', 'Tape')
+
+
+def generate_inventory(size: int, names=NAMES, max_qty: int = 100) -> dict:
+    """
+    Creates synthetic inventory records
+
+    :param size: number of records
+    :param names: base item names, every record gets a name like 'Hammer-123'
+    :param max_qty: maximum item quantity
+    :return: dict of ID -> InventoryItem
+    """
+    rng = random.Random(size)
+    return {item_id: InventoryItem(f'{names[item_id % len(names)]}-{item_id % 10000}', rng.randint(1, max_qty))
+            for item_id in range(1, size + 1)}
+
+
+@contextlib.contextmanager
+def quiet():
+    """Silences prints of the database handlers"""
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+def timed(function, repeat: int) -> float:
+    """Returns average latency of function in microseconds"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def bench_indexed_lookups(size: int, repeat: int = 20):
+    """Compares indexed name and quantity range lookups with full scans"""
+    print(format(f' Lookups, {size} records ', '-^60'))
+    with quiet(), InMemoryDatabaseHandler(generate_inventory(size)) as db:
+        name = 'Hammer-42'
+        threshold = 2
+        results = [
+            ('name index', timed(lambda: db.query_by_name(name), repeat)),
+            ('name scan', timed(lambda: AbstractDB.query_by_name(db, name), repeat)),
+            (f'qty <= {threshold} index', timed(lambda: db.query_by_qty_range(max_qty=threshold), repeat)),
+            (f'qty <= {threshold} scan', timed(lambda: AbstractDB.query_by_qty_range(db, max_qty=threshold), repeat)),
+        ]
+    for name, latency in results:
+        print(name.ljust(20) + f'{latency:,.1f} us')
+
+
+def bench_bulk_insert(size: int, batch_size: int = 10000):
+    """Compares inserting items one by one with add_items batches"""
+    print(format(f' Inserts, {size} records ', '-^60'))
+    items = [(record.Name, record.Qty) for record in generate_inventory(size).values()]
+    with quiet(), InMemoryDatabaseHandler({}) as db:
+        start = time.perf_counter()
+        for item_name, item_qty in items:
+            db.add_item(item_name, item_qty)
+        single = time.perf_counter() - start
+    with quiet(), InMemoryDatabaseHandler({}) as db:
+        start = time.perf_counter()
+        for offset in range(0, size, batch_size):
+            db.add_items(items[offset:offset + batch_size])
+        batched = time.perf_counter() - start
+    print('add_item'.ljust(20) + f'{single:.2f} s'.ljust(12) + f'{size / single:,.0f} items/s')
+    print(f'add_items ({batch_size})'.ljust(20) + f'{batched:.2f} s'.ljust(12) + f'{size / batched:,.0f} items/s')
+
+
+def bench_import(size: int):
+    """Measures import throughput from csv, JSON array and JSON Lines files"""
+    print(format(f' Import, {size} records ', '-^60'))
+    records = generate_inventory(size).values()
+    with tempfile.TemporaryDirectory() as directory:
+        csv_path = os.path.join(directory, 'items.csv')
+        with open(csv_path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(['Name', 'Qty'])
+            writer.writerows((record.Name, record.Qty) for record in records)
+        json_path = os.path.join(directory, 'items.json')
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump([{'Name': record.Name, 'Qty': record.Qty} for record in records], f)
+        jsonl_path = os.path.join(directory, 'items.jsonl')
+        with open(jsonl_path, 'w', encoding='utf-8') as f:
+            f.writelines(json.dumps([record.Name, record.Qty]) + '\n' for record in records)
+
+        for name, importer, source in (('csv', import_csv, csv_path),
+                                       ('json array', import_json, json_path),
+                                       ('json lines', import_json, jsonl_path)):
+            with InMemoryDatabaseHandler({}, verbose=False) as db:
+                report = importer(db, source)
+            print(name.ljust(20) + f'{report.seconds:.2f} s'.ljust(12) + f'{report.rows_per_second:,.0f} rows/s')
+
+
+def bench_export(size: int):
+    """Compares printing records with csv export, plain, compressed and during concurrent writes"""
+    print(format(f' Export, {size} records ', '-^60'))
+    print('Method'.ljust(24) + 'Time'.ljust(12) + 'Rows/s'.ljust(14) + 'Size')
+    records = generate_inventory(size)
+    with tempfile.TemporaryDirectory() as directory, InMemoryDatabaseHandler(records, verbose=False,
+                                                                             thread_safe=True) as db:
+        start = time.perf_counter()
+        with quiet():
+            for item_id, record in db.query_all().items():
+                print([item_id, record.Name, record.Qty])
+        seconds = time.perf_counter() - start
+        print('print per record'.ljust(24) + f'{seconds:.2f} s'.ljust(12) + f'{size / seconds:,.0f}'.ljust(14) + '-')
+
+        stop = threading.Event()
+        edits = [0]
+
+        def writer():
+            rng = random.Random(0)
+            while not stop.is_set():
+                db.increment_quantity(rng.randint(1, size), 1)
+                edits[0] += 1
+
+        for name, file_name, concurrent in (('csv', 'items.csv', False),
+                                            ('csv.gz', 'items.csv.gz', False),
+                                            ('csv, concurrent edits', 'items.csv', True)):
+            path = os.path.join(directory, file_name)
+            thread = threading.Thread(target=writer)
+            if concurrent:
+                thread.start()
+            start = time.perf_counter()
+            count = export_csv(db, path)
+            seconds = time.perf_counter() - start
+            if concurrent:
+                stop.set()
+                thread.join()
+            print(name.ljust(24) + f'{seconds:.2f} s'.ljust(12) + f'{count / seconds:,.0f}'.ljust(14)
+                  + f'{os.path.getsize(path) / 2 ** 20:.1f} MB')
+        print(f'edits during concurrent export: {edits[0]}')
+
+        for snapshot in (True, False):
+            tracemalloc.start()     # slows the export down, only the peak memory is reported
+            export_csv(db, os.path.join(directory, 'items.csv'), snapshot=snapshot)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(f'peak memory, snapshot={snapshot}: {peak / 2 ** 20:.1f} MB')
+
+
+def print_rows(records):
+    """Previous view rendering, ljust concatenation and a print per record"""
+    header = 'ID'.ljust(8) + 'Name'.ljust(15) + 'Quntity'.ljust(10)
+    print(header)
+    print(len(header) * '-')
+    for item_id, record in records.items():
+        print(str(item_id).ljust(8) + record.Name.ljust(15) + str(record.Qty).ljust(10))
+
+
+def bench_rendering(size: int, page_size: int = 20):
+    """Compares printing every row with a single buffered table write and with store-backed pages"""
+    print(format(f' Rendering, {size} records ', '-^60'))
+    # line buffered like a terminal, every line of print reaches the operating system separately
+    with InMemoryDatabaseHandler(generate_inventory(size), verbose=False) as db, \
+            tempfile.TemporaryFile('w', buffering=1) as terminal, contextlib.redirect_stdout(terminal):
+        results = [
+            ('print per row', timed(lambda: print_rows(db.query_all()), 3)),
+            ('single write', timed(lambda: print_table(db.query_all(), 0, size), 3)),
+        ]
+        for sort_by in ('ID', 'Name', 'Qty'):
+            results.append((f'page by {sort_by}', timed(
+                lambda: print_table(db.query_page(size // 2, page_size, sort_by), size // 2, db.count()), 20)))
+            results.append((f'page by {sort_by}, scan', timed(
+                lambda: print_table(AbstractDB.query_page(db, size // 2, page_size, sort_by), size // 2, size), 3)))
+    for name, latency in results:
+        print(name.ljust(24) + f'{latency / 1000:,.1f} ms')
+
+
+def bench_menu_script(size: int, commands: int = 20000):
+    """Measures replay speed of a scripted menu session with additions and edits"""
+    print(format(f' Menu script, {commands} commands ', '-^60'))
+    rng = random.Random(commands)
+    script = ['add', 'console']
+    script.extend(f'Item-{index}, {rng.randint(1, 100)}' for index in range(commands // 2))
+    script.extend(['main', 'edit'])
+    script.extend(f'{rng.randint(1, size)}, +{rng.randint(1, 5)}' for _ in range(commands // 2))
+    with InMemoryDatabaseHandler(generate_inventory(size), verbose=False) as db:
+        result = MenuHandler(db).run_script(script)
+    print(f'{result.commands} commands'.ljust(20) + f'{result.seconds:.2f} s'.ljust(12)
+          + f'{result.commands / result.seconds:,.0f} commands/s, {len(result.errors)} errors')
+
+
+def _rss_mb() -> float:
+    """Current resident memory of this process"""
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def measure_store(handler: str, size: int, operations: int = 200000):
+    """
+    Fills a store in a fresh process, returns (bytes per record, edits per second)
+
+    Names are created per record like in a parsed import, so the layouts pay for their own copies.
+    """
+    gc.collect()
+    before = _rss_mb()
+    db_class = CompactDatabaseHandler if handler == 'compact' else InMemoryDatabaseHandler
+    db = db_class({}, verbose=False)
+    db.connect()
+    rng = random.Random(size)
+    for offset in range(0, size, 100000):
+        db.add_items((f'{NAMES[item_id % len(NAMES)]}-{item_id % 10000}', rng.randint(1, 100))
+                     for item_id in range(offset + 1, min(offset + 100000, size) + 1))
+    gc.collect()
+    memory = (_rss_mb() - before) * 2 ** 20 / size
+    ids = [rng.randint(1, size) for _ in range(operations)]
+    start = time.perf_counter()
+    for item_id in ids:
+        db.increment_quantity(item_id, 1)
+    return memory, operations / (time.perf_counter() - start)
+
+
+def bench_compact_store(size: int):
+    """Compares memory and edit throughput of the dict based and the array based store"""
+    print(format(f' Store layout, {size} records ', '-^60'))
+    print('Store'.ljust(24) + 'Bytes/record'.ljust(16) + 'Edits/s')
+    for handler in ('memory', 'compact'):
+        with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn')) as executor:
+            memory, edits = executor.submit(measure_store, handler, size).result()
+        print(handler.ljust(24) + f'{memory:,.0f}'.ljust(16) + f'{edits:,.0f}')
+
+
+def bench_transactions(size: int, operations: int = 100000, single_operations: int = 10000):
+    """Compares applying edits one call at a time with committing them as one transaction"""
+    print(format(f' Transactions, {size} records ', '-^60'))
+    print('Store'.ljust(12) + 'Mode'.ljust(24) + 'Ops/s')
+    rng = random.Random(size)
+    edits = [(rng.randint(1, size), rng.randint(1, 5)) for _ in range(operations)]
+    items = [(record.Name, record.Qty) for record in generate_inventory(size).values()]
+    with tempfile.TemporaryDirectory() as directory:
+        for store in ('memory', 'file'):
+            for mode in ('single calls', 'transaction', 'undo'):
+                if store == 'memory':
+                    db = InMemoryDatabaseHandler({}, verbose=False)
+                else:
+                    shutil.rmtree(directory)
+                    db = FileDatabaseHandler(directory, snapshot_every=size * 4, verbose=False)
+                with db:
+                    for offset in range(0, size, 100000):
+                        db.add_items(items[offset:offset + 100000])
+                    start = time.perf_counter()
+                    if mode == 'single calls':
+                        done = single_operations
+                        for item_id, delta in edits[:done]:
+                            db.increment_quantity(item_id, delta)
+                    else:
+                        done = operations
+                        with db.transaction() as batch:
+                            for item_id, delta in edits:
+                                batch.increment_quantity(item_id, delta)
+                        if mode == 'undo':
+                            start = time.perf_counter()
+                            db.undo()
+                    seconds = time.perf_counter() - start
+                print(store.ljust(12) + f'{mode} ({done})'.ljust(24) + f'{done / seconds:,.0f}')
+
+
+def bench_instrumentation(size: int, calls: int = 200000):
+    """Compares database methods with instrumentation disabled and enabled"""
+    print(format(f' Instrumentation, {size} records ', '-^60'))
+    print('Method'.ljust(24) + 'Mode'.ljust(12) + 'Calls/s')
+    rng = random.Random(size)
+    ids = [rng.randint(1, size) for _ in range(calls)]
+    plain_methods = {name: getattr(InMemoryDatabaseHandler, name) for name in ('query_by_id', 'increment_quantity')}
+    with InMemoryDatabaseHandler(generate_inventory(size), verbose=False) as db:
+        for name in plain_methods:
+            for mode in ('disabled', 'enabled', 'disabled'):
+                if mode == 'enabled':
+                    instrumentation.enable()
+                start = time.perf_counter()
+                if name == 'query_by_id':
+                    for item_id in ids:
+                        db.query_by_id(item_id)
+                else:
+                    for item_id in ids:
+                        db.increment_quantity(item_id, 1)
+                seconds = time.perf_counter() - start
+                instrumentation.disable()
+                print(name.ljust(24) + mode.ljust(12) + f'{calls / seconds:,.0f}')
+    print('Plain methods when disabled: ' +
+          str(all(getattr(InMemoryDatabaseHandler, name) is method for name, method in plain_methods.items())))
+    instrumentation.reset()
+
+
+def bench_change_feed(size: int, edits: int = 100000):
+    """Measures cost of publishing change events with different consumers"""
+    print(format(f' Change feed, {min(size, 10000)} records ', '-^60'))
+    print('Consumers'.ljust(24) + 'Edits/s'.ljust(14) + 'Delivered')
+    records = generate_inventory(min(size, 10000))
+    rng = random.Random(size)
+    changes = [(rng.randint(1, len(records)), rng.randint(1, 100)) for _ in range(edits)]
+    runs = [(InMemoryDatabaseHandler, consumers) for consumers in ('not published', 'none', 'callback',
+                                                                   'low stock watch')] + \
+        [(SharedMemoryDatabaseHandler, consumers) for consumers in ('none', 'callback', 'low stock watch')]
+    for store, consumers in runs:
+        delivered = []
+        db = store(records, verbose=False)
+        with db:
+            if consumers == 'not published':
+                db.changes.publish = lambda events: 0
+            elif consumers == 'callback':
+                db.changes.subscribe(delivered.append)
+            elif consumers == 'low stock watch':
+                db.changes.on_low_stock(10, delivered.append)
+            start = time.perf_counter()
+            for item_id, item_qty in changes:
+                db.edit_quantity(item_id, item_qty)
+            seconds = time.perf_counter() - start
+        if store is SharedMemoryDatabaseHandler:
+            db.unlink()
+            consumers += ', shared'
+        print(consumers.ljust(24) + f'{edits / seconds:,.0f}'.ljust(14) + str(len(delivered)))
+
+
+def shared_memory_worker(db, mode, operations, seed, start, results):
+    """Reads or increments random records of a shared store, reports (mode, operations, seconds)"""
+    with db:
+        rng = random.Random(seed)
+        ids = [rng.randint(1, db.next_id - 1) for _ in range(operations)]
+        start.wait()
+        begin = time.perf_counter()
+        if mode == 'read':
+            for item_id in ids:
+                db.query_by_id(item_id)
+        else:
+            for item_id in ids:
+                db.increment_quantity(item_id, 1)
+        results.put((mode, operations, time.perf_counter() - begin))
+
+
+def bench_shared_memory(size: int, operations: int = 100000, process_counts=(1, 2, 4)):
+    """Measures throughput of reader and writer processes sharing one store and checks for lost updates"""
+    print(format(f' Shared memory store, {size} records, {os.cpu_count()} CPUs ', '-^60'))
+    print('Readers'.ljust(10) + 'Writers'.ljust(10) + 'Reads/s'.ljust(14) + 'Writes/s'.ljust(14) + 'Lost updates')
+    records = generate_inventory(size)
+    rng = random.Random(size)
+    ids = [rng.randint(1, size) for _ in range(operations)]
+    with InMemoryDatabaseHandler(records, verbose=False, thread_safe=True) as db:
+        start = time.perf_counter()
+        for item_id in ids:
+            db.query_by_id(item_id)
+        reads = operations / (time.perf_counter() - start)
+        edits = ids[:10000]     # every edit moves entries of the quantity index, large stores are slow
+        start = time.perf_counter()
+        for item_id in edits:
+            db.increment_quantity(item_id, 1)
+        writes = len(edits) / (time.perf_counter() - start)
+    print('dict store'.ljust(20) + f'{reads:,.0f}'.ljust(14) + f'{writes:,.0f}'.ljust(14) + 'one process')
+
+    db = SharedMemoryDatabaseHandler(records, verbose=False)
+    runs = [(count, 0) for count in process_counts] + [(0, count) for count in process_counts] + \
+        [(count, count) for count in process_counts]
+    try:
+        with db:
+            for readers, writers in runs:
+                before = sum(record.Qty for _, record in db.iter_items())
+                start = multiprocessing.Barrier(readers + writers)
+                results = multiprocessing.Queue()
+                workers = [multiprocessing.Process(target=shared_memory_worker,
+                                                   args=(db, mode, operations, seed, start, results))
+                           for seed, mode in enumerate(['read'] * readers + ['write'] * writers)]
+                for worker in workers:
+                    worker.start()
+                done = [results.get() for _ in workers]
+                for worker in workers:
+                    worker.join()
+                # workers start together, throughput is the work of all of them over the time of the slowest
+                rates = []
+                for mode in ('read', 'write'):
+                    counts = [count for worker_mode, count, _ in done if worker_mode == mode]
+                    seconds = [seconds for worker_mode, _, seconds in done if worker_mode == mode]
+                    rates.append(f'{sum(counts) / max(seconds):,.0f}' if counts else '-')
+                lost = before + operations * writers - sum(record.Qty for _, record in db.iter_items())
+                print(str(readers).ljust(10) + str(writers).ljust(10) + rates[0].ljust(14) + rates[1].ljust(14)
+                      + str(lost))
+    finally:
+        db.unlink()
+
+
+def recover(directory):
+    """Opens and closes file database"""
+    with FileDatabaseHandler(directory, verbose=False):
+        pass
+
+
+def bench_file_database(size: int, operations: int = 2000):
+    """Measures recovery time of the file database and write latency of every sync policy"""
+    print(format(f' File database, {size} records ', '-^60'))
+    items = [(record.Name, record.Qty) for record in generate_inventory(size).values()]
+    with tempfile.TemporaryDirectory() as directory:
+        with FileDatabaseHandler(directory, snapshot_every=size * 2, verbose=False) as db:
+            for offset in range(0, size, 10000):
+                db.add_items(items[offset:offset + 10000])
+        print('recover from log'.ljust(24) + f'{timed(lambda: recover(directory), 1) / 1e6:.2f} s')
+
+        with FileDatabaseHandler(directory, verbose=False) as db:
+            db.compact()
+        print('recover from snapshot'.ljust(24) + f'{timed(lambda: recover(directory), 1) / 1e6:.2f} s')
+
+        for sync in (SYNC_ALWAYS, SYNC_BATCH, SYNC_NEVER):
+            with FileDatabaseHandler(directory, sync=sync, snapshot_every=size * 2, verbose=False) as db:
+                latency = timed(lambda: db.edit_quantity(random.randint(1, size), random.randint(1, 100)), operations)
+            print(f'edit, sync={sync}'.ljust(24) + f'{latency:,.1f} us/op')
+
+
+def bench_concurrent_access(size: int, operations: int = 20000, thread_counts=(1, 2, 4, 8)):
+    """Measures throughput of atomic increments from many threads and checks for lost updates"""
+    print(format(f' Concurrent increments, {size} records ', '-^60'))
+    print('Threads'.ljust(10) + 'Mode'.ljust(20) + 'Ops/s'.ljust(14) + 'Lost updates')
+    records = generate_inventory(size)
+    for threads in thread_counts:
+        for mode in ('atomic', 'read-modify-write'):
+            db = InMemoryDatabaseHandler(records, verbose=False, thread_safe=True)
+            db.connect()
+            before = sum(record.Qty for record in db.query_all().values())
+
+            def worker(seed):
+                rng = random.Random(seed)
+                for _ in range(operations // threads):
+                    item_id = rng.randint(1, min(size, 100))   # small hot set to provoke conflicts
+                    if mode == 'atomic':
+                        db.increment_quantity(item_id, 1)
+                    else:
+                        db.edit_quantity(item_id, db.query_by_id(item_id).Qty + 1)
+
+            workers = [threading.Thread(target=worker, args=(seed,)) for seed in range(threads)]
+            start = time.perf_counter()
+            for thread in workers:
+                thread.start()
+            for thread in workers:
+                thread.join()
+            seconds = time.perf_counter() - start
+            done = operations // threads * threads
+            lost = before + done - sum(record.Qty for record in db.query_all().values())
+            print(str(threads).ljust(10) + mode.ljust(20) + f'{done / seconds:,.0f}'.ljust(14) + str(lost))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Inventory database benchmarks')
+    parser.add_argument('--size', type=int, default=1_000_000, help='number of records')
+    args = parser.parse_args()
+
+    bench_indexed_lookups(args.size)
+    bench_bulk_insert(args.size)
+    bench_rendering(min(args.size, 100_000))
+    bench_menu_script(args.size)
+    bench_transactions(args.size)
+    bench_instrumentation(args.size)
+    bench_change_feed(args.size)
+    bench_compact_store(args.size)
+    bench_import(args.size)
+    bench_export(args.size)
+    bench_file_database(args.size)
+    bench_concurrent_access(args.size)
+    bench_shared_memory(args.size)
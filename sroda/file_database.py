@@ -0,0 +1,441 @@
+import json
+import mmap
+import os
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from contextlib import nullcontext
+
+from instrumentation import instrumented
+from zadanie_models import AbstractDB, DatabaseError, _new_records, _result_rows, fold_quantities, \
+    InMemoryDatabaseHandler, InventoryItem, ADD_QUANTITY, SET_QUANTITY
+
+SNAPSHOT_FILE = 'snapshot.db'
+WAL_FILE = 'wal.log'
+SNAPSHOT_VERSION = 1
+
+SYNC_ALWAYS = 'always'  # fsync after every operation
+SYNC_BATCH = 'batch'    # group commit, fsync after group_commit operations or a change after commit_interval
+SYNC_NEVER = 'never'    # leave flushing to the operating system, fsync only on disconnect
+
+
+def _number(text):
+    try:
+        return int(text)
+    except ValueError:
+        return float(text)
+
+
+def _decode_name(text):
+    """Decodes JSON encoded item name, plain strings without escapes skip the JSON parser"""
+    if text[:1] == '"' and '\\' not in text:
+        return text[1:-1]
+    return json.loads(text)
+
+
+def _encode_wal_entry(*fields) -> bytes:
+    """Single WAL line: crc32 of the payload, tab, tab separated payload"""
+    payload = '\t'.join(str(field) for field in fields).encode('utf-8')
+    return b'%08x\t%s\n' % (zlib.crc32(payload), payload)
+
+
+def _decode_wal_entry(line: bytes):
+    """Returns list of payload fields, None for torn or corrupted lines"""
+    if not line.endswith(b'\n'):
+        return None
+    checksum, _, payload = line[:-1].partition(b'\t')
+    try:
+        if int(checksum, 16) != zlib.crc32(payload):
+            return None
+    except ValueError:
+        return None
+    return payload.decode('utf-8').split('\t', 3)
+
+
+class FileDatabaseHandler(AbstractDB):
+    """
+    File based database storage, based on AbstractDB
+
+    Records live in memory (InMemoryDatabaseHandler) and every change is validated, appended to a
+    write-ahead log and flushed to the operating system before it is applied to memory. The log is
+    periodically compacted into a snapshot file, which is memory-mapped on load. Log entries store
+    absolute values, so replaying the log over a newer snapshot is harmless.
+
+    In SYNC_BATCH mode group_commit and commit_interval are checked when a change is logged, there is
+    no timer: entries of an idle database reach the disk on the next change, sync() or disconnect().
+    """
+
+    def __init__(self, directory, sync=SYNC_BATCH, group_commit=100, commit_interval=1.0,
+                 snapshot_every=100000, verbose=True, thread_safe=False):
+        """
+        :param directory: directory holding snapshot and log files, created if missing
+        :param sync: SYNC_ALWAYS, SYNC_BATCH or SYNC_NEVER
+        :param group_commit: number of operations synced together in SYNC_BATCH mode
+        :param commit_interval: number of seconds after which the next change is synced in SYNC_BATCH mode
+        :param snapshot_every: number of logged operations after which the log is compacted
+        :param verbose: print status messages
+        :param thread_safe: allow concurrent access, writes are applied and logged under one lock
+        """
+        super().__init__()
+        if sync not in (SYNC_ALWAYS, SYNC_BATCH, SYNC_NEVER):
+            raise ValueError(f'Unknown sync policy: {sync}')
+        self.__directory = directory
+        self.__sync = sync
+        self.__group_commit = group_commit
+        self.__commit_interval = commit_interval
+        self.__snapshot_every = snapshot_every
+        self.__verbose = verbose
+        self.__thread_safe = thread_safe
+        self.__lock = threading.RLock() if thread_safe else nullcontext()
+
+        self.__connected = False
+        self.__memory = None        # InMemoryDatabaseHandler with current state
+        self.__wal = None           # WAL file opened for appending
+        self.__wal_entries = 0      # entries in the WAL since the last snapshot
+        self.__unsynced = 0         # entries written since the last fsync
+        self.__last_sync = 0.0
+
+    def __enter__(self):
+        self.connect()
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.disconnect()
+
+    @property
+    def snapshot_path(self):
+        return os.path.join(self.__directory, SNAPSHOT_FILE)
+
+    @property
+    def wal_path(self):
+        return os.path.join(self.__directory, WAL_FILE)
+
+    def connect(self):
+        """Recovers records from snapshot and log, opens log for writing"""
+        try:
+            os.makedirs(self.__directory, exist_ok=True)
+            records, next_id = self.__load_snapshot()
+            next_id = self.__replay_wal(records, next_id)
+            self.__wal = open(self.wal_path, 'ab')
+        except (OSError, ValueError) as e:
+            raise DatabaseError(f'Unable to open database {self.__directory}: {e}')
+        self.__memory = InMemoryDatabaseHandler(records, next_id, verbose=self.__verbose,
+                                                thread_safe=self.__thread_safe)
+        self.__memory.changes = self.changes    # recovered records are not published, later writes are
+        self.__memory.connect()
+        self.__connected = True
+        self.__last_sync = time.monotonic()
+
+    def disconnect(self):
+        """Syncs the log and closes database"""
+        if self.__wal is not None:
+            self.sync()
+            self.__wal.close()
+            self.__wal = None
+        if self.__memory is not None:
+            self.__memory.disconnect()
+        self.__connected = False
+
+    def connected(self):
+        """Return database connection status (boolean value)"""
+        return self.__connected
+
+    def __load_snapshot(self):
+        """Reads memory-mapped snapshot, returns (records, next ID)"""
+        records = OrderedDict()
+        if not os.path.exists(self.snapshot_path) or not os.path.getsize(self.snapshot_path):
+            return records, 1
+        with open(self.snapshot_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            header = json.loads(data.readline())
+            if header.get('version') != SNAPSHOT_VERSION:
+                raise ValueError(f'Unsupported snapshot version {header.get("version")}')
+            for line in iter(data.readline, b''):
+                item_id, item_qty, item_name = line.decode('utf-8').rstrip('\n').split('\t', 2)
+                records[int(item_id)] = InventoryItem(_decode_name(item_name), _number(item_qty))
+            if len(records) != header['count']:
+                raise ValueError('Snapshot is truncated')
+        return records, header['next_id']
+
+    def __replay_wal(self, records, next_id):
+        """Applies log entries to records, returns next ID; a torn tail is cut off"""
+        if not os.path.exists(self.wal_path):
+            return next_id
+        valid_size = 0
+        entries = 0
+        with open(self.wal_path, 'rb') as f:
+            for line in f:
+                fields = _decode_wal_entry(line)
+                if fields is None:
+                    break
+                group, size = [fields], len(line)
+                if fields[0] == 'T':    # transaction, the following entries are applied all or none
+                    group = []
+                    for _ in range(int(fields[1])):
+                        line = f.readline()
+                        fields = _decode_wal_entry(line)
+                        if fields is None:
+                            break
+                        group.append(fields)
+                        size += len(line)
+                    if fields is None:
+                        break
+                    entries += 1
+                for fields in group:
+                    next_id = self.__apply_entry(records, next_id, fields)
+                valid_size += size
+                entries += len(group)
+        if valid_size != os.path.getsize(self.wal_path):
+            os.truncate(self.wal_path, valid_size)
+        self.__wal_entries = entries
+        return next_id
+
+    @staticmethod
+    def __apply_entry(records, next_id, fields):
+        """Applies a single decoded log entry to records, returns next ID"""
+        operation, item_id = fields[0], int(fields[1])
+        if operation == 'A':
+            records[item_id] = InventoryItem(_decode_name(fields[3]), _number(fields[2]))
+            next_id = max(next_id, item_id + 1)
+        elif operation == 'E':
+            if item_id in records:
+                records[item_id] = InventoryItem(records[item_id].Name, _number(fields[2]))
+        elif operation == 'D':
+            records.pop(item_id, None)
+        return next_id
+
+    def __log(self, entries, transaction=False):
+        """
+        Appends encoded entries to the log and flushes them to the operating system. Called before the
+        change is applied to memory, a failed write is cut off the log and memory is left unchanged.
+        """
+        if transaction and len(entries) > 1:
+            entries = [_encode_wal_entry('T', len(entries))] + entries
+        position = self.__wal.tell()
+        try:
+            self.__wal.write(b''.join(entries))
+            self.__wal.flush()
+        except OSError as e:
+            self.__discard(position)
+            raise DatabaseError(f'Unable to write log: {e}')
+        self.__unsynced += len(entries)
+        self.__wal_entries += len(entries)
+
+    def __discard(self, position):
+        """Cuts the log back to position after a failed write, the database is disconnected if that fails too"""
+        try:
+            self.__wal.close()
+        except OSError:
+            pass    # unwritten entries are dropped with the buffer
+        try:
+            os.truncate(self.wal_path, position)
+            self.__wal = open(self.wal_path, 'ab')
+        except OSError as e:
+            self.__wal = None
+            self.__connected = False
+            raise DatabaseError(f'Unable to restore log, database disconnected: {e}')
+
+    def __commit(self):
+        """Applies the sync policy and compacts the log, called after the change is applied to memory"""
+        try:
+            if (self.__sync == SYNC_ALWAYS
+                    or (self.__sync == SYNC_BATCH
+                        and (self.__unsynced >= self.__group_commit
+                             or time.monotonic() - self.__last_sync >= self.__commit_interval))):
+                self.sync()
+            if self.__wal_entries >= self.__snapshot_every:
+                self.compact()
+        except OSError as e:
+            raise DatabaseError(f'Unable to write log: {e}')
+
+    @instrumented()
+    def sync(self):
+        """Flushes buffered log entries to disk"""
+        with self.__lock:
+            if self.__wal is None:
+                return
+            self.__wal.flush()
+            if self.__unsynced:
+                os.fsync(self.__wal.fileno())
+            self.__unsynced = 0
+            self.__last_sync = time.monotonic()
+
+    @instrumented()
+    def compact(self):
+        """Writes current records into a new snapshot and starts an empty log"""
+        with self.__lock:
+            if not self.__connected:
+                raise DatabaseError('Database not connected')
+            records = self.__memory.query_all()
+            temp_path = self.snapshot_path + '.tmp'
+            try:
+                with open(temp_path, 'wb') as f:
+                    header = {'version': SNAPSHOT_VERSION, 'next_id': self.__memory.next_id, 'count': len(records)}
+                    f.write(json.dumps(header).encode('utf-8') + b'\n')
+                    chunk = []
+                    for item_id, record in records.items():
+                        chunk.append(f'{item_id}\t{record.Qty}\t{json.dumps(record.Name)}\n')
+                        if len(chunk) == 10000:
+                            f.write(''.join(chunk).encode('utf-8'))
+                            chunk = []
+                    f.write(''.join(chunk).encode('utf-8'))
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(temp_path, self.snapshot_path)
+                self.__wal.close()
+                self.__wal = open(self.wal_path, 'wb')
+                os.fsync(self.__wal.fileno())
+            except OSError as e:
+                raise DatabaseError(f'Unable to write snapshot: {e}')
+            self.__wal_entries = 0
+            self.__unsynced = 0
+
+    @instrumented(rows=_result_rows)
+    def query_all(self):
+        """Get all records from database"""
+        if self.__connected:
+            return self.__memory.query_all()
+        else:
+            raise DatabaseError('Database not connected')
+
+    @instrumented()
+    def iter_items(self, snapshot=True):
+        """Iterate (ID, record) pairs lazily, see InMemoryDatabaseHandler.iter_items"""
+        if self.__connected:
+            return self.__memory.iter_items(snapshot)
+        else:
+            raise DatabaseError('Database not connected')
+
+    @instrumented()
+    def query_by_id(self, item_id):
+        """Get object with given ID"""
+        if self.__connected:
+            return self.__memory.query_by_id(item_id)
+        else:
+            raise DatabaseError('Database not connected')
+
+    @instrumented()
+    def count(self):
+        """Number of records"""
+        if self.__connected:
+            return self.__memory.count()
+        else:
+            raise DatabaseError('Database not connected')
+
+    @instrumented(rows=_result_rows)
+    def query_page(self, offset=0, limit=None, sort_by='ID', descending=False):
+        """Get records at positions offset to offset + limit in given order"""
+        if self.__connected:
+            return self.__memory.query_page(offset, limit, sort_by, descending)
+        else:
+            raise DatabaseError('Database not connected')
+
+    @instrumented(rows=_result_rows)
+    def query_by_name(self, item_name):
+        """Get all records with given name"""
+        if self.__connected:
+            return self.__memory.query_by_name(item_name)
+        else:
+            raise DatabaseError('Database not connected')
+
+    @instrumented(rows=_result_rows)
+    def query_by_qty_range(self, min_qty=None, max_qty=None):
+        """Get records with min_qty <= Qty <= max_qty sorted by quantity"""
+        if self.__connected:
+            return self.__memory.query_by_qty_range(min_qty, max_qty)
+        else:
+            raise DatabaseError('Database not connected')
+
+    @instrumented()
+    def add_item(self, item_name, item_qty):
+        """Add item to database, returns its ID"""
+        if not self.__connected:
+            raise DatabaseError('Database not connected')
+        with self.__lock:
+            _new_records([(item_name, item_qty)])
+            self.__log([_encode_wal_entry('A', self.__memory.next_id, item_qty, json.dumps(item_name))])
+            item_id = self.__memory.add_item(item_name, item_qty)
+            self.__commit()
+        return item_id
+
+    @instrumented(rows=_result_rows)
+    def add_items(self, items):
+        """Add many items to database, logged and synced together; returns range of new IDs"""
+        if not self.__connected:
+            raise DatabaseError('Database not connected')
+        items = list(items)
+        with self.__lock:
+            _new_records(items)
+            self.__log([_encode_wal_entry('A', item_id, item_qty, json.dumps(item_name))
+                        for item_id, (item_name, item_qty) in enumerate(items, self.__memory.next_id)])
+            ids = self.__memory.add_items(items)
+            self.__commit()
+        return ids
+
+    @instrumented()
+    def apply_changes(self, items, operations):
+        """Apply a batch of changes atomically, logged as a transaction which is recovered whole or not at all"""
+        if not self.__connected:
+            raise DatabaseError('Database not connected')
+        items = list(items)
+        with self.__lock:
+            _new_records(items)
+            quantities = fold_quantities(operations, lambda item_id: self.__memory.query_by_id(item_id).Qty)
+            entries = [_encode_wal_entry('A', item_id, item_qty, json.dumps(item_name))
+                       for item_id, (item_name, item_qty) in enumerate(items, self.__memory.next_id)]
+            entries.extend(self.__quantity_entry(item_id, item_qty) for item_id, item_qty in quantities.items())
+            self.__log(entries, transaction=True)
+            ids = self.__memory.apply_changes(items, operations)
+            self.__commit()
+        return ids
+
+    @instrumented()
+    def undo(self):
+        """Reverts the last transaction, returns list of restored IDs"""
+        if not self.__connected:
+            raise DatabaseError('Database not connected')
+        with self.__lock:
+            self.__log([_encode_wal_entry('D', item_id) if record is None
+                        else _encode_wal_entry('A', item_id, record.Qty, json.dumps(record.Name))
+                        for item_id, record in self.__memory.peek_undo().items()], transaction=True)
+            ids = self.__memory.undo()
+            self.__commit()
+        return ids
+
+    @instrumented()
+    def edit_quantity(self, item_id, item_qty=0):
+        """Edit item quantity, 0 removes the item"""
+        if not self.__connected:
+            raise DatabaseError('Database not connected')
+        with self.__lock:
+            item_qty = self.__quantity(item_id, SET_QUANTITY, item_qty)
+            self.__log([self.__quantity_entry(item_id, item_qty)])
+            self.__memory.edit_quantity(item_id, item_qty)
+            self.__commit()
+
+    @instrumented()
+    def increment_quantity(self, item_id, delta):
+        """Atomically add delta to item quantity, returns the new quantity"""
+        if not self.__connected:
+            raise DatabaseError('Database not connected')
+        with self.__lock:
+            item_qty = self.__quantity(item_id, ADD_QUANTITY, delta)
+            self.__log([self.__quantity_entry(item_id, item_qty)])
+            self.__memory.edit_quantity(item_id, item_qty)
+            self.__commit()
+        return item_qty
+
+    def __quantity(self, item_id, operation, value):
+        """Validated quantity of item after SET_QUANTITY or ADD_QUANTITY, computed before it is logged"""
+        try:
+            return fold_quantities([(item_id, operation, value)],
+                                   lambda item_id: self.__memory.query_by_id(item_id).Qty)[item_id]
+        except DatabaseError:
+            raise DatabaseError('Invalid data, record not edited')
+
+    @staticmethod
+    def __quantity_entry(item_id, item_qty):
+        """Log entry setting quantity, 0 deletes the record"""
+        if item_qty == 0:
+            return _encode_wal_entry('D', item_id)
+        return _encode_wal_entry('E', item_id, item_qty)
@@ -0,0 +1,210 @@
+import inspect
+import json
+import os
+import threading
+from bisect import bisect_left
+from functools import wraps
+from time import perf_counter
+
+# Upper bounds of latency histogram buckets in seconds, slower calls fall into the +Inf bucket
+LATENCY_BUCKETS = (1e-6, 1e-5, 1e-4, 1e-3, 1e-2, 0.1, 1.0, 10.0)
+
+_enabled = os.environ.get('INSTRUMENTATION', '') not in ('', '0')
+_lock = threading.Lock()
+_metrics = {}   # name -> Metric
+_methods = []   # (class, attribute name, function, wrapper) of instrumented methods
+
+
+class Metric:
+    """Call count, latency histogram, rows and bytes of a single operation"""
+
+    __slots__ = ('count', 'seconds', 'rows', 'size', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.rows = 0
+        self.size = 0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def observe(self, seconds: float, rows: int = 0, size: int = 0):
+        self.count += 1
+        self.seconds += seconds
+        self.rows += rows
+        self.size += size
+        self.buckets[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+
+    def summary(self) -> dict:
+        """Metric as a JSON serializable dict, histogram counts are not cumulative"""
+        bounds = [f'{bound:g}' for bound in LATENCY_BUCKETS] + ['+Inf']
+        return {'Count': self.count,
+                'Seconds': self.seconds,
+                'Mean': self.seconds / self.count if self.count else 0.0,
+                'Rows': self.rows,
+                'Bytes': self.size,
+                'Histogram': dict(zip(bounds, self.buckets))}
+
+
+def enable():
+    """Starts recording metrics, can also be done with INSTRUMENTATION=1 environment variable"""
+    global _enabled
+    _enabled = True
+    for owner, name, _, wrapper in _methods:
+        setattr(owner, name, wrapper)
+
+
+def disable():
+    """Stops recording metrics, instrumented methods are restored to the plain functions"""
+    global _enabled
+    _enabled = False
+    for owner, name, function, _ in _methods:
+        setattr(owner, name, function)
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def reset():
+    """Removes all recorded metrics"""
+    with _lock:
+        _metrics.clear()
+
+
+def observe(name: str, seconds: float, rows: int = 0, size: int = 0):
+    """Records a single call of operation name"""
+    with _lock:
+        metric = _metrics.get(name)
+        if metric is None:
+            metric = _metrics[name] = Metric()
+        metric.observe(seconds, rows, size)
+
+
+class span:
+    """
+    Context manager measuring a block of code, rows and size can be set inside the block
+
+        with span('parser.load') as measured:
+            measured.rows = len(data)
+    """
+
+    __slots__ = ('name', 'rows', 'size', 'start')
+
+    def __init__(self, name: str):
+        self.name = name
+        self.rows = 0
+        self.size = 0
+
+    def __enter__(self):
+        if _enabled:
+            self.start = perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        if _enabled and hasattr(self, 'start'):
+            observe(self.name, perf_counter() - self.start, self.rows, self.size)
+
+
+def instrumented(name: str = None, rows=None, size=None):
+    """
+    Decorator recording every call of a function while instrumentation is enabled
+
+    Methods are swapped for the wrapper by enable() and back by disable(), so a disabled method
+    costs nothing. Plain functions only check a global flag when disabled. For generator functions
+    the time spent producing items is measured and every item counts as a row.
+
+    :param name: metric name, qualified name of the function by default
+    :param rows: function (result, *args, **kwargs) -> number of processed rows
+    :param size: function (result, *args, **kwargs) -> number of processed bytes
+    """
+    def decorate(function):
+        metric_name = name or function.__qualname__
+
+        if inspect.isgeneratorfunction(function):
+            @wraps(function)
+            def wrapper(*args, **kwargs):
+                generator = function(*args, **kwargs)
+                return _measured_iteration(metric_name, generator) if _enabled else generator
+        else:
+            @wraps(function)
+            def wrapper(*args, **kwargs):
+                if not _enabled:
+                    return function(*args, **kwargs)
+                start = perf_counter()
+                result = function(*args, **kwargs)
+                seconds = perf_counter() - start
+                observe(metric_name, seconds,
+                        rows(result, *args, **kwargs) if rows else 0,
+                        size(result, *args, **kwargs) if size else 0)
+                return result
+
+        owner_path = function.__qualname__.rpartition('.')[0]
+        if owner_path and not owner_path.endswith('<locals>'):     # defined in a class body
+            return _InstrumentedMethod(function, wrapper)
+        return wrapper
+    return decorate
+
+
+class _InstrumentedMethod:
+    """Placeholder left in a class body by instrumented, replaced by the function or its wrapper"""
+
+    def __init__(self, function, wrapper):
+        self.function = function
+        self.wrapper = wrapper
+
+    def __set_name__(self, owner, name):
+        _methods.append((owner, name, self.function, self.wrapper))
+        setattr(owner, name, self.wrapper if _enabled else self.function)
+
+
+def _measured_iteration(name, generator):
+    seconds = 0.0
+    count = 0
+    try:
+        while True:
+            start = perf_counter()
+            try:
+                item = next(generator)
+            except StopIteration:
+                seconds += perf_counter() - start
+                return
+            seconds += perf_counter() - start
+            count += 1
+            yield item
+    finally:
+        observe(name, seconds, count)
+
+
+def report() -> dict:
+    """All metrics as a JSON serializable dict, sorted by name"""
+    with _lock:
+        return {name: metric.summary() for name, metric in sorted(_metrics.items())}
+
+
+def prometheus_text(prefix: str = 'app') -> str:
+    """All metrics in Prometheus text exposition format"""
+    lines = [f'# TYPE {prefix}_operation_seconds histogram',
+             f'# TYPE {prefix}_operation_rows_total counter',
+             f'# TYPE {prefix}_operation_bytes_total counter']
+    with _lock:
+        for name, metric in sorted(_metrics.items()):
+            label = 'operation="' + name.replace('\\', '\\\\').replace('"', '\\"') + '"'
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + (None,), metric.buckets):
+                cumulative += count
+                le = '+Inf' if bound is None else f'{bound:g}'
+                lines.append(f'{prefix}_operation_seconds_bucket{{{label},le="{le}"}} {cumulative}')
+            lines.append(f'{prefix}_operation_seconds_sum{{{label}}} {metric.seconds!r}')
+            lines.append(f'{prefix}_operation_seconds_count{{{label}}} {metric.count}')
+            lines.append(f'{prefix}_operation_rows_total{{{label}}} {metric.rows}')
+            lines.append(f'{prefix}_operation_bytes_total{{{label}}} {metric.size}')
+    return '\n'.join(lines) + '\n'
+
+
+def write_report(path: str, prefix: str = 'app'):
+    """Writes metrics to path, in Prometheus text format for .prom and .txt files, as JSON otherwise"""
+    with open(path, 'w', encoding='utf-8') as f:
+        if path.endswith(('.prom', '.txt')):
+            f.write(prometheus_text(prefix))
+        else:
+            json.dump(report(), f, indent=2)
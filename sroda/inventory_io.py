@@ -0,0 +1,271 @@
+import csv
+import gzip
+import json
+import os
+import time
+from itertools import islice
+
+from zadanie_models import AbstractDB, DatabaseError
+
+
+class ImportReport:
+    """Summary of a bulk import"""
+
+    def __init__(self, max_errors=100):
+        """
+        :param max_errors: number of error messages kept, all errors are counted
+        """
+        self.rows = 0
+        self.added = 0
+        self.error_count = 0
+        self.errors = []    # (row number, message), at most max_errors entries
+        self.seconds = 0.0
+        self.__max_errors = max_errors
+
+    def add_error(self, row, msg):
+        self.error_count += 1
+        if len(self.errors) < self.__max_errors:
+            self.errors.append((row, msg))
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    def __str__(self):
+        lines = [f'Imported {self.added} of {self.rows} rows in {self.seconds:.2f} s '
+                 f'({self.rows_per_second:,.0f} rows/s), {self.error_count} errors']
+        lines.extend(f'  row {row}: {msg}' for row, msg in self.errors)
+        if self.error_count > len(self.errors):
+            lines.append(f'  ... {self.error_count - len(self.errors)} more')
+        return '\n'.join(lines)
+
+
+def _validate(item_name, item_qty):
+    """Returns cleaned (name, quantity) or raises ValueError with a message"""
+    if not isinstance(item_name, str) or not item_name.strip():
+        raise ValueError('Name must be a non-empty text')
+    if isinstance(item_qty, str):
+        item_qty = item_qty.strip()
+    if isinstance(item_qty, bool) or isinstance(item_qty, float):
+        raise ValueError(f'Quantity must be an integer, got {item_qty!r}')
+    try:
+        item_qty = int(item_qty)
+    except (ValueError, TypeError):
+        raise ValueError(f'Quantity must be an integer, got {item_qty!r}')
+    if item_qty <= 0:
+        raise ValueError('Quantity must be greater than 0')
+    return item_name.strip(), item_qty
+
+
+def import_rows(db: AbstractDB, rows, batch_size=10000, report=None) -> ImportReport:
+    """
+    Validates rows and inserts them into database in batches
+
+    Invalid rows are recorded in the report and skipped, the rest of the file is imported.
+
+    :param db: target database
+    :param rows: iterable of (row number, name, quantity, error message or None)
+    :param batch_size: number of items inserted with a single add_items call
+    :param report: report to fill, a new one by default
+    :return: ImportReport
+    """
+    report = report or ImportReport()
+    start = time.perf_counter()
+    batch, batch_rows = [], []
+
+    def flush():
+        try:
+            db.add_items(batch)
+            report.added += len(batch)
+        except DatabaseError as e:
+            for row in batch_rows:
+                report.add_error(row, e.msg)
+        batch.clear()
+        batch_rows.clear()
+
+    for row, item_name, item_qty, error in rows:
+        report.rows += 1
+        if error is None:
+            try:
+                batch.append(_validate(item_name, item_qty))
+                batch_rows.append(row)
+            except ValueError as e:
+                error = str(e)
+        if error is not None:
+            report.add_error(row, error)
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+
+    report.seconds = time.perf_counter() - start
+    return report
+
+
+def iter_csv_items(path):
+    """
+    Lazily reads items from csv file with name and quantity columns
+
+    A header row with 'Name' and 'Qty' columns (in any order, case insensitive) is optional.
+
+    :param path: path to csv file
+    :return: generator of (row number, name, quantity, error message or None)
+    """
+    with open(path, newline='', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        name_column, qty_column = 0, 1
+        for row_number, row in enumerate(reader, 1):
+            if not row:
+                continue
+            if row_number == 1:
+                header = [column.strip().lower() for column in row]
+                if 'name' in header and 'qty' in header:
+                    name_column, qty_column = header.index('name'), header.index('qty')
+                    continue
+            if len(row) <= max(name_column, qty_column):
+                yield row_number, None, None, f'Expected name and quantity, got {len(row)} columns'
+            else:
+                yield row_number, row[name_column], row[qty_column], None
+
+
+def _json_item(value):
+    """Extracts (name, quantity) from {'Name': ..., 'Qty': ...} object or [name, quantity] pair"""
+    if isinstance(value, dict):
+        keys = {key.lower(): key for key in value if isinstance(key, str)}
+        if 'name' in keys and 'qty' in keys:
+            return value[keys['name']], value[keys['qty']], None
+    elif isinstance(value, list) and len(value) == 2:
+        return value[0], value[1], None
+    return None, None, 'Expected {"Name": ..., "Qty": ...} object or [name, quantity] pair'
+
+
+def iter_json_items(path, chunk_size=1 << 16, max_item_size=1 << 20):
+    """
+    Lazily reads items from a JSON array or from JSON Lines file
+
+    The file is decoded incrementally, so only a single chunk is kept in memory. A file starting
+    with '[' followed by an object or a pair is an array, anything else is read as JSON Lines.
+    A malformed value ends an array, in JSON Lines the reader resumes at the next line.
+
+    :param path: path to json file
+    :param chunk_size: number of characters read at once
+    :param max_item_size: maximum size of a single item, larger values are reported as errors
+    :return: generator of (row number, name, quantity, error message or None)
+    """
+    decoder = json.JSONDecoder()
+    with open(path, encoding='utf-8') as f:
+        buffer, position, eof = '', 0, False
+        in_array = None     # decided by the first non-whitespace character
+        row_number = 0
+
+        def read_more():
+            nonlocal buffer, position, eof
+            chunk = f.read(chunk_size)
+            eof = not chunk
+            buffer, position = buffer[position:] + chunk, 0
+
+        while True:
+            while position < len(buffer) and (buffer[position].isspace() or (in_array and buffer[position] == ',')):
+                position += 1
+            if position >= len(buffer) - 1 and not eof:     # keep at least 2 characters to spot truncated values
+                read_more()
+                continue
+            if position >= len(buffer):
+                break
+            if in_array is None:
+                # an array holds objects or pairs, while a JSON Lines pair starts with the item name
+                first = len(buffer) - len(buffer[position + 1:].lstrip())
+                if first == len(buffer) and not eof:
+                    read_more()
+                    continue
+                in_array = buffer[position] == '[' and buffer[first:first + 1] in ('{', '[', ']', '')
+                position += in_array
+                continue
+            if in_array and buffer[position] == ']':
+                break
+
+            try:
+                value, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError as e:
+                if not eof and len(buffer) - position < max_item_size:
+                    read_more()
+                    continue
+                row_number += 1
+                yield row_number, None, None, f'Invalid JSON: {e.msg}'
+                next_line = buffer.find('\n', position)
+                if in_array or next_line == -1:
+                    break
+                position = next_line + 1
+                continue
+            if end == len(buffer) and not eof:      # e.g. a number split between chunks
+                read_more()
+                continue
+            row_number += 1
+            position = end
+            yield (row_number, *_json_item(value))
+
+
+def import_csv(db: AbstractDB, path, batch_size=10000) -> ImportReport:
+    """
+    Imports items from csv file, see iter_csv_items
+
+    :param db: target database
+    :param path: path to csv file
+    :param batch_size: number of items inserted at once
+    :return: ImportReport
+    """
+    return import_rows(db, iter_csv_items(path), batch_size)
+
+
+def import_json(db: AbstractDB, path, batch_size=10000) -> ImportReport:
+    """
+    Imports items from JSON array or JSON Lines file, see iter_json_items
+
+    :param db: target database
+    :param path: path to json file
+    :param batch_size: number of items inserted at once
+    :return: ImportReport
+    """
+    return import_rows(db, iter_json_items(path), batch_size)
+
+
+def export_csv(db: AbstractDB, path, compress=None, chunk_size=10000, snapshot=True) -> int:
+    """
+    Writes all items to csv file with ID, Name and Qty columns
+
+    Records are iterated lazily and written in chunks through a buffered file. The output is written
+    to a temporary file first, so an existing file is only replaced by a complete export. A snapshot
+    copies references to all records first (see iter_items of the handler), memory stays constant
+    only with snapshot=False, when nothing writes to the database during the export.
+
+    :param db: source database
+    :param path: path to output file
+    :param compress: gzip the output, by default when path ends with .gz
+    :param chunk_size: number of rows written at once
+    :param snapshot: export records as they were at the start, writes may continue meanwhile
+    :return: number of exported items
+    """
+    if compress is None:
+        compress = path.endswith('.gz')
+    items = db.iter_items(snapshot)
+    temp_path = path + '.tmp'
+    count = 0
+    if compress:
+        output = gzip.open(temp_path, 'wt', encoding='utf-8', newline='', compresslevel=6)
+    else:
+        output = open(temp_path, 'w', encoding='utf-8', newline='', buffering=1 << 20)
+    try:
+        with output as f:
+            writer = csv.writer(f)
+            writer.writerow(['ID', 'Name', 'Qty'])
+            while True:
+                chunk = [(item_id, record.Name, record.Qty) for item_id, record in islice(items, chunk_size)]
+                if not chunk:
+                    break
+                writer.writerows(chunk)
+                count += len(chunk)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    return count
@@ -0,0 +1,168 @@
+import argparse
+import asyncio
+import csv
+import io
+
+from zadanie_models import AbstractDB, DatabaseError, InMemoryDatabaseHandler
+
+# Line based protocol, one command per line, every response starts with OK or ERR:
+#   VIEW                -> OK <count>, followed by <count> lines: ID<tab>Name<tab>Qty
+#   GET <id>            -> OK ID<tab>Name<tab>Qty
+#   ADD <name>, <qty>   -> OK <new id>
+#   EDIT <id>, <qty>    -> OK <new qty>      set quantity
+#   EDIT <id>, +<n>     -> OK <new qty>      add to (or subtract from, with -<n>) quantity
+#   EDIT <id>           -> OK 0              remove item
+#   EXPORT              -> OK <count>, followed by <count> csv records: ID,Name,Qty
+#   QUIT                -> OK, connection is closed
+# Clients may send many commands without waiting, responses come back in the same order.
+# In VIEW and GET responses backslash, tab, carriage return and line feed in names are sent as \\, \t, \r
+# and \n. EXPORT quotes names like csv.writer, a quoted name may span lines.
+HELP = 'Commands: VIEW, GET <id>, ADD <name>, <qty>, EDIT <id>[, <qty>|+<n>|-<n>], EXPORT, QUIT'
+_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\r': '\\r', '\n': '\\n'})
+
+
+def escape_name(item_name) -> str:
+    """Name as a single tab separated field"""
+    return str(item_name).translate(_ESCAPES)
+
+
+class InventoryServer:
+    """Asyncio server exposing inventory operations of any AbstractDB over a socket"""
+
+    def __init__(self, db: AbstractDB):
+        self.__db = db
+        self.__server = None
+        self.__commands = {'VIEW': self.__view,
+                           'GET': self.__get,
+                           'ADD': self.__add,
+                           'EDIT': self.__edit,
+                           'EXPORT': self.__export}
+        self.clients = 0
+
+    def handle_command(self, line: str) -> str:
+        """
+        Executes a single command line.
+
+        :param line: command without the line end
+        :return: response, possibly many lines, without the final line end
+        """
+        command, _, arguments = line.strip().partition(' ')
+        handler = self.__commands.get(command.upper())
+        if handler is None:
+            return f'ERR Unknown command. {HELP}'
+        try:
+            return handler(arguments.strip())
+        except (ValueError, TypeError):
+            return f'ERR Invalid arguments. {HELP}'
+        except KeyError:
+            return 'ERR Item not found'
+        except DatabaseError as e:
+            return f'ERR {e.msg}'
+
+    def __view(self, arguments):
+        records = self.__db.query_all()
+        lines = [f'OK {len(records)}']
+        lines.extend(f'{item_id}\t{escape_name(record.Name)}\t{record.Qty}' for item_id, record in records.items())
+        return '\n'.join(lines)
+
+    def __export(self, arguments):
+        records = self.__db.query_all()
+        output = io.StringIO()
+        output.write(f'OK {len(records)}\n')
+        csv.writer(output, lineterminator='\n').writerows((item_id, record.Name, record.Qty)
+                                                          for item_id, record in records.items())
+        return output.getvalue()[:-1]
+
+    def __get(self, arguments):
+        item_id = int(arguments)
+        record = self.__db.query_by_id(item_id)
+        return f'OK {item_id}\t{escape_name(record.Name)}\t{record.Qty}'
+
+    def __add(self, arguments):
+        item_name, item_qty = arguments.rsplit(',', 1)
+        return f'OK {self.__db.add_item(item_name.strip(), int(item_qty))}'
+
+    def __edit(self, arguments):
+        item_id, _, item_qty = arguments.partition(',')
+        item_id = int(item_id)
+        item_qty = item_qty.strip()
+        if not item_qty:
+            self.__db.edit_quantity(item_id, 0)
+            return 'OK 0'
+        if item_qty[0] in '+-':
+            return f'OK {self.__db.increment_quantity(item_id, int(item_qty))}'
+        self.__db.edit_quantity(item_id, int(item_qty))
+        return f'OK {int(item_qty)}'
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Serves a single connection until QUIT or end of input"""
+        self.clients += 1
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                line = line.decode('utf-8', errors='replace')
+                if line.strip().upper() == 'QUIT':
+                    writer.write(b'OK\n')
+                    break
+                writer.write((self.handle_command(line) + '\n').encode('utf-8'))
+                # returns at once until the output buffer is full, so pipelined commands are not delayed
+                await writer.drain()
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.clients -= 1
+            writer.close()
+
+    async def start(self, host: str = '127.0.0.1', port: int = 8765, unix_path: str = None):
+        """Starts listening on TCP host:port, or on a Unix socket when unix_path is given"""
+        if unix_path:
+            self.__server = await asyncio.start_unix_server(self.handle_client, path=unix_path, limit=1 << 20)
+        else:
+            self.__server = await asyncio.start_server(self.handle_client, host, port, backlog=4096,
+                                                       limit=1 << 20)
+        return self.__server
+
+    @property
+    def port(self):
+        """Port of the first TCP socket, useful when started with port 0"""
+        return self.__server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self):
+        async with self.__server:
+            await self.__server.serve_forever()
+
+    async def stop(self):
+        self.__server.close()
+        await self.__server.wait_closed()
+
+
+async def run_server(db: AbstractDB, host: str = '127.0.0.1', port: int = 8765, unix_path: str = None):
+    """Starts server for db and serves until cancelled"""
+    server = InventoryServer(db)
+    await server.start(host, port, unix_path)
+    print(f'Inventory server listening on {unix_path or f"{host}:{server.port}"}')
+    await server.serve_forever()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Inventory server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', default=None, help='path of Unix socket, used instead of TCP')
+    parser.add_argument('--db', default=None, help='directory of a persistent database, in-memory demo data otherwise')
+    args = parser.parse_args()
+
+    if args.db:
+        from file_database import FileDatabaseHandler
+        db_handler = FileDatabaseHandler(args.db, verbose=False)
+    else:
+        db_handler = InMemoryDatabaseHandler(verbose=False)
+
+    with db_handler as db:
+        try:
+            asyncio.run(run_server(db, args.host, args.port, args.unix))
+        except KeyboardInterrupt:
+            pass
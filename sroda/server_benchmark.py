@@ -0,0 +1,78 @@
+import argparse
+import asyncio
+import multiprocessing
+import random
+import statistics
+import time
+
+from inventory_server import InventoryServer
+from db_benchmark import generate_inventory
+from zadanie_models import InMemoryDatabaseHandler
+
+
+def _serve(size: int, ready):
+    """Runs inventory server in a child process, sends its port through ready queue"""
+    async def main():
+        with InMemoryDatabaseHandler(generate_inventory(size), verbose=False) as db:
+            server = InventoryServer(db)
+            await server.start(port=0)
+            ready.put(server.port)
+            await server.serve_forever()
+    asyncio.run(main())
+
+
+async def _client(port: int, size: int, requests: int, pipeline: int, latencies: list, seed: int):
+    rng = random.Random(seed)
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    for window in range(0, requests, pipeline):
+        sent = []
+        for _ in range(min(pipeline, requests - window)):
+            item_id = rng.randint(1, size)
+            command = f'GET {item_id}\n' if rng.random() < 0.8 else f'EDIT {item_id}, +1\n'
+            writer.write(command.encode('utf-8'))
+            sent.append(time.perf_counter())
+        await writer.drain()
+        for started in sent:
+            await reader.readline()
+            latencies.append(time.perf_counter() - started)
+    writer.write(b'QUIT\n')
+    await reader.readline()
+    writer.close()
+
+
+async def _load(port: int, size: int, clients: int, requests: int, pipeline: int):
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*(_client(port, size, requests, pipeline, latencies, seed) for seed in range(clients)))
+    return time.perf_counter() - start, latencies
+
+
+def bench_server(size: int, clients: int, requests: int, pipeline: int):
+    """Starts server in a separate process and measures latency and throughput of concurrent clients"""
+    print(format(f' Server, {clients} clients, pipeline {pipeline} ', '-^60'))
+    ready = multiprocessing.Queue()
+    server = multiprocessing.Process(target=_serve, args=(size, ready), daemon=True)
+    server.start()
+    try:
+        port = ready.get(timeout=60)
+        seconds, latencies = asyncio.run(_load(port, size, clients, requests, pipeline))
+    finally:
+        server.terminate()
+        server.join()
+
+    quantiles = statistics.quantiles(latencies, n=100)
+    print('ops/s'.ljust(10) + f'{len(latencies) / seconds:,.0f}')
+    print('p50'.ljust(10) + f'{quantiles[49] * 1000:.2f} ms')
+    print('p99'.ljust(10) + f'{quantiles[98] * 1000:.2f} ms')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Inventory server load generator')
+    parser.add_argument('--size', type=int, default=100_000, help='number of records in the served database')
+    parser.add_argument('--clients', type=int, default=1000, help='number of concurrent connections')
+    parser.add_argument('--requests', type=int, default=100, help='requests sent by every client')
+    parser.add_argument('--pipeline', type=int, default=10, help='requests sent before waiting for responses')
+    args = parser.parse_args()
+
+    bench_server(args.size, args.clients, args.requests, 1)
+    bench_server(args.size, args.clients, args.requests, args.pipeline)
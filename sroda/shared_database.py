@@ -0,0 +1,824 @@
+import logging
+import os
+import stat
+import sys
+import tempfile
+import threading
+import time
+import weakref
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from contextlib import contextmanager, ExitStack
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from random import randint
+
+try:
+    import fcntl
+except ImportError:     # no POSIX record locks, the store cannot be used
+    fcntl = None
+
+from instrumentation import instrumented
+from zadanie_models import AbstractDB, ChangeEvent, ChangeFeed, DatabaseError, _result_rows, fold_quantities, \
+    InventoryItem, ITEM_ADDED, ITEM_DELETED, ITEM_EDITED, QTY_MAX
+
+MAGIC = int.from_bytes(b'SRODASHM', 'little')
+VERSION = 2
+LOCK_STRIPES = 64   # quantity edits of IDs with different remainders modulo LOCK_STRIPES run in parallel
+MAX_NAME_BYTES = 0xFFFF
+
+# Header of the segment, every field is an 8 byte integer
+_MAGIC, _VERSION, _CAPACITY, _NAME_TABLE_BYTES, _STRIPES, _USED, _LIVE, _NEXT_ID, _NAME_END, _SEQ, _HISTORY = range(11)
+HEADER_SIZE = 128
+_EVENT_FIELDS = 5   # sequence number, ID, name code, previous quantity and quantity, 0 for missing records
+
+_LOCK_FILES = {}    # lock file path -> [pid, file descriptor, thread locks, handlers using it]
+_LOCK_FILES_LOCK = threading.Lock()
+_TRACK_PARAMETER = sys.version_info >= (3, 13)     # SharedMemory(track=False) keeps the tracker out
+
+
+def _shared_memory(name, create=False, size=0):
+    """
+    Opens shared memory segment which is not registered in the resource tracker
+
+    A tracker unlinks registered segments when its process exits, which would remove the store
+    from under the other processes, so the store is only removed by unlink. Children started by
+    multiprocessing share the tracker of their parent, so every process registering a segment
+    would not keep the registrations balanced, none of them does.
+    """
+    if _TRACK_PARAMETER:
+        return SharedMemory(name, create, size, track=False)
+    shm = SharedMemory(name, create, size)
+    resource_tracker.unregister(shm._name, 'shared_memory')
+    return shm
+
+
+def _unlink(shm):
+    """Removes segment opened by _shared_memory"""
+    if not _TRACK_PARAMETER:
+        resource_tracker.register(shm._name, 'shared_memory')   # unlink unregisters the segment again
+    shm.unlink()
+
+
+def _close_segment(shm, views, lock_path):
+    """Releases views of the segment and closes it, SharedMemory cannot close a segment with live views"""
+    for view in views:
+        view.release()
+    shm.close()
+    _close_locks(lock_path)
+
+
+def _lock_directory():
+    """
+    Directory of lock files, private to the user like the segments, which SharedMemory creates with mode 0o600
+
+    XDG_RUNTIME_DIR is used when it is set, otherwise a directory named by the user ID in the temporary
+    directory. A directory which is not owned by the user or is accessible by others is refused.
+    """
+    directory = os.environ.get('XDG_RUNTIME_DIR') or os.path.join(tempfile.gettempdir(), f'sroda-{os.getuid()}')
+    try:
+        os.mkdir(directory, 0o700)
+    except FileExistsError:
+        pass
+    except OSError as e:
+        raise DatabaseError(f'Unable to create lock directory {directory}: {e}')
+    info = os.lstat(directory)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o077:
+        raise DatabaseError(f'Lock directory {directory} has to be owned by the current user with mode 0o700')
+    return directory
+
+
+class _RangeLock:
+    """Exclusive lock on one byte of the lock file, held by a single thread of a single process at a time"""
+
+    __slots__ = ('fd', 'offset', 'thread_lock')
+
+    def __init__(self, fd, offset, thread_lock):
+        self.fd = fd
+        self.offset = offset
+        self.thread_lock = thread_lock
+
+    def __enter__(self):
+        # record locks belong to the process, the thread lock keeps threads of the process apart
+        self.thread_lock.acquire()
+        try:
+            fcntl.lockf(self.fd, fcntl.LOCK_EX, 1, self.offset)
+        except BaseException:
+            self.thread_lock.release()
+            raise
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        fcntl.lockf(self.fd, fcntl.LOCK_UN, 1, self.offset)
+        self.thread_lock.release()
+
+
+def _open_locks(path, count):
+    """
+    Opens lock file shared by handlers of this process, returns its descriptor and count + 1 thread locks
+
+    Closing any descriptor of a file drops all record locks of the process on it, so one descriptor
+    is kept per process and closed by the last handler.
+    """
+    with _LOCK_FILES_LOCK:
+        entry = _LOCK_FILES.get(path)
+        if entry is None or entry[0] != os.getpid():    # descriptors and locks inherited by fork are not reused
+            fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_NOFOLLOW, 0o600)
+            entry = _LOCK_FILES[path] = [os.getpid(), fd, [threading.Lock() for _ in range(count + 1)], 0]
+        entry[3] += 1
+        return entry[1], entry[2]
+
+
+def _close_locks(path):
+    with _LOCK_FILES_LOCK:
+        entry = _LOCK_FILES.get(path)
+        if entry is None or entry[0] != os.getpid():
+            return
+        entry[3] -= 1
+        if not entry[3]:
+            os.close(entry[1])
+            del _LOCK_FILES[path]
+
+
+class SharedChangeFeed(ChangeFeed):
+    """
+    Change feed of a shared store, events of all processes attached to it are read from the segment
+
+    Writes append their events to a ring in the segment under one lock, so sequence numbers are
+    shared by all processes and events_since returns changes made by any of them. The ring keeps
+    the latest history events of the store, older sequence numbers raise DatabaseError and the
+    consumer should read all records again.
+
+    Subscribers are called by poll with events written since the last delivery, also by other
+    processes. A handler polls after every write of its own, other processes are not noticed
+    until then, so a consumer which only reads should call poll regularly. wait checks the ring
+    every poll_interval seconds.
+    """
+
+    def __init__(self, read_events, last_seq, poll_interval=0.01):
+        """
+        :param read_events: function returning events after a sequence number, with a limit
+        :param last_seq: function returning sequence number of the latest event
+        :param poll_interval: seconds between checks of the ring in wait
+        """
+        super().__init__(history=0)
+        self.__read_events = read_events
+        self.__last_seq = last_seq
+        self.poll_interval = poll_interval
+        self.__delivered = last_seq()   # subscribers get events after this sequence number
+        self.__tokens = set()           # of subscribers, without them poll reads no events
+        self.__poll_lock = threading.RLock()
+
+    @property
+    def last_seq(self):
+        """Sequence number of the latest event of the store, written by any process"""
+        return self.__last_seq()
+
+    def publish(self, changes):
+        raise DatabaseError('Changes of a shared store are published by writing them to the store')
+
+    def poll(self):
+        """
+        Calls subscribers with events written since the last delivery
+
+        :return: number of delivered events
+        """
+        with self.__poll_lock:
+            if not self.__tokens:
+                self.__delivered = self.last_seq
+                return 0
+            try:
+                events = self.events_since(self.__delivered)
+            except DatabaseError as e:
+                logging.warning(f'Change subscribers missed events: {e.msg}')
+                self.__delivered = self.last_seq
+                return 0
+            if events:
+                self.__delivered = events[-1].seq
+                self._deliver(events)
+            return len(events)
+
+    def subscribe(self, callback, since=None):
+        """
+        Calls callback(ChangeEvent) for every future change, delivered by poll
+
+        :param callback: function receiving ChangeEvent
+        :param since: sequence number, newer events from the ring are delivered first
+        :return: token for unsubscribe
+        """
+        with self.__poll_lock:
+            self.poll()
+            if since is not None:
+                for event in self.events_since(since, max(self.__delivered - since, 0)):
+                    callback(event)
+            token = super().subscribe(callback)
+            self.__tokens.add(token)
+            return token
+
+    def unsubscribe(self, token):
+        with self.__poll_lock:
+            self.__tokens.discard(token)
+            super().unsubscribe(token)
+
+    def events_since(self, seq, limit=None):
+        """
+        Events with sequence number greater than seq, written by any process
+
+        :param seq: last sequence number seen by the consumer, 0 for all events
+        :param limit: maximum number of returned events
+        :return: list of ChangeEvent, raises DatabaseError when some of them are no longer kept
+            or seq is newer than the latest event
+        """
+        return self.__read_events(seq, limit)
+
+    def wait(self, seq, timeout=None, limit=None):
+        """
+        Polls the ring until there are events newer than seq, then returns them
+
+        :param seq: last sequence number seen by the consumer
+        :param timeout: maximum number of seconds to wait, returns an empty list when it passes
+        :param limit: maximum number of returned events
+        :return: list of ChangeEvent, raises DatabaseError like events_since
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        events = self.events_since(seq, limit)
+        while not events and (deadline is None or time.monotonic() < deadline):
+            time.sleep(self.poll_interval)
+            events = self.events_since(seq, limit)
+        return events
+
+
+class SharedMemoryDatabaseHandler(AbstractDB):
+    """
+    Database storage in shared memory, based on AbstractDB, used by many processes at once
+
+    The segment holds a header, fixed-width record slots as three parallel arrays (IDs in ascending
+    order, name codes and quantities) and a name table. A name code is the offset of the name in the
+    table, every distinct name is stored once. IDs and names never change once written and a
+    quantity is a single 8 byte word, so reads take no lock and query_by_id reads the slot in place.
+
+    Writes are guarded by record locks of a lock file in a directory private to the user (see
+    _lock_directory): quantity edits lock one of LOCK_STRIPES stripes chosen by ID, adding items,
+    deleting them and transactions lock the header. Deleted records keep their slots with quantity 0,
+    the capacity is fixed when the store is created.
+    Every write also appends its events to the ring of SharedChangeFeed after the name table.
+
+    The process creating the store owns it, other processes attach by name. The store stays until
+    unlink is called, also when its owner exits. The change feed reports writes of all processes,
+    see SharedChangeFeed. POSIX only.
+    """
+
+    def __init__(self, records=None, next_id=None, verbose=True, capacity=None, name_table_bytes=None, name=None,
+                 history=65536):
+        """
+        Creates a new store
+
+        :param records: initial records as mapping of ID -> InventoryItem, demo items by default
+        :param next_id: next ID of the sequence, defaults to the highest record ID + 1
+        :param verbose: print status messages
+        :param capacity: maximum number of records ever added, twice the initial records by default
+        :param name_table_bytes: size of the name table, twice the initial names by default
+        :param name: name of the shared memory segment, a random one by default
+        :param history: number of change events kept in the store, 40 bytes each
+        """
+        super().__init__()
+        if fcntl is None:
+            raise DatabaseError('Shared memory database needs POSIX file locks')
+        if records is None:
+            records = {index: InventoryItem(value, randint(1, 5))
+                       for index, value in enumerate(['Box', 'Shoes', 'Hammer', 'Screwdriver'], 1)}
+        try:
+            records = sorted((item_id, self.__encoded(*record)) for item_id, record in records.items())
+        except (ValueError, TypeError):
+            raise DatabaseError('Invalid data, records not loaded')
+        names = {encoded: None for _, (encoded, _) in records}
+        capacity = capacity or max(2 * len(records), 1024)
+        name_table_bytes = name_table_bytes or max(2 * sum(len(encoded) + 2 for encoded in names), 1 << 16)
+        if len(records) > capacity or sum(len(encoded) + 2 for encoded in names) > name_table_bytes:
+            raise DatabaseError('Capacity too small for the records')
+        if history < 1:
+            raise DatabaseError('History must keep at least one event')
+
+        size = HEADER_SIZE + 24 * capacity + name_table_bytes + 8 * _EVENT_FIELDS * history
+        lock_directory = _lock_directory()
+        try:
+            shm = _shared_memory(name, create=True, size=size)
+        except FileExistsError:
+            raise DatabaseError(f'Shared memory {name} already exists')
+        header = shm.buf[:HEADER_SIZE].cast('q')
+        header[_CAPACITY] = capacity
+        header[_NAME_TABLE_BYTES] = name_table_bytes
+        header[_STRIPES] = LOCK_STRIPES
+        header[_HISTORY] = history
+        header.release()
+        self.__setup(shm, verbose, True, lock_directory)
+        self.__header[_NEXT_ID] = next_id or 1
+        for item_id, (encoded, item_qty) in records:
+            position = self.__header[_USED]
+            self.__ids[position] = item_id
+            self.__codes[position] = self.__code(encoded)
+            self.__qtys[position] = item_qty
+            self.__header[_USED] = position + 1
+            self.__header[_NEXT_ID] = max(self.__header[_NEXT_ID], item_id + 1)
+        self.__header[_LIVE] = len(records)
+        self.__header[_VERSION] = VERSION
+        self.__header[_MAGIC] = MAGIC     # written last, attaching fails until the store is complete
+
+    @classmethod
+    def attach(cls, name, verbose=True):
+        """
+        Attaches to a store created by another handler, possibly in another process
+
+        :param name: name of the store, see name property
+        :param verbose: print status messages
+        :return: SharedMemoryDatabaseHandler, raises DatabaseError when there is no such store
+        """
+        if fcntl is None:
+            raise DatabaseError('Shared memory database needs POSIX file locks')
+        handler = cls.__new__(cls)
+        AbstractDB.__init__(handler)
+        lock_directory = _lock_directory()
+        handler.__setup(handler.__open(name), verbose, False, lock_directory)
+        return handler
+
+    @classmethod
+    def attach_or_create(cls, name, verbose=True, timeout=1.0, **kwargs):
+        """
+        Attaches to store with given name, creates it when there is none
+
+        Another process may be creating the store at the same time, then attaching fails until the
+        store is complete and creating fails because the name is taken, so both are retried.
+
+        :param name: name of the store
+        :param verbose: print status messages
+        :param timeout: seconds spent retrying
+        :param kwargs: arguments of a created store, see __init__
+        :return: SharedMemoryDatabaseHandler, owner tells whether it was created,
+            raises DatabaseError when the store cannot be attached in time
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                return cls.attach(name, verbose)
+            except DatabaseError as e:
+                error = e
+            try:
+                return cls(verbose=verbose, name=name, **kwargs)
+            except DatabaseError:
+                if time.monotonic() >= deadline:
+                    raise error
+            time.sleep(0.01)
+
+    def __open(self, name):
+        try:
+            shm = _shared_memory(name)
+        except FileNotFoundError:
+            raise DatabaseError(f'Shared memory {name} does not exist')
+        header = shm.buf[:HEADER_SIZE].cast('q')
+        valid = header[_MAGIC] == MAGIC and header[_VERSION] == VERSION
+        header.release()
+        if not valid:
+            if not _TRACK_PARAMETER:
+                resource_tracker.register(shm._name, 'shared_memory')   # keeps the registration of its creator
+            shm.close()
+            raise DatabaseError(f'Shared memory {name} is not an inventory store')
+        return shm
+
+    def __setup(self, shm, verbose, owner, lock_directory):
+        self.__connected = False
+        self.__verbose = verbose
+        self.__owner = owner
+        self.__name = shm.name
+        self.__lock_path = os.path.join(lock_directory, f'{shm.name.lstrip("/")}.lock')
+        self.__map(shm)
+        self.changes = SharedChangeFeed(self.__events_since, self.__last_seq)
+
+    def __map(self, shm):
+        """
+        Creates views of the segment, opens lock file and resets the name cache. The segment is closed by
+        __unmap or, for a handler which is dropped while connected, when it is garbage collected.
+        """
+        self.__shm = shm
+        self.__header = shm.buf[:HEADER_SIZE].cast('q')
+        capacity, name_table_bytes = self.__header[_CAPACITY], self.__header[_NAME_TABLE_BYTES]
+        offset = HEADER_SIZE
+        self.__ids, self.__codes, self.__qtys = (shm.buf[offset + 8 * capacity * column:
+                                                         offset + 8 * capacity * (column + 1)].cast('q')
+                                                 for column in range(3))
+        self.__table = shm.buf[offset + 24 * capacity:offset + 24 * capacity + name_table_bytes]
+        offset += 24 * capacity + name_table_bytes
+        self.__events = shm.buf[offset:offset + 8 * _EVENT_FIELDS * self.__header[_HISTORY]].cast('q')
+        self.__names = {}       # code -> name, names are never changed so every process caches them
+        self.__name_codes = {}  # encoded name -> code
+        self.__names_end = 0    # end of the part of the name table read into the cache
+        fd, thread_locks = _open_locks(self.__lock_path, self.__header[_STRIPES] + 1)
+        self.__stripes = [_RangeLock(fd, stripe, thread_lock) for stripe, thread_lock in enumerate(thread_locks)]
+        self.__events_lock = self.__stripes.pop()
+        self.__meta_lock = self.__stripes.pop()
+        # a finalizer runs before the garbage collector breaks the cycle of the handler and its change feed,
+        # so the views are released before the segment, unlike with __del__
+        self.__close = weakref.finalize(self, _close_segment, shm, (self.__header, self.__ids, self.__codes,
+                                                                     self.__qtys, self.__table, self.__events),
+                                        self.__lock_path)
+
+    def __unmap(self):
+        if self.__shm is None:
+            return
+        self.__shm = None
+        self.__close()
+
+    def __reduce__(self):
+        """Handlers passed to other processes attach to the same store"""
+        return type(self).attach, (self.__name, self.__verbose)
+
+    def __enter__(self):
+        self.connect()
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.disconnect()
+
+    @property
+    def name(self):
+        """Name of the shared memory segment, used to attach other handlers"""
+        return self.__name
+
+    @property
+    def owner(self):
+        """True for the handler which created the store"""
+        return self.__owner
+
+    def connect(self):
+        """Connects to database, attaches to the segment again after disconnect"""
+        if self.__shm is None:
+            self.__map(self.__open(self.__name))
+        self.__connected = True
+        self.__message('DB connection established!')
+
+    def disconnect(self):
+        """Disconnects database and unmaps the segment, the store stays for other processes"""
+        self.__unmap()
+        self.__connected = False
+        self.__message('DB connection closed!')
+
+    def connected(self):
+        """Return database connection status (boolean value)"""
+        return self.__connected
+
+    def unlink(self):
+        """Removes the store, processes attached to it keep their mapping until they disconnect"""
+        shm = self.__shm or self.__open(self.__name)
+        _unlink(shm)
+        if shm is not self.__shm:
+            shm.close()
+        try:
+            os.remove(self.__lock_path)
+        except FileNotFoundError:
+            pass
+
+    @instrumented(rows=_result_rows)
+    def query_all(self):
+        """Get copy of all records"""
+        return OrderedDict(self.iter_items())
+
+    @instrumented()
+    def query_by_id(self, item_id):
+        """Get object with given ID, read from the slot without locking"""
+        if not self.__connected:
+            raise DatabaseError('Database not connected')
+        position = self.__position(item_id)
+        return InventoryItem(self.__name_of(self.__codes[position]), self.__qtys[position])
+
+    @instrumented()
+    def count(self):
+        """Number of records"""
+        if self.__connected:
+            return self.__header[_LIVE]
+        else:
+            raise DatabaseError('Database not connected')
+
+    @contextmanager
+    def columns(self):
+        """
+        Read-only views of IDs, name codes and quantities of all slots, nothing is copied
+
+            with db.columns() as (ids, codes, qtys):
+                total = sum(qtys)
+
+        Slots with quantity 0 are deleted records, name_of turns codes into names. The views are
+        released when the with block ends.
+
+        :return: context manager of (IDs, codes, quantities) as memoryviews of 8 byte integers
+        """
+        if not self.__connected:
+            raise DatabaseError('Database not connected')
+        used = self.__header[_USED]
+        views = tuple(column[:used].toreadonly() for column in (self.__ids, self.__codes, self.__qtys))
+        try:
+            yield views
+        finally:
+            for view in views:
+                view.release()
+
+    def name_of(self, code):
+        """Name with given code"""
+        return self.__name_of(code)
+
+    @instrumented()
+    def iter_items(self, snapshot=True):
+        """
+        Iterate (ID, record) pairs lazily
+
+        A snapshot copies the arrays, 24 bytes per record. Records are read one by one without
+        locks, so quantities edited during the copy may come from before or after the edit. Without
+        a snapshot the slots are read in place, the iterator raises DatabaseError after disconnect.
+
+        :param snapshot: iterate records as they were at the time of the call
+        :return: iterator of (ID, InventoryItem)
+        """
+        if not self.__connected:
+            raise DatabaseError('Database not connected')
+        used = self.__header[_USED]
+        if not snapshot:
+            return self.__iterate_slots(used)
+        ids, codes, qtys = (array('q', column[:used].tobytes()) for column in (self.__ids, self.__codes, self.__qtys))
+        return ((item_id, InventoryItem(self.__name_of(code), item_qty))
+                for item_id, code, item_qty in zip(ids, codes, qtys) if item_qty)
+
+    def __iterate_slots(self, used):
+        """Reads slots in place, holding no view of the segment between records"""
+        for position in range(used):
+            if self.__shm is None:
+                raise DatabaseError('Database not connected')
+            item_qty = self.__qtys[position]
+            if item_qty:
+                yield self.__ids[position], InventoryItem(self.__name_of(self.__codes[position]), item_qty)
+
+    @instrumented(rows=_result_rows)
+    def query_by_name(self, item_name):
+        """Get all records with given name (scan of the code array)"""
+        if not self.__connected:
+            raise DatabaseError('Database not connected')
+        try:
+            code = self.__name_codes.get(item_name.encode('utf-8'))
+        except AttributeError:
+            return OrderedDict()
+        if code is None:
+            self.__read_names()
+            code = self.__name_codes.get(item_name.encode('utf-8'))
+        used = self.__header[_USED]
+        return OrderedDict((item_id, InventoryItem(item_name, item_qty))
+                           for item_id, record_code, item_qty in zip(self.__ids[:used], self.__codes[:used],
+                                                                     self.__qtys[:used])
+                           if record_code == code and item_qty)
+
+    @instrumented(rows=_result_rows)
+    def query_by_qty_range(self, min_qty=None, max_qty=None):
+        """Get records with min_qty <= Qty <= max_qty sorted by quantity (scan of the quantity array)"""
+        if not self.__connected:
+            raise DatabaseError('Database not connected')
+        used = self.__header[_USED]
+        selected = [(item_qty, item_id, code)
+                    for item_id, code, item_qty in zip(self.__ids[:used], self.__codes[:used], self.__qtys[:used])
+                    if item_qty and (min_qty is None or item_qty >= min_qty)
+                    and (max_qty is None or item_qty <= max_qty)]
+        selected.sort(key=lambda row: row[:2])
+        return OrderedDict((item_id, InventoryItem(self.__name_of(code), item_qty))
+                           for item_qty, item_id, code in selected)
+
+    @property
+    def next_id(self):
+        """ID which will be given to the next added item"""
+        return self.__header[_NEXT_ID]
+
+    @instrumented()
+    def add_item(self, item_name, item_qty):
+        """Add item to database, returns its ID"""
+        return self.add_items([(item_name, item_qty)])[0]
+
+    @instrumented(rows=_result_rows)
+    def add_items(self, items):
+        """
+        Add many items to database in one call
+
+        Either all items are added or none of them.
+
+        :param items: iterable of (name, quantity) pairs
+        :return: range of new IDs
+        """
+        if not self.__connected:
+            raise DatabaseError('Database not connected')
+        try:
+            items = [(item_name, self.__encoded(item_name, item_qty)) for item_name, item_qty in items]
+        except (ValueError, TypeError):
+            raise DatabaseError('Invalid data, records not added')
+        with self.__meta_lock:
+            ids, events = self.__insert(items)
+            self.__record(events)
+        self.changes.poll()
+        return ids
+
+    @instrumented()
+    def apply_changes(self, items, operations):
+        """
+        Apply a batch of changes atomically, also between processes
+
+        The batch holds every stripe lock and the header lock, so it is validated and applied while no other
+        handler writes. A batch which fails validation changes nothing.
+
+        :param items: list of (name, quantity) pairs to add
+        :param operations: list of (ID, SET_QUANTITY or ADD_QUANTITY, value), quantity 0 removes the item
+        :return: range of IDs of added items
+        """
+        if not self.__connected:
+            raise DatabaseError('Database not connected')
+        try:
+            items = [(item_name, self.__encoded(item_name, item_qty)) for item_name, item_qty in items]
+        except (ValueError, TypeError):
+            raise DatabaseError('Invalid data, records not added')
+        with ExitStack() as locks:
+            for stripe in self.__stripes:   # in the order of offsets, edits lock a stripe before the header
+                locks.enter_context(stripe)
+            locks.enter_context(self.__meta_lock)
+            quantities = fold_quantities(operations, lambda item_id: self.__qtys[self.__position(item_id)])
+            for item_id, item_qty in quantities.items():
+                if not isinstance(item_qty, int) or not -QTY_MAX - 1 <= item_qty <= QTY_MAX:
+                    raise DatabaseError(f'Invalid data, quantity of item {item_id} is not a 64 bit integer, '
+                                        f'no changes applied')
+            ids, events = self.__insert(items)
+            for item_id, item_qty in quantities.items():
+                position = self.__position(item_id)
+                events.append((item_id, self.__codes[position], self.__qtys[position], item_qty))
+                self.__qtys[position] = item_qty
+                if item_qty == 0:
+                    self.__header[_LIVE] -= 1
+            self.__record(events)
+        self.changes.poll()
+        self.__message('Changes applied!')
+        return ids
+
+    def __insert(self, items):
+        """
+        Writes slots of (name, (encoded name, quantity)) pairs, returns their IDs and events; header lock has
+        to be held. Capacity and name table are checked before anything is written.
+        """
+        self.__read_names()
+        position = self.__header[_USED]
+        if position + len(items) > self.__header[_CAPACITY]:
+            raise DatabaseError('Shared memory database is full, records not added')
+        new_names = {encoded: None for _, (encoded, _) in items if encoded not in self.__name_codes}
+        if self.__header[_NAME_END] + sum(len(encoded) + 2 for encoded in new_names) > len(self.__table):
+            raise DatabaseError('Name table is full, records not added')
+        first_id = self.__header[_NEXT_ID]
+        ids = range(first_id, first_id + len(items))
+        events = []
+        for item_id, (_, (encoded, item_qty)) in zip(ids, items):
+            code = self.__code(encoded)
+            self.__ids[position] = item_id
+            self.__codes[position] = code
+            self.__qtys[position] = item_qty
+            events.append((item_id, code, 0, item_qty))
+            position += 1
+        self.__header[_NEXT_ID] = ids.stop
+        self.__header[_LIVE] += len(items)
+        self.__header[_USED] = position     # readers see the slots from now on
+        return ids, events
+
+    @instrumented()
+    def edit_quantity(self, item_id, item_qty=0):
+        """Edit item quantity in place, 0 removes the item"""
+        if not self.__connected:
+            raise DatabaseError('Database not connected')
+        try:
+            with self.__stripes[item_id % len(self.__stripes)]:
+                self.__set_quantity(self.__position(item_id), item_qty)
+        except (ValueError, TypeError, KeyError, OverflowError):
+            raise DatabaseError('Invalid data, record not edited')
+        self.changes.poll()
+
+    @instrumented()
+    def increment_quantity(self, item_id, delta):
+        """Atomically add delta to item quantity, also between processes; item is deleted when quantity drops to 0"""
+        if not self.__connected:
+            raise DatabaseError('Database not connected')
+        try:
+            with self.__stripes[item_id % len(self.__stripes)]:
+                position = self.__position(item_id)
+                item_qty = self.__qtys[position] + delta
+                self.__set_quantity(position, item_qty)
+        except (ValueError, TypeError, KeyError, OverflowError):
+            raise DatabaseError('Invalid data, record not edited')
+        self.changes.poll()
+        return item_qty
+
+    def __message(self, msg):
+        if self.__verbose:
+            print(msg)
+
+    @staticmethod
+    def __encoded(item_name, item_qty):
+        """(UTF-8 encoded name, quantity) of a valid record, raises ValueError or TypeError"""
+        encoded = item_name.encode('utf-8')
+        if len(encoded) > MAX_NAME_BYTES or not isinstance(item_qty, int) or not 0 < item_qty <= QTY_MAX:
+            raise ValueError('Invalid record')
+        return encoded, item_qty
+
+    def __read_names(self):
+        """Adds names written by other processes to the cache"""
+        end = self.__header[_NAME_END]
+        offset = self.__names_end
+        table = self.__table
+        while offset < end:
+            size = table[offset] | table[offset + 1] << 8
+            encoded = bytes(table[offset + 2:offset + 2 + size])
+            self.__names[offset] = encoded.decode('utf-8')
+            self.__name_codes[encoded] = offset
+            offset += 2 + size
+        self.__names_end = offset
+
+    def __name_of(self, code):
+        name = self.__names.get(code)
+        if name is None:
+            self.__read_names()     # the name table only grows, reading it needs no lock
+            name = self.__names[code]
+        return name
+
+    def __code(self, encoded):
+        """Code of encoded name, new names are appended to the table; header lock has to be held"""
+        code = self.__name_codes.get(encoded)
+        if code is None:
+            code = self.__header[_NAME_END]
+            self.__table[code:code + 2] = len(encoded).to_bytes(2, 'little')
+            self.__table[code + 2:code + 2 + len(encoded)] = encoded
+            self.__header[_NAME_END] = code + 2 + len(encoded)
+            self.__read_names()
+        return code
+
+    def __position(self, item_id):
+        """Index of a live record in the slots, raises KeyError"""
+        used = self.__header[_USED]
+        # IDs are appended from a sequence, so without gaps in the initial records the ID gives the slot
+        position = item_id - self.__ids[0] if used else 0
+        if not 0 <= position < used or self.__ids[position] != item_id:
+            position = bisect_left(self.__ids, item_id, 0, used)
+        if position == used or self.__ids[position] != item_id or not self.__qtys[position]:
+            raise KeyError(item_id)
+        return position
+
+    def __set_quantity(self, position, item_qty):
+        """Change quantity in place, 0 marks the record as deleted; stripe lock has to be held"""
+        if not isinstance(item_qty, int):
+            raise TypeError('Quantity must be an integer')
+        event = (self.__ids[position], self.__codes[position], self.__qtys[position], item_qty)
+        if item_qty == 0:
+            with self.__meta_lock:
+                self.__qtys[position] = 0
+                self.__header[_LIVE] -= 1
+                self.__record([event])
+        else:
+            self.__qtys[position] = item_qty
+            self.__record([event])
+        self.__message('Item deleted!' if item_qty == 0 else 'Item edited!')
+
+    def __record(self, events):
+        """Appends (ID, name code, previous quantity, quantity) events to the ring, in the order of the writes"""
+        ring = self.__events
+        history = self.__header[_HISTORY]
+        with self.__events_lock:
+            seq = self.__header[_SEQ]
+            for event in events:
+                seq += 1
+                slot = _EVENT_FIELDS * (seq % history)
+                ring[slot] = 0      # a reader of the overwritten event notices it is gone
+                ring[slot + 1:slot + _EVENT_FIELDS] = array('q', event)
+                ring[slot] = seq
+            self.__header[_SEQ] = seq     # readers see the events from now on
+
+    def __last_seq(self):
+        if self.__shm is None:
+            raise DatabaseError('Database not connected')
+        return self.__header[_SEQ]
+
+    def __events_since(self, seq, limit):
+        """Events after seq read from the ring without locking, see SharedChangeFeed.events_since"""
+        if not self.__connected:
+            raise DatabaseError('Database not connected')
+        last = self.__header[_SEQ]
+        history = self.__header[_HISTORY]
+        if seq > last:
+            raise DatabaseError(f'Sequence number {seq} is newer than the last event {last}')
+        if last - seq > history:
+            raise DatabaseError(f'Events after {seq} are no longer available, read all records again')
+        ring = self.__events
+        events = []
+        for event_seq in range(seq + 1, last + 1 if limit is None else min(last, seq + limit) + 1):
+            slot = _EVENT_FIELDS * (event_seq % history)
+            item_id, code, previous_qty, item_qty = ring[slot + 1:slot + _EVENT_FIELDS].tolist()
+            if ring[slot] != event_seq:     # overwritten by newer events while it was read
+                raise DatabaseError(f'Events after {seq} are no longer available, read all records again')
+            item_name = self.__name_of(code)
+            kind = ITEM_ADDED if not previous_qty else ITEM_DELETED if not item_qty else ITEM_EDITED
+            events.append(ChangeEvent(event_seq, kind, item_id,
+                                      InventoryItem(item_name, previous_qty) if previous_qty else None,
+                                      InventoryItem(item_name, item_qty) if item_qty else None))
+        return events
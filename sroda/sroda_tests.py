@@ -0,0 +1,719 @@
+import asyncio
+import csv
+import gc
+import gzip
+import instrumentation
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import unittest
+from multiprocessing.shared_memory import SharedMemory
+from inventory_io import export_csv, import_csv, import_json, iter_json_items
+from inventory_server import InventoryServer
+from table_view import render_table
+from compact_database import CompactDatabaseHandler
+from file_database import FileDatabaseHandler, SYNC_ALWAYS, SYNC_NEVER
+from shared_database import SharedMemoryDatabaseHandler
+from zadanie_models import AbstractDB, InMemoryDatabaseHandler, InventoryItem, DatabaseError, MenuHandler, State, \
+    ChangeFeed, ITEM_ADDED, ITEM_DELETED, ITEM_EDITED
+
+
+def increment_shared(db, item_ids, repeat):
+    """Increments quantities of a shared store from another process"""
+    with db:
+        for _ in range(repeat):
+            for item_id in item_ids:
+                db.increment_quantity(item_id, 1)
+
+
+def open_shared(name, owners):
+    """Attaches to or creates a shared store from another process, counts processes which created it"""
+    with SharedMemoryDatabaseHandler.attach_or_create(name, verbose=False) as db:
+        with owners.get_lock():
+            owners.value += db.owner
+
+
+class SrodaTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.db = InMemoryDatabaseHandler({1: InventoryItem('Box', 3),
+                                           2: InventoryItem('Hammer', 1),
+                                           3: InventoryItem('Box', 7)})
+        self.db.connect()
+
+    def tearDown(self):
+        self.db.disconnect()
+
+    def test_query_by_name(self):
+        with self.subTest(msg='Testing name index - existing name'):
+            assert list(self.db.query_by_name('Box')) == [1, 3]
+        with self.subTest(msg='Testing name index - missing name'):
+            assert len(self.db.query_by_name('Shoes')) == 0
+        with self.subTest(msg='Testing name index - after edits'):
+            self.db.add_item('Hammer', 4)
+            self.db.edit_quantity(2)
+            assert list(self.db.query_by_name('Hammer')) == [4]
+
+    def test_query_by_qty_range(self):
+        with self.subTest(msg='Testing qty index - range sorted by quantity'):
+            assert list(self.db.query_by_qty_range(1, 3)) == [2, 1]
+        with self.subTest(msg='Testing qty index - open ranges'):
+            assert list(self.db.query_by_qty_range(max_qty=3)) == [2, 1]
+            assert list(self.db.query_by_qty_range(min_qty=4)) == [3]
+        with self.subTest(msg='Testing qty index - after edit'):
+            self.db.edit_quantity(3, 2)
+            assert list(self.db.query_by_qty_range(max_qty=3)) == [2, 3, 1]
+            assert list(self.db.query_all()) == [1, 2, 3]
+        with self.subTest(msg='Testing qty index - same results as full scan'):
+            scan = super(InMemoryDatabaseHandler, self.db).query_by_qty_range
+            for bounds in [(None, None), (2, 2), (0, 10), (5, 1)]:
+                assert self.db.query_by_qty_range(*bounds) == scan(*bounds)
+
+    def test_query_page(self):
+        with self.subTest(msg='Testing pages - limit and offset'):
+            assert list(self.db.query_page(1, 1)) == [2]
+            assert list(self.db.query_page(1, sort_by='Qty', descending=True)) == [1, 2]
+            assert list(self.db.query_page(5, 2)) == []
+        with self.subTest(msg='Testing pages - same results as full scan'):
+            self.db.add_items([('Axe', 3), ('Box', 1)])
+            self.db.edit_quantity(2)
+            for sort_by in ('ID', 'Name', 'Qty'):
+                for descending in (False, True):
+                    for offset, limit in [(0, None), (0, 2), (1, 3), (3, 10)]:
+                        page = self.db.query_page(offset, limit, sort_by, descending)
+                        scan = AbstractDB.query_page(self.db, offset, limit, sort_by, descending)
+                        assert list(page.items()) == list(scan.items())
+        with self.subTest(msg='Testing pages - unknown order'):
+            self.assertRaises(DatabaseError, self.db.query_page, sort_by='Price')
+        with self.subTest(msg='Testing pages - rendered table'):
+            lines = render_table(self.db.query_page(0, 2, 'Name'), 0, self.db.count()).splitlines()
+            assert lines[2:] == ['4       Axe            3         ', '1       Box            3         ',
+                                 'Showing 1-2 of 4']
+
+    def test_invalid_data(self):
+        with self.subTest(msg='Testing add - invalid quantity'):
+            self.assertRaises(DatabaseError, self.db.add_item, 'Shoes', 0)
+            self.assertRaises(DatabaseError, self.db.add_item, 'Shoes', 'a')
+        with self.subTest(msg='Testing edit - missing item'):
+            self.assertRaises(DatabaseError, self.db.edit_quantity, 10, 1)
+        with self.subTest(msg='Testing indexes - unchanged after errors'):
+            assert list(self.db.query_by_qty_range()) == [2, 1, 3]
+        with self.subTest(msg='Testing query - disconnected database'):
+            self.db.disconnect()
+            self.assertRaises(DatabaseError, self.db.query_by_name, 'Box')
+
+    def test_id_allocation(self):
+        with self.subTest(msg='Testing add - returns next ID'):
+            assert self.db.add_item('Shoes', 1) == 4
+        with self.subTest(msg='Testing add - deleted IDs are not reused'):
+            self.db.edit_quantity(4)
+            assert self.db.add_item('Shoes', 1) == 5
+        with self.subTest(msg='Testing add - empty database'):
+            with InMemoryDatabaseHandler({}) as db:
+                assert db.add_item('Shoes', 1) == 1
+        with self.subTest(msg='Testing bulk add - continuous IDs'):
+            ids = self.db.add_items([('Saw', 2), ('Box', 1), ('Drill', 5)])
+            assert list(ids) == [6, 7, 8]
+            assert self.db.next_id == 9
+            assert list(self.db.query_by_name('Box')) == [1, 3, 7]
+            assert list(self.db.query_by_qty_range(max_qty=1)) == [2, 5, 7]
+        with self.subTest(msg='Testing bulk add - invalid item rejects whole batch'):
+            self.assertRaises(DatabaseError, self.db.add_items, [('Saw', 2), ('Box', 0)])
+            assert self.db.next_id == 9 and len(self.db.query_all()) == 7
+
+    def test_increment_quantity(self):
+        with self.subTest(msg='Testing increment - new quantity'):
+            assert self.db.increment_quantity(1, 2) == 5
+            assert self.db.increment_quantity(1, -1) == 4
+            assert list(self.db.query_by_qty_range(4, 4)) == [1]
+        with self.subTest(msg='Testing increment - item deleted at 0'):
+            self.db.increment_quantity(2, -1)
+            assert 2 not in self.db.query_all()
+        with self.subTest(msg='Testing increment - missing item'):
+            self.assertRaises(DatabaseError, self.db.increment_quantity, 10, 1)
+
+    def test_transaction(self):
+        with self.subTest(msg='Testing transaction - changes applied at the end'):
+            with self.db.transaction() as batch:
+                batch.add_item('Saw', 2)
+                batch.increment_quantity(1, 2)
+                batch.increment_quantity(1, -1)
+                batch.edit_quantity(2)
+                assert self.db.query_by_id(1).Qty == 3
+            assert batch.ids == range(4, 5)
+            assert dict(self.db.query_all()) == {1: InventoryItem('Box', 4), 3: InventoryItem('Box', 7),
+                                                 4: InventoryItem('Saw', 2)}
+        with self.subTest(msg='Testing transaction - nothing applied on errors'):
+            with self.assertRaises(DatabaseError):
+                with self.db.transaction() as batch:
+                    batch.edit_quantity(1, 10)
+                    batch.edit_quantity(2, 1)   # deleted before
+            with self.assertRaises(ZeroDivisionError):
+                with self.db.transaction() as batch:
+                    batch.edit_quantity(1, 10)
+                    1 / 0
+            assert self.db.query_by_id(1).Qty == 4 and self.db.next_id == 5
+        with self.subTest(msg='Testing transaction - undo'):
+            assert sorted(self.db.undo()) == [1, 2, 4]
+            assert dict(self.db.query_all()) == {1: InventoryItem('Box', 3), 2: InventoryItem('Hammer', 1),
+                                                 3: InventoryItem('Box', 7)}
+            assert list(self.db.query_page(sort_by='Name')) == [1, 3, 2]
+            self.assertRaises(DatabaseError, self.db.undo)
+        with self.subTest(msg='Testing transaction - large batch rebuilds index'):
+            with self.db.transaction() as batch:
+                for index in range(3000):
+                    batch.add_item(f'Item {index % 7}', index % 5 + 1)
+                batch.increment_quantity(3, -7)
+            scan = super(InMemoryDatabaseHandler, self.db).query_by_qty_range
+            assert self.db.query_by_qty_range() == scan() and self.db.count() == 3002
+            self.db.undo()
+            assert list(self.db.query_by_qty_range()) == [2, 1, 3]
+
+    def test_instrumentation(self):
+        plain_query = InMemoryDatabaseHandler.query_by_id
+        instrumentation.reset()
+        instrumentation.enable()
+        try:
+            self.db.query_by_id(1)
+            self.db.add_items([('Box', 1), ('Nail', 2)])
+            self.db.query_by_name('Box')
+            with self.subTest(msg='Testing instrumentation - wrapper installed when enabled'):
+                assert InMemoryDatabaseHandler.query_by_id is not plain_query
+        finally:
+            instrumentation.disable()
+        self.db.query_by_id(2)
+        report = instrumentation.report()
+        instrumentation.reset()
+        with self.subTest(msg='Testing instrumentation - plain methods when disabled'):
+            assert InMemoryDatabaseHandler.query_by_id is plain_query
+        with self.subTest(msg='Testing instrumentation - calls and rows'):
+            assert report['InMemoryDatabaseHandler.query_by_id']['Count'] == 1
+            assert report['InMemoryDatabaseHandler.add_items']['Rows'] == 2
+            assert report['InMemoryDatabaseHandler.query_by_name']['Rows'] == 3
+
+    def test_change_feed(self):
+        received, alerts = [], []
+        self.db.changes.subscribe(received.append)
+        self.db.changes.on_low_stock(2, alerts.append)
+        self.db.add_item('Saw', 5)
+        self.db.edit_quantity(3, 2)
+        self.db.increment_quantity(4, -5)
+        with self.db.transaction() as batch:
+            batch.add_item('Drill', 1)
+            batch.increment_quantity(1, 1)
+        self.db.undo()
+        with self.subTest(msg='Testing change feed - events in order'):
+            assert [(event.seq, event.kind, event.item_id) for event in received] == \
+                [(1, ITEM_ADDED, 4), (2, ITEM_EDITED, 3), (3, ITEM_DELETED, 4),
+                 (4, ITEM_EDITED, 1), (5, ITEM_ADDED, 5), (6, ITEM_EDITED, 1), (7, ITEM_DELETED, 5)]
+            assert received[1].previous == InventoryItem('Box', 7) and received[1].record == InventoryItem('Box', 2)
+        with self.subTest(msg='Testing change feed - low stock alerts'):
+            assert [event.item_id for event in alerts] == [3, 4]
+        with self.subTest(msg='Testing change feed - resume from sequence'):
+            assert self.db.changes.events_since(5) == received[5:]
+            assert self.db.changes.wait(7, timeout=0) == []
+            late = []
+            self.db.changes.subscribe(late.append, since=6)
+            assert late == received[6:]
+        with self.subTest(msg='Testing change feed - resume after history was dropped'):
+            feed = ChangeFeed(history=2)
+            feed.publish([(item_id, None, InventoryItem('Box', 1)) for item_id in range(1, 4)])
+            assert [event.seq for event in feed.events_since(1)] == [2, 3]
+            with self.assertRaises(DatabaseError):
+                feed.events_since(0)
+        with self.subTest(msg='Testing change feed - sequence from the future'):
+            with self.assertRaises(DatabaseError):
+                feed.events_since(4)
+            with self.assertRaises(DatabaseError):
+                feed.wait(4, timeout=0)
+        with self.subTest(msg='Testing change feed - compact store'):
+            with CompactDatabaseHandler({1: InventoryItem('Box', 3)}, verbose=False) as compact:
+                compact.changes.on_low_stock(2, alerts.append)
+                compact.edit_quantity(1, 1)
+            assert alerts[-1].item_id == 1 and alerts[-1].record == InventoryItem('Box', 1)
+
+    def test_concurrent_increments(self):
+        with InMemoryDatabaseHandler({1: InventoryItem('Box', 1)}, verbose=False, thread_safe=True) as db:
+            def worker():
+                for _ in range(2000):
+                    db.increment_quantity(1, 1)
+                    db.query_by_qty_range(max_qty=10)
+
+            threads = [threading.Thread(target=worker) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            assert db.query_by_id(1).Qty == 8001
+            assert list(db.query_by_qty_range()) == [1]
+
+
+class MenuHandlerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.db = InMemoryDatabaseHandler({1: InventoryItem('Box', 3), 2: InventoryItem('Hammer', 1)}, verbose=False)
+        self.db.connect()
+        self.menu = MenuHandler(self.db)
+
+    def test_run_script(self):
+        script = ['add', 'console', 'Saw, 4', 'Drill', '# comment', '', 'edit', '1, +2', '2', 'main', 'exit', 'view']
+        result = self.menu.run_script(script)
+        with self.subTest(msg='Testing script - commands applied'):
+            assert dict(self.db.query_all()) == {1: InventoryItem('Box', 5), 3: InventoryItem('Saw', 4)}
+        with self.subTest(msg='Testing script - rejected lines reported'):
+            assert result.commands == 9 and result.errors == [4]
+        with self.subTest(msg='Testing script - replay stops at exit'):
+            assert self.menu.exit_app()
+
+    def test_transitions(self):
+        with self.subTest(msg='Testing menu - actions of the current state only'):
+            self.menu.handle_option('edit')
+            self.menu.handle_option('view')
+            assert self.menu.state == State.INVALID
+            self.menu.handle_option(None)
+            assert self.menu.state == State.MAIN
+        with self.subTest(msg='Testing menu - view paging and sorting'):
+            self.menu.run_script(['view', 'sort qty desc', '>', 'sort price'])
+            assert self.menu.state == State.MAIN
+
+
+class CompactDatabaseTestCase(unittest.TestCase):
+
+    def setUp(self):
+        records = {item_id: InventoryItem(['Box', 'Hammer', 'Saw'][item_id % 3], item_id % 7 + 1)
+                   for item_id in range(1, 3001)}
+        self.db = CompactDatabaseHandler(records, verbose=False)
+        self.db.connect()
+        self.reference = InMemoryDatabaseHandler(records, verbose=False)
+        self.reference.connect()
+
+    def apply(self, operation, *args):
+        """Runs operation on both stores, returns both results"""
+        results = []
+        for db in (self.db, self.reference):
+            try:
+                results.append(getattr(db, operation)(*args))
+            except DatabaseError:
+                results.append(DatabaseError)
+        return results
+
+    def test_same_results_as_dict_store(self):
+        with self.subTest(msg='Testing compact store - edits'):
+            for item_id in range(1, 3200, 2):
+                result, expected = self.apply('increment_quantity', item_id, -3)
+                assert result == expected
+            assert self.apply('edit_quantity', 2, 'a')[0] is DatabaseError
+            self.assertRaises(DatabaseError, self.db.add_item, 'Drill', 1.5)    # only integer quantities
+        with self.subTest(msg='Testing compact store - quantities out of 64 bit range'):
+            next_id, records = self.db.next_id, self.db.query_all()
+            self.assertRaises(DatabaseError, self.db.add_item, 'Drill', 2 ** 70)
+            self.assertRaises(DatabaseError, self.db.add_items, [('Drill', 2), ('Saw', 2 ** 63)])
+            self.assertRaises(DatabaseError, self.db.edit_quantity, 2, 2 ** 63)
+            self.assertRaises(DatabaseError, self.db.increment_quantity, 2, 2 ** 63 - 1)
+            assert self.db.next_id == next_id and self.db.count() == len(records)
+            assert self.db.query_all() == records
+        with self.subTest(msg='Testing compact store - deleted records purged'):
+            for item_id in range(2, 3001, 2):
+                self.apply('edit_quantity', item_id, 0)
+            assert self.db.count() == self.reference.count()
+        with self.subTest(msg='Testing compact store - adds after purge'):
+            assert self.apply('add_items', [('Drill', 2), ('Box', 1)])[0] == range(3001, 3003)
+            assert self.db.query_by_id(3002) == InventoryItem('Box', 1)
+        with self.subTest(msg='Testing compact store - queries'):
+            assert self.db.query_all() == self.reference.query_all()
+            assert list(self.db.query_by_name('Box').items()) == list(self.reference.query_by_name('Box').items())
+            assert list(self.db.query_by_qty_range(2, 4)) == list(self.reference.query_by_qty_range(2, 4))
+            assert list(self.db.query_page(5, 10, 'ID', True)) == list(self.reference.query_page(5, 10, 'ID', True))
+        with self.subTest(msg='Testing compact store - snapshot ignores later writes'):
+            items = self.db.iter_items()
+            first_id, first = next(iter(self.reference.query_all().items()))
+            self.db.edit_quantity(first_id, first.Qty + 10)
+            assert next(items) == (first_id, first)
+        with self.subTest(msg='Testing compact store - transactions'):
+            self.reference.edit_quantity(first_id, first.Qty + 10)
+            assert self.apply('apply_changes', [('Drill', 2)], [(3001, 'add', 1), (3002, 'set', 0)]) == \
+                [range(3003, 3004)] * 2
+            result, expected = self.apply('apply_changes', [('Saw', 1)], [(3001, 'add', 1), (3002, 'add', 1)])
+            assert result is expected is DatabaseError
+            assert self.db.next_id == 3004 and self.db.query_all() == self.reference.query_all()
+
+
+class FileDatabaseTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = self.temp_dir.name
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def fill(self, db):
+        db.add_items([('Box', 3), ('Hammer', 1), ('Tab\tName', 5)])
+        db.edit_quantity(1, 7)
+        db.edit_quantity(2)
+        db.add_item('Shoes', 2)
+
+    def test_recovery_from_log(self):
+        with FileDatabaseHandler(self.path, sync=SYNC_ALWAYS, verbose=False) as db:
+            self.fill(db)
+            expected = dict(db.query_all())
+        with FileDatabaseHandler(self.path, verbose=False) as db:
+            with self.subTest(msg='Testing file db - records recovered'):
+                assert dict(db.query_all()) == expected
+            with self.subTest(msg='Testing file db - ID sequence recovered'):
+                assert db.add_item('Saw', 1) == 5
+            db.increment_quantity(5, 2)
+        with FileDatabaseHandler(self.path, verbose=False) as db:
+            with self.subTest(msg='Testing file db - increment recovered'):
+                assert db.query_by_id(5).Qty == 3
+
+    def test_recovery_from_snapshot(self):
+        with FileDatabaseHandler(self.path, snapshot_every=4, verbose=False) as db:
+            self.fill(db)
+            expected = dict(db.query_all())
+        with self.subTest(msg='Testing file db - log compacted'):
+            assert os.path.getsize(os.path.join(self.path, 'snapshot.db')) > 0
+            assert os.path.getsize(os.path.join(self.path, 'wal.log')) < 100
+        with FileDatabaseHandler(self.path, verbose=False) as db:
+            with self.subTest(msg='Testing file db - records recovered'):
+                assert dict(db.query_all()) == expected
+                assert list(db.query_by_name('Box')) == [1]
+
+    def test_recovery_of_transactions(self):
+        with FileDatabaseHandler(self.path, verbose=False) as db:
+            self.fill(db)
+            with db.transaction() as batch:
+                batch.add_item('Drill', 2)
+                batch.edit_quantity(1)
+                batch.increment_quantity(3, 1)
+            db.undo()
+            with db.transaction() as batch:
+                batch.edit_quantity(3)
+                batch.edit_quantity(4, 9)
+            expected = dict(db.query_all())
+        with FileDatabaseHandler(self.path, verbose=False) as db:
+            with self.subTest(msg='Testing file db - transactions and undo recovered'):
+                assert dict(db.query_all()) == expected
+                assert expected == {1: InventoryItem('Box', 7), 4: InventoryItem('Shoes', 9)}
+        with open(os.path.join(self.path, 'wal.log'), 'rb+') as wal:
+            wal.truncate(os.path.getsize(os.path.join(self.path, 'wal.log')) - 5)
+        with FileDatabaseHandler(self.path, verbose=False) as db:
+            with self.subTest(msg='Testing file db - torn transaction dropped whole'):
+                assert db.query_by_id(3) == InventoryItem('Tab\tName', 5)
+                assert db.query_by_id(4) == InventoryItem('Shoes', 2)
+
+    def test_log_written_first(self):
+        with FileDatabaseHandler(self.path, sync=SYNC_NEVER, verbose=False) as db:
+            self.fill(db)
+            wal_path = os.path.join(self.path, 'wal.log')
+            with self.subTest(msg='Testing file db - changes flushed to the log without sync'):
+                with FileDatabaseHandler(os.path.join(self.path, 'copy'), verbose=False) as copy:
+                    with open(wal_path, 'rb') as source, open(copy.wal_path, 'wb') as target:
+                        target.write(source.read())
+                with FileDatabaseHandler(os.path.join(self.path, 'copy'), verbose=False) as copy:
+                    assert copy.query_all() == db.query_all()
+            with self.subTest(msg='Testing file db - rejected changes not logged'):
+                size = os.path.getsize(wal_path)
+                self.assertRaises(DatabaseError, db.edit_quantity, 10, 1)
+                self.assertRaises(DatabaseError, db.increment_quantity, 1, 'a')
+                self.assertRaises(DatabaseError, db.add_items, [('Saw', 2), ('Drill', 0)])
+                self.assertRaises(DatabaseError, db.apply_changes, [('Saw', 2)], [(10, 'add', 1)])
+                self.assertRaises(DatabaseError, db.undo)
+                assert os.path.getsize(wal_path) == size
+                assert db.add_item('Saw', 1) == 5
+
+    def test_torn_log_tail(self):
+        with FileDatabaseHandler(self.path, verbose=False) as db:
+            self.fill(db)
+            expected = dict(db.query_all())
+        with open(os.path.join(self.path, 'wal.log'), 'ab') as wal:
+            wal.write(b'0000abcd\tA\t9\t1')
+        with FileDatabaseHandler(self.path, verbose=False) as db:
+            with self.subTest(msg='Testing file db - torn entry ignored'):
+                assert dict(db.query_all()) == expected
+            db.add_item('Saw', 1)
+        with FileDatabaseHandler(self.path, verbose=False) as db:
+            with self.subTest(msg='Testing file db - log usable after torn entry'):
+                assert db.query_by_id(5) == InventoryItem('Saw', 1)
+
+
+class SharedMemoryDatabaseTestCase(unittest.TestCase):
+
+    def setUp(self):
+        records = {1: InventoryItem('Box', 3), 2: InventoryItem('Hammer', 1), 3: InventoryItem('Box', 7)}
+        self.db = SharedMemoryDatabaseHandler(records, verbose=False, capacity=8)
+        self.db.connect()
+        self.reference = InMemoryDatabaseHandler(records, verbose=False)
+        self.reference.connect()
+
+    def tearDown(self):
+        self.db.disconnect()
+        self.db.unlink()
+
+    def test_same_results_as_dict_store(self):
+        for db in (self.db, self.reference):
+            db.add_items([('Saw', 4), ('Box', 1)])
+            db.increment_quantity(2, -1)
+            db.edit_quantity(3, 2)
+        with self.subTest(msg='Testing shared store - queries'):
+            assert self.db.query_all() == self.reference.query_all()
+            assert list(self.db.query_by_name('Box').items()) == list(self.reference.query_by_name('Box').items())
+            assert list(self.db.query_by_qty_range(2, 4)) == list(self.reference.query_by_qty_range(2, 4))
+            assert self.db.count() == 4 and self.db.next_id == 6
+        with self.subTest(msg='Testing shared store - zero-copy columns'):
+            with self.db.columns() as (ids, codes, qtys):
+                assert list(ids) == [1, 2, 3, 4, 5] and list(qtys) == [3, 0, 2, 4, 1]
+                assert self.db.name_of(codes[3]) == 'Saw'
+        with self.subTest(msg='Testing shared store - invalid data'):
+            self.assertRaises(DatabaseError, self.db.add_item, 'Drill', 1.5)
+            self.assertRaises(DatabaseError, self.db.edit_quantity, 2, 5)
+            self.assertRaises(DatabaseError, self.db.add_items, [('Drill', 1)] * 4)
+            assert self.db.count() == 4
+
+    def test_attached_handlers(self):
+        other = SharedMemoryDatabaseHandler.attach(self.db.name, verbose=False)
+        with other:
+            with self.subTest(msg='Testing shared store - writes visible to attached handler'):
+                self.db.add_item('Drill', 2)
+                assert other.query_by_id(4) == InventoryItem('Drill', 2)
+                other.edit_quantity(1)
+                assert self.db.count() == 3 and list(self.db.query_by_name('Box')) == [3]
+        with self.subTest(msg='Testing shared store - unknown name'):
+            self.assertRaises(DatabaseError, SharedMemoryDatabaseHandler.attach, self.db.name + '-missing')
+        with self.subTest(msg='Testing shared store - attach or create'):
+            attached = SharedMemoryDatabaseHandler.attach_or_create(self.db.name, verbose=False)
+            created = SharedMemoryDatabaseHandler.attach_or_create(self.db.name + '-new', verbose=False)
+            assert not attached.owner and created.owner and self.db.owner
+            attached.disconnect()
+            created.disconnect()
+            created.unlink()
+        with self.subTest(msg='Testing shared store - segment closed without errors'):
+            unraisable = []
+            hook, sys.unraisablehook = sys.unraisablehook, unraisable.append
+            try:
+                dropped = SharedMemoryDatabaseHandler.attach(self.db.name, verbose=False)
+                dropped.connect()
+                items = dropped.iter_items(snapshot=False)
+                next(items)
+                del dropped, items
+                gc.collect()    # the dropped handler closes its segment
+            finally:
+                sys.unraisablehook = hook
+            assert unraisable == []
+            other = SharedMemoryDatabaseHandler.attach(self.db.name, verbose=False)
+            other.connect()
+            items = other.iter_items(snapshot=False)
+            next(items)
+            other.disconnect()
+            self.assertRaises(DatabaseError, next, items)
+        with self.subTest(msg='Testing shared store - segment which is not a store'):
+            segment = SharedMemory(self.db.name + '-other', create=True, size=4096)
+            try:
+                with self.assertRaises(DatabaseError) as error:
+                    SharedMemoryDatabaseHandler.attach_or_create(segment.name, verbose=False, timeout=0.05)
+                assert 'not an inventory store' in error.exception.msg
+            finally:
+                segment.close()
+                segment.unlink()
+
+    def test_change_feed(self):
+        other = SharedMemoryDatabaseHandler.attach(self.db.name, verbose=False)
+        received, alerts = [], []
+        self.db.changes.subscribe(received.append)
+        self.db.changes.on_low_stock(1, alerts.append)
+        with other:
+            other.add_item('Drill', 2)
+            self.db.increment_quantity(4, -1)
+            other.edit_quantity(2)
+            with self.subTest(msg='Testing shared store - events of all processes share sequence numbers'):
+                assert other.changes.last_seq == self.db.changes.last_seq == 3
+                assert [(event.seq, event.kind, event.item_id) for event in self.db.changes.events_since(0)] == \
+                    [(1, ITEM_ADDED, 4), (2, ITEM_EDITED, 4), (3, ITEM_DELETED, 2)]
+                assert self.db.changes.events_since(1) == other.changes.events_since(1)
+        with self.subTest(msg='Testing shared store - subscribers get writes of other handlers on poll'):
+            assert [event.seq for event in received] == [1, 2]
+            assert self.db.changes.poll() == 1 and [event.seq for event in received] == [1, 2, 3]
+            assert [event.item_id for event in alerts] == [4]
+            assert received[1].previous == InventoryItem('Drill', 2) and received[1].record == InventoryItem('Drill', 1)
+        with self.subTest(msg='Testing shared store - wait for a write of another process'):
+            with other:
+                writer = threading.Timer(0.05, other.increment_quantity, (1, 1))
+                writer.start()
+                assert [event.record for event in self.db.changes.wait(3, timeout=5)] == [InventoryItem('Box', 4)]
+                writer.join()
+        with self.subTest(msg='Testing shared store - sequence numbers out of the ring'):
+            with self.assertRaises(DatabaseError):
+                self.db.changes.events_since(5)
+            with SharedMemoryDatabaseHandler(verbose=False, history=2) as small:
+                small.add_items([('Drill', 1)] * 3)
+                assert [event.seq for event in small.changes.events_since(1)] == [2, 3]
+                with self.assertRaises(DatabaseError):
+                    small.changes.events_since(0)
+            small.unlink()
+
+    def test_attach_or_create_race(self):
+        name = self.db.name + '-race'
+        owners = multiprocessing.Value('i', 0)
+        workers = [multiprocessing.Process(target=open_shared, args=(name, owners)) for _ in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        SharedMemoryDatabaseHandler.attach(name, verbose=False).unlink()
+        assert [worker.exitcode for worker in workers] == [0, 0, 0, 0] and owners.value == 1
+
+    def test_concurrent_processes(self):
+        workers = [multiprocessing.Process(target=increment_shared, args=(self.db, [2, 3, 4], 500))
+                   for _ in range(3)]
+        self.db.add_item('Drill', 1)
+        for worker in workers:
+            worker.start()
+        increment_shared(SharedMemoryDatabaseHandler.attach(self.db.name, verbose=False), [3, 4], 500)
+        for worker in workers:
+            worker.join()
+        assert [worker.exitcode for worker in workers] == [0, 0, 0]
+        assert [self.db.query_by_id(item_id).Qty for item_id in (2, 3, 4)] == [1501, 2007, 2001]
+        assert self.db.changes.last_seq == len(self.db.changes.events_since(0)) == 1 + 3 * 1500 + 1000
+
+
+    def test_concurrent_transactions(self):
+        worker = multiprocessing.Process(target=increment_shared, args=(self.db, [1], 2000))
+        worker.start()
+        transactions = 0
+        while worker.is_alive() or transactions < 20:     # transactions race the increments of the worker
+            with self.db.transaction() as batch:
+                for _ in range(100):
+                    batch.increment_quantity(1, 1)
+            transactions += 1
+        worker.join()
+        assert worker.exitcode == 0
+        assert self.db.query_by_id(1).Qty == 3 + 2000 + 100 * transactions
+        with self.subTest(msg='Testing shared store - failed transaction changes nothing'):
+            records, next_id, last_seq = self.db.query_all(), self.db.next_id, self.db.changes.last_seq
+            self.assertRaises(DatabaseError, self.db.apply_changes, [('Drill', 1)], [(2, 'add', 1), (10, 'add', 1)])
+            self.assertRaises(DatabaseError, self.db.apply_changes, [], [(2, 'add', 2 ** 63)])
+            assert self.db.query_all() == records
+            assert (self.db.next_id, self.db.changes.last_seq) == (next_id, last_seq)
+
+
+class InventoryIoTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.db = InMemoryDatabaseHandler({1: InventoryItem('Box', 3)}, verbose=False)
+        self.db.connect()
+
+    def tearDown(self):
+        self.db.disconnect()
+        self.temp_dir.cleanup()
+
+    def write(self, file_name, content):
+        path = os.path.join(self.temp_dir.name, file_name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        return path
+
+    def test_import_csv(self):
+        path = self.write('items.csv', 'Qty,Name\n2,Hammer\n0,Saw\nx,Drill\n5\n4,"Tape, red"\n')
+        report = import_csv(self.db, path, batch_size=1)
+        with self.subTest(msg='Testing csv import - valid rows added'):
+            assert report.rows == 5 and report.added == 2
+            assert self.db.query_by_id(2) == InventoryItem('Hammer', 2)
+            assert self.db.query_by_id(3) == InventoryItem('Tape, red', 4)
+        with self.subTest(msg='Testing csv import - errors with row numbers'):
+            assert [row for row, _ in report.errors] == [3, 4, 5]
+
+    def test_import_json(self):
+        with self.subTest(msg='Testing json import - array of objects and pairs'):
+            path = self.write('items.json', '[{"Name": "Hammer", "Qty": 2}, ["Saw", 12345], {"Name": "Drill"}]')
+            report = import_json(self.db, path)
+            assert report.added == 2 and [row for row, _ in report.errors] == [3]
+            assert list(self.db.query_by_name('Saw')) == [3]
+        with self.subTest(msg='Testing json import - values split between chunks'):
+            items = [{'Name': f'Item {i}', 'Qty': i + 1} for i in range(200)]
+            path = self.write('items.json', json.dumps(items))
+            read = [(name, qty) for _, name, qty, _ in iter_json_items(path, chunk_size=7)]
+            assert read == [(item['Name'], item['Qty']) for item in items]
+        with self.subTest(msg='Testing json import - JSON Lines resume after broken line'):
+            path = self.write('items.jsonl', '["Tape", 1]\n{"Name": \n["Wrench", 2.5]\n["Box", 4]\n')
+            report = import_json(self.db, path)
+            assert report.rows == 4 and report.added == 2
+            assert [row for row, _ in report.errors] == [2, 3]
+
+    def test_export_csv(self):
+        self.db.add_items([('Tape, red', 2), ('Saw', 5)])
+        with self.subTest(msg='Testing csv export - plain and gzip files'):
+            path = os.path.join(self.temp_dir.name, 'items.csv')
+            assert export_csv(self.db, path, chunk_size=2) == 3
+            with open(path, encoding='utf-8') as f:
+                content = f.read()
+            assert content.splitlines() == ['ID,Name,Qty', '1,Box,3', '2,"Tape, red",2', '3,Saw,5']
+            assert export_csv(self.db, path + '.gz') == 3
+            with gzip.open(path + '.gz', 'rt', encoding='utf-8') as f:
+                assert f.read() == content
+        with self.subTest(msg='Testing csv export - exported file can be imported'):
+            other = InMemoryDatabaseHandler({}, verbose=False)
+            other.connect()
+            assert import_csv(other, path).added == 3
+            assert list(other.query_all().values()) == list(self.db.query_all().values())
+        with self.subTest(msg='Testing iteration - snapshot ignores later writes'):
+            items = self.db.iter_items()
+            self.db.edit_quantity(1, 10)
+            self.db.edit_quantity(2)
+            self.db.add_item('Drill', 1)
+            assert list(items) == [(1, InventoryItem('Box', 3)), (2, InventoryItem('Tape, red', 2)),
+                                   (3, InventoryItem('Saw', 5))]
+
+
+class InventoryServerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.db = InMemoryDatabaseHandler({1: InventoryItem('Box', 3)}, verbose=False)
+        self.db.connect()
+        self.server = InventoryServer(self.db)
+
+    def test_commands(self):
+        with self.subTest(msg='Testing server - add and get'):
+            assert self.server.handle_command('ADD Hammer, 2') == 'OK 2'
+            assert self.server.handle_command('GET 2') == 'OK 2\tHammer\t2'
+        with self.subTest(msg='Testing server - edit'):
+            assert self.server.handle_command('EDIT 2, +5') == 'OK 7'
+            assert self.server.handle_command('EDIT 2, 1') == 'OK 1'
+            assert self.server.handle_command('EDIT 2') == 'OK 0'
+        with self.subTest(msg='Testing server - view and export'):
+            assert self.server.handle_command('VIEW') == 'OK 1\n1\tBox\t3'
+            assert self.server.handle_command('EXPORT') == 'OK 1\n1,Box,3'
+        with self.subTest(msg='Testing server - separators in names'):
+            self.db.add_item('Tab\tName', 1)
+            self.server.handle_command('ADD Nails, 10 pcs, 4')
+            assert self.server.handle_command('VIEW').split('\n')[2:] == ['3\tTab\\tName\t1', '4\tNails, 10 pcs\t4']
+            assert self.server.handle_command('GET 3') == 'OK 3\tTab\\tName\t1'
+            export = self.server.handle_command('EXPORT')
+            assert export == 'OK 3\n1,Box,3\n3,Tab\tName,1\n4,"Nails, 10 pcs",4'
+            assert list(csv.reader(export.split('\n')[1:]))[2] == ['4', 'Nails, 10 pcs', '4']
+        with self.subTest(msg='Testing server - errors'):
+            assert self.server.handle_command('GET 2') == 'ERR Item not found'
+            assert self.server.handle_command('ADD Hammer').startswith('ERR Invalid arguments')
+            assert self.server.handle_command('ADD Hammer, 0').startswith('ERR Invalid data')
+            assert self.server.handle_command('DROP').startswith('ERR Unknown command')
+
+    def test_pipelined_clients(self):
+        async def client():
+            reader, writer = await asyncio.open_connection('127.0.0.1', self.server.port)
+            writer.write(b''.join(b'EDIT 1, +1\n' for _ in range(50)) + b'QUIT\n')
+            responses = [await reader.readline() for _ in range(51)]
+            writer.close()
+            return responses
+
+        async def main():
+            await self.server.start(port=0)
+            results = await asyncio.gather(*(client() for _ in range(20)))
+            await self.server.stop()
+            return results
+
+        results = asyncio.run(main())
+        assert all(responses[-1] == b'OK\n' for responses in results)
+        assert self.db.query_by_id(1).Qty == 3 + 20 * 50
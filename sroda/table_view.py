@@ -0,0 +1,39 @@
+import sys
+
+# Column headers and their minimal widths
+COLUMNS = (('ID', 8), ('Name', 15), ('Quantity', 10))
+
+# Orders of (ID, item) pairs by column, ties are ordered by ID
+SORT_KEYS = {'ID': lambda item: item[0],
+             'Name': lambda item: (item[1].Name, item[0]),
+             'Qty': lambda item: (item[1].Qty, item[0])}
+
+
+def render_table(records, offset=0, total=None) -> str:
+    """
+    Formats records as a table with ID, Name and Quantity columns
+
+    Column widths are computed once for all rows, columns grow to fit the longest value.
+
+    :param records: mapping of ID -> item, e.g. a page from query_page, or iterable of (ID, item) pairs
+    :param offset: position of the first record, used in the footer
+    :param total: number of all records, adds a footer with the shown range
+    :return: table text ending with a new line
+    """
+    items = records.items() if hasattr(records, 'items') else records
+    rows = [(str(item_id), str(record.Name), str(record.Qty)) for item_id, record in items]
+    widths = [max(width, max((len(row[column]) + 1 for row in rows), default=0))
+              for column, (_, width) in enumerate(COLUMNS)]
+    line_format = ''.join(f'%-{width}s' for width in widths)
+
+    header = line_format % tuple(title for title, _ in COLUMNS)
+    lines = [header, len(header) * '-']
+    lines.extend(line_format % row for row in rows)
+    if total is not None:
+        lines.append(f'Showing {offset + 1 if rows else 0}-{offset + len(rows)} of {total}')
+    return '\n'.join(lines) + '\n'
+
+
+def print_table(records, offset=0, total=None, file=None):
+    """Writes the table from render_table with a single write"""
+    (file or sys.stdout).write(render_table(records, offset, total))
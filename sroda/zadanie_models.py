@@ -1,12 +1,27 @@
+import heapq
+import logging
+import threading
+import time
 from abc import ABC, abstractmethod
+from bisect import bisect_left, bisect_right, insort
+from contextlib import nullcontext
 from enum import Enum
-from collections import namedtuple, OrderedDict
+from collections import deque, namedtuple, OrderedDict
+from itertools import chain, islice, repeat
 from random import randint
 
+from instrumentation import instrumented
+from table_view import print_table, SORT_KEYS     # SORT_KEYS are the orders accepted by query_page
+
 # Class for holding record data
 InventoryItem = namedtuple('InventoryItem', 'Name Qty')
 
 
+def _result_rows(result, *args, **kwargs):
+    """Number of records returned by an instrumented query"""
+    return len(result)
+
+
 class DatabaseError(Exception):
     """Exception raised by database handler"""
     def __init__(self, msg):
@@ -16,11 +31,280 @@ class DatabaseError(Exception):
         return f'{self.__class__.__name__} - {self.msg}'
 
 
+class IdSequence:
+    """Monotonic allocator of record IDs, IDs are never reused"""
+
+    def __init__(self, next_id=1):
+        self.__next_id = next_id
+
+    @property
+    def next_id(self):
+        """ID which will be allocated next, store it to restore the sequence"""
+        return self.__next_id
+
+    def allocate(self):
+        """Allocate a single ID"""
+        item_id = self.__next_id
+        self.__next_id += 1
+        return item_id
+
+    def reserve(self, count):
+        """Allocate a continuous range of IDs"""
+        if count < 0:
+            raise ValueError('Count must not be negative!')
+        ids = range(self.__next_id, self.__next_id + count)
+        self.__next_id += count
+        return ids
+
+    def advance(self, item_id):
+        """Make sure that item_id will not be allocated again"""
+        if item_id >= self.__next_id:
+            self.__next_id = item_id + 1
+
+
+# Kinds of ChangeEvent
+ITEM_ADDED = 'add'
+ITEM_EDITED = 'edit'
+ITEM_DELETED = 'delete'
+
+# Change of a single record, previous and record are InventoryItem or None
+ChangeEvent = namedtuple('ChangeEvent', 'seq kind item_id previous record')
+
+SET_QUANTITY = 'set'
+ADD_QUANTITY = 'add'
+QTY_MAX = 2 ** 63 - 1   # stores keeping quantities in 64 bit integers accept -QTY_MAX - 1 to QTY_MAX
+# batches changing more index entries rebuild the quantity index instead of updating it entry by entry
+INDEX_REBUILD_THRESHOLD = 1000
+
+
+def fold_quantities(operations, current_quantity):
+    """
+    Computes final quantities of a batch of quantity operations
+
+    :param operations: iterable of (ID, SET_QUANTITY or ADD_QUANTITY, value)
+    :param current_quantity: function returning quantity of an ID before the batch, raises KeyError if missing
+    :return: dict of ID -> final quantity, 0 means deleted
+    """
+    quantities = {}
+    for item_id, operation, value in operations:
+        try:
+            item_qty = quantities[item_id] if item_id in quantities else current_quantity(item_id)
+        except KeyError:
+            raise DatabaseError(f'Invalid data, item {item_id} not found, no changes applied')
+        if item_qty == 0:
+            raise DatabaseError(f'Invalid data, item {item_id} deleted earlier in the batch, no changes applied')
+        try:
+            item_qty = value if operation == SET_QUANTITY else item_qty + value
+        except TypeError:
+            item_qty = None
+        if isinstance(item_qty, bool) or not isinstance(item_qty, (int, float)):
+            raise DatabaseError(f'Invalid data, quantity of item {item_id} is not a number, no changes applied')
+        quantities[item_id] = item_qty
+    return quantities
+
+
+def _new_records(items):
+    """Validated InventoryItem list of (name, quantity) pairs"""
+    try:
+        records = [InventoryItem(item_name, item_qty) for item_name, item_qty in items]
+        for record in records:
+            if record.Qty <= 0:
+                raise ValueError('Quantity must be greater than 0!')
+            hash(record.Name)
+    except (ValueError, TypeError):
+        raise DatabaseError('Invalid data, records not added')
+    return records
+
+
+class Transaction:
+    """
+    Changes collected in a with block and applied to database at once, see AbstractDB.transaction
+
+    Nothing is applied when the block raises. Stores of this package apply the changes atomically, a
+    DatabaseError while committing leaves them unchanged; see AbstractDB.apply_changes for other stores.
+    """
+
+    def __init__(self, db: 'AbstractDB'):
+        self.__db = db
+        self.__items = []           # (name, quantity) pairs to add
+        self.__operations = []      # (ID, SET_QUANTITY or ADD_QUANTITY, value)
+        self.ids = None             # IDs of added items, known after commit
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.rollback()
+
+    def __len__(self):
+        return len(self.__items) + len(self.__operations)
+
+    def add_item(self, item_name, item_qty):
+        self.__items.append((item_name, item_qty))
+
+    def edit_quantity(self, item_id, item_qty=0):
+        self.__operations.append((item_id, SET_QUANTITY, item_qty))
+
+    def increment_quantity(self, item_id, delta):
+        self.__operations.append((item_id, ADD_QUANTITY, delta))
+
+    def commit(self):
+        """Applies collected changes, returns IDs of added items"""
+        self.ids = self.__db.apply_changes(self.__items, self.__operations)
+        self.rollback()
+        return self.ids
+
+    def rollback(self):
+        """Discards collected changes"""
+        self.__items = []
+        self.__operations = []
+
+
+class ChangeFeed:
+    """
+    Stream of record changes of a database, every change gets the next sequence number
+
+    Consumers either subscribe a callback, or keep the last sequence number they have seen and ask
+    for newer events with events_since or wait. The most recent events are kept in memory, so a
+    consumer can resume from a sequence number unless it fell too far behind. Sequence numbers
+    start from 1 in every process.
+
+    Callbacks are called by the writer while the change is published, so they should be fast.
+    Exceptions raised by callbacks are logged and do not affect the write.
+    """
+
+    def __init__(self, history=100000):
+        """
+        :param history: number of recent events kept for events_since and wait
+        """
+        self.__events = deque(maxlen=history)
+        self.__seq = 0
+        self.__subscribers = {}     # token -> callback
+        self.__tokens = 0
+        self.__lock = threading.RLock()
+        self.__condition = threading.Condition(self.__lock)
+
+    @property
+    def last_seq(self):
+        """Sequence number of the latest event, 0 before the first one"""
+        return self.__seq
+
+    def publish(self, changes):
+        """
+        Publishes changes of records, called by database handlers
+
+        :param changes: iterable of (ID, previous record or None, new record or None)
+        :return: sequence number of the last event
+        """
+        with self.__lock:
+            for item_id, previous, record in changes:
+                kind = ITEM_ADDED if previous is None else ITEM_DELETED if record is None else ITEM_EDITED
+                self.__seq += 1
+                event = ChangeEvent(self.__seq, kind, item_id, previous, record)
+                self.__events.append(event)
+                for callback in self.__subscribers.values():
+                    try:
+                        callback(event)
+                    except Exception:
+                        logging.exception(f'Change subscriber failed on event {event.seq}')
+            self.__condition.notify_all()
+            return self.__seq
+
+    def _deliver(self, events):
+        """Calls subscribers with events published elsewhere and wakes up consumers in wait"""
+        with self.__lock:
+            for event in events:
+                for callback in self.__subscribers.values():
+                    try:
+                        callback(event)
+                    except Exception:
+                        logging.exception(f'Change subscriber failed on event {event.seq}')
+            self.__condition.notify_all()
+
+    def subscribe(self, callback, since=None):
+        """
+        Calls callback(ChangeEvent) for every future change
+
+        :param callback: function receiving ChangeEvent
+        :param since: sequence number, newer events from the history are delivered first
+        :return: token for unsubscribe
+        """
+        with self.__lock:
+            if since is not None:
+                for event in self.events_since(since):
+                    callback(event)
+            self.__tokens += 1
+            self.__subscribers[self.__tokens] = callback
+            return self.__tokens
+
+    def unsubscribe(self, token):
+        with self.__lock:
+            self.__subscribers.pop(token, None)
+
+    def on_low_stock(self, level, callback, item_ids=None):
+        """
+        Calls callback(ChangeEvent) when quantity of an item drops from above level to level or below
+
+        Removing an item counts as dropping to 0.
+
+        :param level: reorder level
+        :param callback: function receiving ChangeEvent
+        :param item_ids: watched IDs, all items by default
+        :return: token for unsubscribe
+        """
+        item_ids = None if item_ids is None else set(item_ids)
+
+        def watch(event):
+            if event.previous is None or event.previous.Qty <= level:
+                return
+            if (event.record is None or event.record.Qty <= level) and (item_ids is None or event.item_id in item_ids):
+                callback(event)
+        return self.subscribe(watch)
+
+    def events_since(self, seq, limit=None):
+        """
+        Events with sequence number greater than seq
+
+        :param seq: last sequence number seen by the consumer, 0 for all events
+        :param limit: maximum number of returned events
+        :return: list of ChangeEvent, raises DatabaseError when some of them are no longer kept
+            or seq was never published by this feed
+        """
+        with self.__lock:
+            if seq > self.__seq:
+                raise DatabaseError(f'Sequence number {seq} is newer than the last event {self.__seq}')
+            missing = self.__seq - seq
+            if missing > len(self.__events):
+                raise DatabaseError(f'Events after {seq} are no longer available, read all records again')
+            events = list(islice(reversed(self.__events), missing))
+        events.reverse()
+        return events if limit is None else events[:limit]
+
+    def wait(self, seq, timeout=None, limit=None):
+        """
+        Blocks until there are events newer than seq, then returns them
+
+        :param seq: last sequence number seen by the consumer
+        :param timeout: maximum number of seconds to wait, returns an empty list when it passes
+        :param limit: maximum number of returned events
+        :return: list of ChangeEvent, raises DatabaseError like events_since
+        """
+        with self.__condition:
+            if seq > self.__seq:
+                raise DatabaseError(f'Sequence number {seq} is newer than the last event {self.__seq}')
+            self.__condition.wait_for(lambda: self.__seq > seq, timeout)
+            return self.events_since(seq, limit)
+
+
 class AbstractDB(ABC):
     """Abstract class for db interface"""
 
     def __init__(self):
         self.__connected = False
+        self.changes = ChangeFeed()     # add, edit and delete events of records
 
     @abstractmethod
     def connected(self):
@@ -42,16 +326,139 @@ class AbstractDB(ABC):
     def edit_quantity(self, item_id, item_qty):
         pass
 
+    def increment_quantity(self, item_id, delta):
+        """
+        Add delta to item quantity (not atomic, override in thread-safe handlers)
+
+        :return: new quantity, item is deleted when it drops to 0
+        """
+        try:
+            item_qty = self.query_by_id(item_id).Qty + delta
+        except (KeyError, TypeError):
+            raise DatabaseError('Invalid data, record not edited')
+        self.edit_quantity(item_id, item_qty)
+        return item_qty
+
+    def iter_items(self, snapshot=True):
+        """
+        Iterate (ID, record) pairs of all records
+
+        A snapshot is a copy of the mapping of ID -> record, records themselves are shared. It needs
+        memory for every record, without snapshot memory stays constant.
+
+        :param snapshot: iterate records as they were at the time of the call, even if writes continue
+        :return: iterator of (ID, InventoryItem)
+        """
+        records = self.query_all()
+        return iter(dict(records).items() if snapshot else records.items())
+
+    def transaction(self):
+        """
+        Returns Transaction applying its changes at once when the with block ends
+
+            with db.transaction() as batch:
+                batch.add_item('Box', 3)
+                batch.increment_quantity(1, -2)
+        """
+        return Transaction(self)
+
+    def apply_changes(self, items, operations):
+        """
+        Apply a batch of changes with add_items and edit_quantity
+
+        Everything is validated before the first write, but the writes are separate calls: concurrent writes
+        may come in between and a failing write leaves the earlier ones applied. Stores override it with an
+        atomic version, all stores of this package do.
+
+        :param items: list of (name, quantity) pairs to add
+        :param operations: list of (ID, SET_QUANTITY or ADD_QUANTITY, value), quantity 0 removes the item
+        :return: IDs of added items
+        """
+        quantities = fold_quantities(operations, lambda item_id: self.query_by_id(item_id).Qty)
+        ids = self.add_items(items) if items else []
+        for item_id, item_qty in quantities.items():
+            self.edit_quantity(item_id, item_qty)
+        return ids
+
+    def undo(self):
+        """Reverts the last transaction"""
+        raise DatabaseError('Undo is not supported')
+
+    def add_items(self, items):
+        """
+        Add many items to database
+
+        :param items: iterable of (name, quantity) pairs
+        :return: list of new IDs
+        """
+        return [self.add_item(item_name, item_qty) for item_name, item_qty in items]
+
+    def count(self):
+        """Number of records"""
+        return len(self.query_all())
+
+    def query_page(self, offset=0, limit=None, sort_by='ID', descending=False):
+        """
+        Get records at positions offset to offset + limit in given order (full scan, override with indexes)
+
+        :param offset: number of records skipped
+        :param limit: maximum number of records, all remaining by default
+        :param sort_by: 'ID', 'Name' or 'Qty'
+        :param descending: reverse the order
+        :return: OrderedDict of ID -> InventoryItem
+        """
+        if sort_by not in SORT_KEYS:
+            raise DatabaseError(f'Unknown sort key {sort_by}')
+        records = self.query_all().items()
+        if limit is None:
+            return OrderedDict(sorted(records, key=SORT_KEYS[sort_by], reverse=descending)[offset:])
+        select = heapq.nlargest if descending else heapq.nsmallest
+        return OrderedDict(select(offset + limit, records, key=SORT_KEYS[sort_by])[offset:])
+
+    def query_by_name(self, item_name):
+        """Get all records with given name (full scan, override with an index)"""
+        return OrderedDict((item_id, record) for item_id, record in self.query_all().items()
+                           if record.Name == item_name)
+
+    def query_by_qty_range(self, min_qty=None, max_qty=None):
+        """Get records with min_qty <= Qty <= max_qty sorted by quantity (full scan, override with an index)"""
+        records = [(record.Qty, item_id, record) for item_id, record in self.query_all().items()
+                   if (min_qty is None or record.Qty >= min_qty) and (max_qty is None or record.Qty <= max_qty)]
+        return OrderedDict((item_id, record) for _, item_id, record in sorted(records, key=lambda r: r[:2]))
+
 
 class InMemoryDatabaseHandler(AbstractDB):
     """In-memory database storage, based on AbstractDB"""
 
-    def __init__(self):
+    def __init__(self, records=None, next_id=None, verbose=True, thread_safe=False, undo_depth=10):
+        """
+        :param records: initial records as mapping of ID -> InventoryItem, demo items by default
+        :param next_id: next ID of the sequence, defaults to the highest record ID + 1
+        :param verbose: print status messages
+        :param thread_safe: guard records and indexes with a lock, queries return copies
+        :param undo_depth: number of transactions which can be reverted with undo
+        """
         super().__init__()
         self.__connected = False
+        self.__journal = deque(maxlen=undo_depth)   # previous records touched by transactions, None if added
+        self.__verbose = verbose
+        self.__thread_safe = thread_safe
+        # every write touches the shared indexes, so a single lock protects the whole store
+        self.__lock = threading.RLock() if thread_safe else nullcontext()
         self.__records = OrderedDict()
-        for index, value in enumerate(['Box', 'Shoes', 'Hammer', 'Screwdriver'], 1):
-            self.__records[index] = InventoryItem(value, randint(1, 5))
+        self.__name_index = {}      # Name -> {ID: None}, ordered set of IDs
+        if records is None:
+            records = {index: InventoryItem(value, randint(1, 5))
+                       for index, value in enumerate(['Box', 'Shoes', 'Hammer', 'Screwdriver'], 1)}
+        self.__ids = IdSequence(next_id or 1)
+        # records are kept in ascending ID order, new IDs always come from the increasing sequence
+        for item_id, record in sorted(records.items(), key=SORT_KEYS['ID']):
+            record = InventoryItem(*record)
+            self.__records[item_id] = record
+            self.__name_index.setdefault(record.Name, {})[item_id] = None
+            self.__ids.advance(item_id)
+        # sorted list of (Qty, ID)
+        self.__qty_index = sorted((record.Qty, item_id) for item_id, record in self.__records.items())
 
     def __enter__(self):
         self.connect()
@@ -63,24 +470,29 @@ class InMemoryDatabaseHandler(AbstractDB):
     def connect(self):
         """Connects to database"""
         self.__connected = True
-        print('DB connection established!')
+        self.__message('DB connection established!')
 
     def disconnect(self):
         """Disconnects database"""
         self.__connected = False
-        print('DB connection closed!')
+        self.__message('DB connection closed!')
 
     def connected(self):
         """Return database connection status (boolean value)"""
         return self.__connected
 
+    @instrumented(rows=_result_rows)
     def query_all(self):
         """Get all records from database"""
         if self.__connected:
+            if self.__thread_safe:
+                with self.__lock:
+                    return OrderedDict(self.__records)
             return self.__records
         else:
             raise DatabaseError('Database not connected')
 
+    @instrumented()
     def query_by_id(self, item_id):
         """Get object with given ID"""
         if self.__connected:
@@ -88,29 +500,295 @@ class InMemoryDatabaseHandler(AbstractDB):
         else:
             raise DatabaseError('Database not connected')
 
+    @instrumented(rows=_result_rows)
+    def query_by_name(self, item_name):
+        """Get all records with given name"""
+        if self.__connected:
+            with self.__lock:
+                return OrderedDict((item_id, self.__records[item_id])
+                                   for item_id in self.__name_index.get(item_name, ()))
+        else:
+            raise DatabaseError('Database not connected')
+
+    @instrumented(rows=_result_rows)
+    def query_by_qty_range(self, min_qty=None, max_qty=None):
+        """Get records with min_qty <= Qty <= max_qty sorted by quantity"""
+        if self.__connected:
+            with self.__lock:
+                start = 0 if min_qty is None else bisect_left(self.__qty_index, (min_qty,))
+                end = (len(self.__qty_index) if max_qty is None
+                       else bisect_right(self.__qty_index, (max_qty, float('inf'))))
+                return OrderedDict((item_id, self.__records[item_id]) for _, item_id in self.__qty_index[start:end])
+        else:
+            raise DatabaseError('Database not connected')
+
+    @instrumented()
+    def iter_items(self, snapshot=True):
+        """
+        Iterate (ID, record) pairs lazily
+
+        Records are immutable, so a snapshot only copies references to them under the lock and writes
+        may continue while the snapshot is consumed. For 1M records the copy takes 40 MB (up to 70 MB
+        while it grows) and blocks writers for about 150 ms. Without snapshot the live
+        records are iterated in constant memory, but they must not change until the iteration ends.
+
+        :param snapshot: iterate records as they were at the time of the call
+        :return: iterator of (ID, InventoryItem)
+        """
+        if not self.__connected:
+            raise DatabaseError('Database not connected')
+        if snapshot:
+            with self.__lock:
+                return iter(dict(self.__records).items())
+        return iter(self.__records.items())
+
+    @instrumented()
+    def count(self):
+        """Number of records"""
+        if self.__connected:
+            return len(self.__records)
+        else:
+            raise DatabaseError('Database not connected')
+
+    @instrumented(rows=_result_rows)
+    def query_page(self, offset=0, limit=None, sort_by='ID', descending=False):
+        """
+        Get records at positions offset to offset + limit in given order
+
+        Pages are read from the ID ordered records, the quantity index and the name index,
+        so no records are sorted.
+
+        :param offset: number of records skipped
+        :param limit: maximum number of records, all remaining by default
+        :param sort_by: 'ID', 'Name' or 'Qty'
+        :param descending: reverse the order
+        :return: OrderedDict of ID -> InventoryItem
+        """
+        if sort_by not in SORT_KEYS:
+            raise DatabaseError(f'Unknown sort key {sort_by}')
+        if not self.__connected:
+            raise DatabaseError('Database not connected')
+        end = None if limit is None else offset + limit
+        with self.__lock:
+            if sort_by == 'Qty':
+                size = len(self.__qty_index)
+                if descending:
+                    start = 0 if end is None else max(size - end, 0)
+                    entries = reversed(self.__qty_index[start:max(size - offset, 0)])
+                else:
+                    entries = self.__qty_index[offset:end]
+                ids = [item_id for _, item_id in entries]
+            else:
+                if sort_by == 'ID':
+                    ordered = reversed(self.__records) if descending else iter(self.__records)
+                else:   # only distinct names are sorted, IDs of every name are already ordered
+                    names = sorted(self.__name_index, reverse=descending)
+                    ordered = chain.from_iterable(reversed(self.__name_index[name]) if descending
+                                                  else self.__name_index[name] for name in names)
+                ids = islice(ordered, offset, end)
+            return OrderedDict((item_id, self.__records[item_id]) for item_id in ids)
+
+    @property
+    def next_id(self):
+        """ID which will be given to the next added item"""
+        return self.__ids.next_id
+
+    @instrumented()
     def add_item(self, item_name, item_qty):
-        """Add item to database"""
+        """Add item to database, returns its ID"""
         try:
             if item_qty <= 0:
                 raise ValueError('Quantity must be greater than 0!')
-            self.__records[max(self.__records.keys()) + 1] = InventoryItem(item_name, item_qty)
+            hash(item_name)
         except (ValueError, TypeError):
             raise DatabaseError('Invalid data, record not added')
+        with self.__lock:
+            item_id = self.__ids.allocate()
+            record = InventoryItem(item_name, item_qty)
+            self.__insert(item_id, record)
+            self.changes.publish([(item_id, None, record)])
+        return item_id
+
+    @instrumented(rows=_result_rows)
+    def add_items(self, items):
+        """
+        Add many items to database in one call
+
+        Either all items are added or none of them.
+
+        :param items: iterable of (name, quantity) pairs
+        :return: range of new IDs
+        """
+        records = _new_records(items)
+        with self.__lock:
+            ids = self.__ids.reserve(len(records))
+            self.__records.update(zip(ids, records))
+            self.__qty_index.extend(zip((record.Qty for record in records), ids))
+            self.__qty_index.sort()     # existing entries form one sorted run, only new ones are sorted
+            for item_id, record in zip(ids, records):
+                self.__name_index.setdefault(record.Name, {})[item_id] = None
+            self.changes.publish(zip(ids, repeat(None), records))
+        return ids
 
+    @instrumented()
+    def apply_changes(self, items, operations):
+        """
+        Apply a batch of changes atomically
+
+        Everything is validated before the first write. Records and indexes are then updated under one
+        lock, the quantity index of a large batch is rebuilt once. Previous state of every touched record
+        goes to the undo journal.
+
+        :param items: list of (name, quantity) pairs to add
+        :param operations: list of (ID, SET_QUANTITY or ADD_QUANTITY, value), quantity 0 removes the item
+        :return: range of IDs of added items
+        """
+        if not self.__connected:
+            raise DatabaseError('Database not connected')
+        records = _new_records(items)
+        with self.__lock:
+            quantities = fold_quantities(operations, lambda item_id: self.__records[item_id].Qty)
+            ids = self.__ids.reserve(len(records))
+            journal = {item_id: self.__records[item_id] for item_id in quantities}
+            journal.update((item_id, None) for item_id in ids)
+            changes = {item_id: InventoryItem(self.__records[item_id].Name, item_qty) if item_qty != 0 else None
+                       for item_id, item_qty in quantities.items()}
+            changes.update(zip(ids, records))
+            self.__replace(changes)
+            self.__journal.append(journal)
+        self.__message('Changes applied!')
+        return ids
+
+    @instrumented()
+    def undo(self):
+        """
+        Reverts the last transaction, records it touched get back their previous state
+
+        :return: list of restored IDs
+        """
+        if not self.__connected:
+            raise DatabaseError('Database not connected')
+        with self.__lock:
+            if not self.__journal:
+                raise DatabaseError('Nothing to undo')
+            journal = self.__journal.pop()
+            self.__replace(journal)
+        self.__message('Changes reverted!')
+        return list(journal)
+
+    def peek_undo(self):
+        """
+        Records which undo would restore, without reverting them
+
+        :return: dict of ID -> InventoryItem, None for records which undo removes
+        """
+        with self.__lock:
+            if not self.__journal:
+                raise DatabaseError('Nothing to undo')
+            return dict(self.__journal[-1])
+
+    @instrumented()
     def edit_quantity(self, item_id, item_qty=0):
         """Edit item quantity"""
         try:
-            if item_qty == 0:
-                self.__records.pop(item_id)
-                print('Item deleted!')
-            else:
-                self.__records[item_id] = InventoryItem(
-                    self.__records[item_id].Name,
-                    item_qty)
-                print('Item edited!')
+            with self.__lock:
+                self.__set_quantity(item_id, item_qty)
         except (ValueError, TypeError, KeyError):
             raise DatabaseError('Invalid data, record not edited')
 
+    @instrumented()
+    def increment_quantity(self, item_id, delta):
+        """Atomically add delta to item quantity, item is deleted when quantity drops to 0"""
+        try:
+            with self.__lock:
+                item_qty = self.__records[item_id].Qty + delta
+                self.__set_quantity(item_id, item_qty)
+                return item_qty
+        except (ValueError, TypeError, KeyError):
+            raise DatabaseError('Invalid data, record not edited')
+
+    def __message(self, msg):
+        if self.__verbose:
+            print(msg)
+
+    def __replace(self, changes):
+        """Sets records to new values, None removes them; indexes are updated once; lock has to be held"""
+        removed, added = [], []
+        last_id = next(reversed(self.__records), None)
+        restored_names = set()      # names which got back a record with ID lower than the last one
+        events = []
+        for item_id, record in changes.items():
+            previous = self.__records.get(item_id)
+            if previous is not None or record is not None:
+                events.append((item_id, previous, record))
+            if previous is not None:
+                removed.append((previous.Qty, item_id))
+                if record is None or record.Name != previous.Name:
+                    ids = self.__name_index[previous.Name]
+                    del ids[item_id]
+                    if not ids:
+                        del self.__name_index[previous.Name]
+            if record is None:
+                self.__records.pop(item_id, None)
+                continue
+            if previous is None or record.Name != previous.Name:
+                self.__name_index.setdefault(record.Name, {})[item_id] = None
+                if previous is None and last_id is not None and item_id < last_id:
+                    restored_names.add(record.Name)
+            self.__records[item_id] = record
+            added.append((record.Qty, item_id))
+
+        if len(removed) + len(added) > INDEX_REBUILD_THRESHOLD:
+            removed = set(removed)
+            self.__qty_index = [entry for entry in self.__qty_index if entry not in removed]
+            self.__qty_index.extend(sorted(added))
+            self.__qty_index.sort()     # two sorted runs are merged
+        else:
+            for entry in removed:
+                del self.__qty_index[bisect_left(self.__qty_index, entry)]
+            for entry in added:
+                insort(self.__qty_index, entry)
+
+        if restored_names:  # keep records and name index in ascending ID order
+            records = sorted(self.__records.items(), key=SORT_KEYS['ID'])
+            self.__records.clear()
+            self.__records.update(records)
+            for item_name in restored_names:
+                self.__name_index[item_name] = dict.fromkeys(sorted(self.__name_index[item_name]))
+        self.changes.publish(events)
+
+    def __set_quantity(self, item_id, item_qty):
+        """Change quantity and update index, 0 removes the record; lock has to be held"""
+        if item_qty == 0:
+            previous = self.__remove(item_id)
+            self.changes.publish([(item_id, previous, None)])
+            self.__message('Item deleted!')
+        else:
+            previous = self.__records[item_id]
+            insort(self.__qty_index, (item_qty, item_id))
+            del self.__qty_index[bisect_left(self.__qty_index, (previous.Qty, item_id))]
+            record = self.__records[item_id] = InventoryItem(previous.Name, item_qty)
+            self.changes.publish([(item_id, previous, record)])
+            self.__message('Item edited!')
+
+    def __insert(self, item_id, record):
+        """Store record and add it to indexes"""
+        hash(record.Name)   # fail before any index is modified
+        insort(self.__qty_index, (record.Qty, item_id))
+        self.__records[item_id] = record
+        self.__name_index.setdefault(record.Name, {})[item_id] = None
+
+    def __remove(self, item_id):
+        """Remove record and its index entries, returns the removed record"""
+        record = self.__records.pop(item_id)
+        position = bisect_left(self.__qty_index, (record.Qty, item_id))
+        del self.__qty_index[position]
+        ids = self.__name_index[record.Name]
+        del ids[item_id]
+        if not ids:
+            del self.__name_index[record.Name]
+        return record
+
 
 class State(Enum):
     MAIN = 'main'
@@ -127,135 +805,182 @@ class State(Enum):
 
     def option_description(self):
         """Descriptions for each state"""
-        if self == State.MAIN:
-            return 'Go to main menu'
-        elif self == State.VIEW:
-            return 'View all items'
-        elif self == State.ADD:
-            return 'Add new item'
-        elif self == State.EDIT:
-            return 'Edit item'
-        elif self == State.ADD_CONSOLE:
-            return 'Provide item data in console'
-        elif self == State.ADD_JSON:
-            return 'Provide item data in json file'
-        elif self == State.ADD_CSV:
-            return 'Provide item data in csv file'
-        elif self == State.EXPORT_CSV:
-            return 'Exports data to csv'
-        elif self == State.EXIT:
-            return 'Exit app'
+        return OPTION_DESCRIPTIONS.get(self)
 
     def option_to_str(self):
         """Print option with its description"""
         return f'     - {self.value}'.ljust(15) + f'-> {self.option_description()}'
 
 
+OPTION_DESCRIPTIONS = {State.MAIN: 'Go to main menu',
+                       State.VIEW: 'View all items',
+                       State.ADD: 'Add new item',
+                       State.EDIT: 'Edit item',
+                       State.ADD_CONSOLE: 'Provide item data in console',
+                       State.ADD_JSON: 'Provide item data in json file',
+                       State.ADD_CSV: 'Provide item data in csv file',
+                       State.EXPORT_CSV: 'Exports data to csv',
+                       State.EXIT: 'Exit app'}
+
+# Menu of a single state: render prints it, actions are states reachable by their value, every other
+# entry goes to handler (None accepts only actions); targets maps action values to states
+Transition = namedtuple('Transition', 'render actions handler targets')
+
+# Result of MenuHandler.run_script, errors holds line numbers of rejected commands
+ScriptResult = namedtuple('ScriptResult', 'commands errors seconds')
+
+
 class MenuHandler:
     """Class handling user interaction and executing database queries"""
-    def __init__(self, db: AbstractDB = None):
+    def __init__(self, db: AbstractDB = None, page_size: int = 20):
+        """
+        :param db: database instance, can be provided later with connect_db
+        :param page_size: number of records shown on a single page of the view
+        """
         self.__state: State = State.MAIN
         self.__main_actions = [State.VIEW, State.ADD, State.EDIT, State.EXPORT_CSV, State.EXIT]
         self.__view_actions = [State.MAIN]
         self.__add_actions = [State.ADD_CONSOLE, State.ADD_JSON, State.ADD_CSV, State.MAIN]
         self.__add_item_actions = [State.MAIN]
         self.__edit_item_actions = [State.MAIN]
+        self.__export_actions = [State.MAIN]
+        self.__sort_options = {'id': 'ID', 'name': 'Name', 'qty': 'Qty'}
+        self.__transitions = {
+            State.MAIN: self.__transition(self.__menu_main_content, self.__main_actions),
+            State.VIEW: self.__transition(self.__menu_view_content, self.__view_actions, self.__handle_view),
+            State.ADD: self.__transition(self.__menu_add_content, self.__add_actions),
+            State.ADD_CONSOLE: self.__transition(self.__menu_add_console_content, self.__add_item_actions,
+                                                 self.__handle_add_console),
+            State.ADD_JSON: self.__transition(self.__menu_add_file_content, self.__add_item_actions,
+                                              self.__handle_import),
+            State.ADD_CSV: self.__transition(self.__menu_add_file_content, self.__add_item_actions,
+                                             self.__handle_import),
+            State.EDIT: self.__transition(self.__menu_edit_content, self.__edit_item_actions, self.__handle_edit),
+            State.EXPORT_CSV: self.__transition(self.__menu_export_content, self.__export_actions,
+                                                self.__handle_export),
+            State.INVALID: self.__transition(self.__invalid_entry_msg, [], self.__handle_invalid),
+        }
 
         self.__db = db
+        self.__page_size = page_size
+        self.__page_offset = 0
+        self.__sort_by = 'ID'
+        self.__descending = False
+
+    @staticmethod
+    def __transition(render, actions, handler=None):
+        return Transition(render, actions, handler, {action.value: action for action in actions})
 
     def connect_db(self, db: AbstractDB):
         """Provide a db instance to class"""
         self.__db = db
 
+    @property
+    def state(self):
+        return self.__state
+
     def exit_app(self):
         """Check for exit condition"""
-        if self.__state == State.EXIT:
-            return True
-        else:
-            return False
+        return self.__state == State.EXIT
 
     def print_user_menu(self):
-        if self.__state == State.MAIN:
-            self.__menu_main_content()
-        elif self.__state == State.VIEW:
-            self.__menu_view_content()
-        elif self.__state == State.ADD:
-            self.__menu_add_content()
-        elif self.__state == State.ADD_CONSOLE:
-            self.__menu_add_console_content()
-        elif self.__state == State.ADD_JSON or self.__state == State.ADD_CSV:
-            print('Not implemented, sorry :)')
-            self.__state = State.INVALID
-        elif self.__state == State.EXPORT_CSV:
-            print('Exporting data...')
-        elif self.__state == State.EDIT:
-            self.__menu_edit_content()
-        elif self.__state == State.INVALID:
-            self.__invalid_entry_msg()
+        """Shows menu of the current state and handles a single user entry"""
+        self.__transitions[self.__state].render()
+        option = input('Select option: >> ') if self.__state != State.INVALID else None
+        self.handle_option(option)
 
-        if self.__state != State.INVALID and self.__state != State.EXPORT_CSV:
-            option = input('Select option: >> ')
+    def handle_option(self, option):
+        """
+        Executes a single user entry in the current state
 
+        :param option: user entry, ignored in the INVALID state
+        """
+        transition = self.__transitions[self.__state]
         try:
-            if self.__state == State.MAIN:
-                if State(option) in self.__main_actions:
-                    self.__state = State(option)
-                else:
-                    self.__state = State.INVALID
-
-            elif self.__state == State.VIEW:
-                if State(option) in self.__view_actions:
-                    self.__state = State(option)
-                else:
-                    self.__state = State.INVALID
-
-            elif self.__state == State.ADD:
-                if State(option) in self.__add_actions:
-                    self.__state = State(option)
-                else:
-                    self.__state = State.INVALID
-
-            elif self.__state == State.ADD_CONSOLE:
-                if option.find(',') != -1:
-                    item_name, item_qty = option.split(',')
-                    self.__db.add_item(item_name, int(item_qty))
-                elif State(option) in self.__add_item_actions:
-                    self.__state = State(option)
-                else:
-                    self.__state = State.INVALID
-
-            elif self.__state == State.EDIT:
-                if option.find(',') != -1:
-                    item_id, item_qty = option.split(',')
-                    item_id = int(item_id.strip())
-                    item_qty = item_qty.strip()
-                    if item_qty.find('+') != -1 or item_qty.find('-') != -1:
-                        record = self.__db.query_by_id(item_id)
-                        self.__db.edit_quantity(item_id, record.Qty + int(item_qty))
-                    else:
-                        self.__db.edit_quantity(item_id, int(item_qty))
-                elif option.isnumeric():
-                    item_id = int(option.strip())
-                    self.__db.edit_quantity(item_id)
-                elif State(option) in self.__edit_item_actions:
-                    self.__state = State(option)
-                else:
-                    self.__state = State.INVALID
-
-            elif self.__state == State.EXPORT_CSV:
-                records = self.__db.query_all()
-                for item_id, record in records.items():
-                    print([item_id, record.Name, record.Qty])
-
-                self.__state = State.MAIN
-
-            elif self.__state == State.INVALID:
-                self.__state = State.MAIN
+            target = transition.targets.get(option)
+            if target is not None:
+                if target == State.VIEW:
+                    self.__page_offset = 0
+                self.__state = target
+            elif transition.handler is not None:
+                transition.handler(option)
+            else:
+                self.__state = State.INVALID
         except (ValueError, TypeError):
             self.__state = State.INVALID
         except DatabaseError as e:
             print(e)
             self.__state = State.INVALID
+        except OSError as e:
+            print(f'File error: {e}')
+            self.__state = State.INVALID
+
+    def run_script(self, lines):
+        """
+        Replays menu entries without rendering menus, e.g. from a file or sys.stdin
+
+        Empty lines and lines starting with # are skipped. A rejected entry returns to the main
+        menu like in the interactive mode, replay stops at exit.
+
+        :param lines: iterable of user entries
+        :return: ScriptResult
+        """
+        start = time.perf_counter()
+        commands = 0
+        errors = []
+        for line_number, line in enumerate(lines, 1):
+            option = line.rstrip('\r\n')
+            if not option.strip() or option.lstrip().startswith('#'):
+                continue
+            commands += 1
+            self.handle_option(option)
+            if self.__state == State.INVALID:
+                errors.append(line_number)
+                self.handle_option(None)
+            elif self.__state == State.EXIT:
+                break
+        return ScriptResult(commands, errors, time.perf_counter() - start)
+
+    def __handle_invalid(self, option):
+        self.__state = State.MAIN
+
+    def __handle_view(self, option):
+        if option == '>' or option == '<':
+            self.__turn_page(1 if option == '>' else -1)
+        elif option.startswith('sort'):
+            self.__set_order(option)
+        else:
+            raise ValueError(f'Invalid option {option}')
+
+    def __handle_add_console(self, option):
+        item_name, item_qty = option.split(',')
+        self.__db.add_item(item_name, int(item_qty))
+
+    def __handle_import(self, option):
+        from inventory_io import import_csv, import_json
+        importer = import_json if self.__state == State.ADD_JSON else import_csv
+        print(importer(self.__db, option.strip()))
+
+    def __handle_edit(self, option):
+        if option.find(',') != -1:
+            item_id, item_qty = option.split(',')
+            item_id = int(item_id.strip())
+            item_qty = item_qty.strip()
+            if item_qty.find('+') != -1 or item_qty.find('-') != -1:
+                self.__db.increment_quantity(item_id, int(item_qty))
+            else:
+                self.__db.edit_quantity(item_id, int(item_qty))
+        elif option.isnumeric():
+            self.__db.edit_quantity(int(option.strip()))
+        else:
+            raise ValueError(f'Invalid option {option}')
+
+    def __handle_export(self, option):
+        from inventory_io import export_csv
+        start = time.perf_counter()
+        count = export_csv(self.__db, option.strip())
+        print(f'Exported {count} items to {option.strip()} in {time.perf_counter() - start:.2f} s')
+        self.__state = State.MAIN
 
     def __invalid_entry_msg(self):
         print('User entry is not valid, going back to main menu...')
@@ -266,23 +991,34 @@ class MenuHandler:
         for action in self.__main_actions:
             print(action.option_to_str())
 
+    def __turn_page(self, step):
+        offset = self.__page_offset + step * self.__page_size
+        if 0 <= offset < self.__db.count():
+            self.__page_offset = offset
+
+    def __set_order(self, option):
+        """Handles 'sort <id|name|qty> [desc]' input"""
+        words = option.lower().split()
+        if len(words) not in (2, 3) or words[1] not in self.__sort_options or words[2:] not in ([], ['desc']):
+            raise ValueError(f'Invalid sort option {option}')
+        self.__sort_by = self.__sort_options[words[1]]
+        self.__descending = len(words) == 3
+        self.__page_offset = 0
+
     def __menu_view_content(self):
         try:
-            records: dict[str, InventoryItem] = self.__db.query_all()
+            total = self.__db.count()
+            records = self.__db.query_page(self.__page_offset, self.__page_size, self.__sort_by, self.__descending)
         except DatabaseError as e:
             print(e)
             self.__state = State.INVALID
             return
 
-        header = 'ID'.ljust(8) + 'Name'.ljust(15) + 'Quntity'.ljust(10)
-        print(header)
-        print(len(header) * '-')
-        for item_id, record in records.items():
-            item_line = str(item_id).ljust(8) + record.Name.ljust(15) + str(record.Qty).ljust(10)
-            print(item_line)
-
+        print_table(records, self.__page_offset, total)
         print('\n')
-        print('Select what you want to do:')
+        print('Input: > or < -> next or previous page\n'
+              'Input: sort qty -> sort by id, name or qty, add desc to reverse the order\n'
+              'Select what you want to do:')
         for action in self.__view_actions:
             print(action.option_to_str())
 
@@ -296,6 +1032,17 @@ class MenuHandler:
         for action in self.__add_item_actions:
             print(action.option_to_str())
 
+    def __menu_add_file_content(self):
+        file_type = 'json' if self.__state == State.ADD_JSON else 'csv'
+        print(f'Provide path to {file_type} file with item names and quantities or')
+        for action in self.__add_item_actions:
+            print(action.option_to_str())
+
+    def __menu_export_content(self):
+        print('Provide path of the csv file, files ending with .gz are compressed, or')
+        for action in self.__export_actions:
+            print(action.option_to_str())
+
     def __menu_edit_content(self):
         print('Select item you wish to edit by ID.\n'
               'Input: 3 -> removes ID 3 completely\n'
@@ -1,11 +1,60 @@
-from zadanie_models import MenuHandler, InMemoryDatabaseHandler
+import argparse
+import atexit
+import sys
+
+import instrumentation
+from compact_database import CompactDatabaseHandler
+from file_database import FileDatabaseHandler
+from shared_database import SharedMemoryDatabaseHandler
+from zadanie_models import DatabaseError, MenuHandler, InMemoryDatabaseHandler
 
 if __name__ == '__main__':
-    with InMemoryDatabaseHandler() as db:
+    parser = argparse.ArgumentParser(description='Inventory app')
+    parser.add_argument('directory', nargs='?', default=None,
+                        help='directory of a persistent database, in-memory demo data otherwise')
+    parser.add_argument('--script', default=None,
+                        help='file with menu entries replayed without menus, - reads standard input')
+    parser.add_argument('--compact', action='store_true', help='keep in-memory records in compact arrays')
+    parser.add_argument('--shared', default=None, metavar='NAME',
+                        help='use shared memory store NAME of other processes, created with demo data if missing')
+    parser.add_argument('--profile', default=None,
+                        help='write metrics of database calls to file, Prometheus text for .prom files, JSON otherwise')
+    args = parser.parse_args()
+
+    if args.profile:
+        instrumentation.enable()
+
+    verbose = args.script is None
+    if args.directory:
+        db_handler = FileDatabaseHandler(args.directory, verbose=verbose)
+    elif args.shared:
+        try:
+            db_handler = SharedMemoryDatabaseHandler.attach_or_create(args.shared, verbose=verbose)
+        except DatabaseError as e:
+            sys.exit(f'Unable to open shared store {args.shared}: {e.msg}')
+        if db_handler.owner:
+            atexit.register(db_handler.unlink)  # the store is removed when this process exits
+    elif args.compact:
+        db_handler = CompactDatabaseHandler(verbose=verbose)
+    else:
+        db_handler = InMemoryDatabaseHandler(verbose=verbose)
 
-        db.add_item('DummyItem', 3)     # add dummy object to test connection
+    with db_handler as db:
 
         user_menu = MenuHandler(db)     # user menu handler instance
 
-        while not user_menu.exit_app():
-            user_menu.print_user_menu()           # loop app until user exits
+        if args.script:
+            with (open(args.script, encoding='utf-8') if args.script != '-' else sys.stdin) as script:
+                result = user_menu.run_script(script)
+            rate = result.commands / result.seconds if result.seconds else 0.0
+            print(f'{result.commands} commands in {result.seconds:.2f} s ({rate:,.0f} commands/s), '
+                  f'{len(result.errors)} errors' + (f' in lines {result.errors[:10]}' if result.errors else ''))
+        else:
+            if not args.directory and not args.shared:
+                db.add_item('DummyItem', 3)     # add dummy object to test connection, stored data is left as it is
+
+            while not user_menu.exit_app():
+                user_menu.print_user_menu()           # loop app until user exits
+
+    if args.profile:
+        instrumentation.write_report(args.profile, 'inventory')
@@ -1,5 +1,7 @@
+import io
 import unittest
-from zadanie_wtorek import menu_main_handler, InventoryItem, OrderedDict, menu_add_handler, menu_edit_handler
+from zadanie_wtorek import menu_main_handler, InventoryItem, OrderedDict, menu_add_handler, menu_edit_handler, \
+    render_table, select_page, run_batch
 
 class WtorekTestCase(unittest.TestCase):
 
@@ -33,6 +35,12 @@ class WtorekTestCase(unittest.TestCase):
         with self.subTest(msg=f'Testing add menu - go back to main menu'):
             response = menu_add_handler('x', inventory_db)
             assert response == 'main'
+        with self.subTest(msg=f'Testing add menu - next ID'):
+            assert list(inventory_db) == [1, 2, 3]
+        with self.subTest(msg=f'Testing add menu - empty inventory'):
+            empty_db = OrderedDict()
+            menu_add_handler('Hammer, 2', empty_db)
+            assert list(empty_db) == [1]
 
     def test_edit_item(self):
         inventory_db = OrderedDict()
@@ -66,3 +74,36 @@ class WtorekTestCase(unittest.TestCase):
         with self.subTest(msg=f'Testing add menu - go back to main menu'):
             response = menu_edit_handler('x', inventory_db)
             assert response == 'main'
+
+    def test_list_page(self):
+        inventory_db = OrderedDict()
+        for item_id, (name, qty) in enumerate([('Saw', 3), ('Box', 1), ('Screwdriver set', 3), ('Axe', 2)], 1):
+            inventory_db[item_id] = InventoryItem(name, qty)
+
+        with self.subTest(msg=f'Testing list - limit and offset'):
+            assert [item_id for item_id, _ in select_page(inventory_db, 2, 1)] == [2, 3]
+            assert [item_id for item_id, _ in select_page(inventory_db, 2, 1, descending=True)] == [3, 2]
+        with self.subTest(msg=f'Testing list - sorted views'):
+            assert [item_id for item_id, _ in select_page(inventory_db, sort_by='Name')] == [4, 2, 1, 3]
+            assert [item_id for item_id, _ in select_page(inventory_db, 3, sort_by='Qty', descending=True)] == [3, 1, 4]
+        with self.subTest(msg=f'Testing list - columns fit the longest name'):
+            lines = render_table(select_page(inventory_db)).splitlines()
+            assert lines[0] == 'ID      Name            Quantity  '
+            assert lines[4] == '3       Screwdriver set 3         '
+
+    def test_run_batch(self):
+        inventory_db = OrderedDict()
+        inventory_db[1] = InventoryItem('Book', 3)
+        commands = ['2', 'Hammer, 2', '3', '1, +4', '3', '1,2,3', '7', '3', '2', '1', 'x', '2']
+
+        log = io.StringIO()
+        result = run_batch(commands, inventory_db, log=log)
+        with self.subTest(msg=f'Testing batch - entries applied'):
+            assert inventory_db == OrderedDict({1: InventoryItem('Book', 7)})
+        with self.subTest(msg=f'Testing batch - invalid entries reported'):
+            assert result.errors == [6, 7] and result.state == 'exit' and result.commands == 11
+        with self.subTest(msg=f'Testing batch - replay of the command log'):
+            replayed_db = OrderedDict()
+            replayed_db[1] = InventoryItem('Book', 3)
+            run_batch(io.StringIO(log.getvalue()), replayed_db)
+            assert replayed_db == inventory_db
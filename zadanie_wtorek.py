@@ -1,4 +1,9 @@
+import argparse
+import heapq
+import sys
+import time
 from collections import namedtuple, OrderedDict
+from itertools import islice
 from random import randint
 
 current_state = 'main'
@@ -9,18 +14,42 @@ for index, value in enumerate(['Box', 'Shoes', 'Hammer', 'Screwdriver'], 1):
     inventory_db[index] = InventoryItem(value, randint(1, 5))
 
 
-def list_all(inventory=None):
+# Column headers and their minimal widths
+COLUMNS = (('ID', 8), ('Name', 15), ('Quantity', 10))
+
+# Orders of (ID, item) pairs by column, ties are ordered by ID
+SORT_KEYS = {'ID': lambda item: item[0],
+             'Name': lambda item: (item[1].Name, item[0]),
+             'Qty': lambda item: (item[1].Qty, item[0])}
+
+
+def render_table(items) -> str:
+    """Formats (ID, item) pairs as a table, columns grow to fit the longest value"""
+    rows = [(str(item_id), str(item.Name), str(item.Qty)) for item_id, item in items]
+    widths = [max(width, max((len(row[column]) + 1 for row in rows), default=0))
+              for column, (_, width) in enumerate(COLUMNS)]
+    line_format = ''.join(f'%-{width}s' for width in widths)
+    header = line_format % tuple(title for title, _ in COLUMNS)
+    return '\n'.join([header, len(header) * '-'] + [line_format % row for row in rows]) + '\n'
+
+
+def select_page(inventory, limit=None, offset=0, sort_by='ID', descending=False):
+    """Returns list of (ID, item) at positions offset to offset + limit, IDs are kept in ascending order"""
+    end = None if limit is None else offset + limit
+    if sort_by == 'ID':
+        return list(islice(reversed(inventory.items()) if descending else inventory.items(), offset, end))
+    if end is None:
+        return sorted(inventory.items(), key=SORT_KEYS[sort_by], reverse=descending)[offset:]
+    select = heapq.nlargest if descending else heapq.nsmallest
+    return select(end, inventory.items(), key=SORT_KEYS[sort_by])[offset:]
+
+
+def list_all(inventory=None, limit=None, offset=0, sort_by='ID', descending=False):
     if inventory:
-        header = 'ID'.ljust(8) + 'Name'.ljust(15) + 'Quntity'.ljust(10)
-        print(header)
-        print(len(header) * '-')
-        for item_id, item in inventory.items():
-            item_line = str(item_id).ljust(8) + item.Name.ljust(15) + str(item.Qty).ljust(10)
-            print(item_line)
-        print('\n\n')
+        sys.stdout.write(render_table(select_page(inventory, limit, offset, sort_by, descending)) + '\n\n\n')
 
 
-def menu_main():
+def menu_main(inventory=None):
     print('Welcome to inventory app!\n'
           'Select what you want to do:\n'
           '1 - list all existing inventory\n'
@@ -29,28 +58,26 @@ def menu_main():
           'x - exit')
 
 
-def menu_main_handler(option: str, inventory=None):
-    if option == '1':
-        list_all(inventory)
-        new_state = 'main'
-    elif option == '2':
-        new_state = 'add'
-    elif option == '3':
-        new_state = 'edit'
-    elif option == 'x':
-        new_state = 'exit'
-    else:
-        new_state = 'inv'
+MAIN_TRANSITIONS = {'1': 'main', '2': 'add', '3': 'edit', 'x': 'exit'}
 
-    return new_state
+
+def menu_main_handler(option: str, inventory=None, verbose=True):
+    if option == '1' and verbose:
+        list_all(inventory)
+    return MAIN_TRANSITIONS.get(option, 'inv')
 
 
-def menu_add():
+def menu_add(inventory=None):
     print('Insert name nad quantity separated with a comma (,)\n'
           'or press x to go back')
 
 
-def menu_add_handler(option, inventory):
+def next_item_id(inventory):
+    """IDs are added in ascending order, so the last key is the highest one"""
+    return next(reversed(inventory), 0) + 1
+
+
+def menu_add_handler(option, inventory, verbose=True):
     new_item = option.split(',')
     if option == 'x':
         new_state = 'main'
@@ -58,9 +85,10 @@ def menu_add_handler(option, inventory):
         new_state = 'inv'
     else:
         try:
-            inventory[max(inventory_db.keys()) + 1] = InventoryItem(new_item[0].strip(), int(new_item[1]))
+            inventory[next_item_id(inventory)] = InventoryItem(new_item[0].strip(), int(new_item[1]))
 
-            print('Item added!\n')
+            if verbose:
+                print('Item added!\n')
             new_state = 'main'
         except (TypeError, ValueError):
             new_state = 'inv'
@@ -68,8 +96,8 @@ def menu_add_handler(option, inventory):
     return new_state
 
 
-def menu_edit():
-    list_all(inventory_db)
+def menu_edit(inventory=None):
+    list_all(inventory_db if inventory is None else inventory)
     print('Select item you wish to remove by ID.\n'
           'Input: 3 -> removes ID 3 completely\n'
           'Input: 3, -1 -> substrate 1 from item 3 quantity\n'
@@ -78,7 +106,7 @@ def menu_edit():
           'Input: x -> go back to main menu')
 
 
-def menu_edit_handler(option, inventory):
+def menu_edit_handler(option, inventory, verbose=True):
     if option == 'x':
         new_state = 'main'
     else:
@@ -86,7 +114,8 @@ def menu_edit_handler(option, inventory):
             item_edit = option.split(',')
             if len(item_edit) == 1:
                 inventory.pop(int(item_edit[0]))
-                print('Item deleted!\n')
+                if verbose:
+                    print('Item deleted!\n')
                 new_state = 'main'
             elif len(item_edit) == 2:
                 item_index = int(item_edit[0])
@@ -96,47 +125,86 @@ def menu_edit_handler(option, inventory):
                     inventory[item_index] = InventoryItem(
                         inventory[item_index].Name,
                         inventory[item_index].Qty + new_quantity)
-                    print('Item modified!\n')
+                    if verbose:
+                        print('Item modified!\n')
                     new_state = 'main'
                 else:
                     new_quantity = int(new_quantity)
                     inventory[item_index] = InventoryItem(
                         inventory[item_index].Name,
                         new_quantity)
-                    print('Item modified!\n')
+                    if verbose:
+                        print('Item modified!\n')
                     new_state = 'main'
+            else:
+                new_state = 'inv'
         except (TypeError, ValueError, KeyError):
             new_state = 'inv'
 
     return new_state
 
 
-def cmd_menu_handler(state):
-    new_state = 'inv'
+# state -> (menu printing function, handler of user entry returning the next state)
+MENUS = {'main': (menu_main, menu_main_handler),
+         'add': (menu_add, menu_add_handler),
+         'edit': (menu_edit, menu_edit_handler)}
+
 
-    if state == 'main':
-        menu_main()
-    elif state == 'add':
-        menu_add()
-    elif state == 'edit':
-        menu_edit()
-    elif state == 'inv':
+def cmd_menu_handler(state, inventory=None, log=None):
+    """
+    Shows menu of the state and handles a single user entry
+
+    :param inventory: inventory to change, module inventory_db by default
+    :param log: file receiving every user entry, see run_batch
+    :return: next state
+    """
+    if state == 'inv':
         print('Invalid command, going back to main menu...\n')
-        new_state = 'main'
-        return new_state
-    else:
-        pass
+        return 'main'
+    inventory = inventory_db if inventory is None else inventory
+
+    menu, handler = MENUS.get(state, (None, None))
+    if menu:
+        menu(inventory)
 
     option = str(input('Enter your choice: '))
     print('\n')
-
-    if state == 'main':
-        new_state = menu_main_handler(option, inventory_db)
-    elif state == 'add':
-        new_state = menu_add_handler(option, inventory_db)
-    elif state == 'edit':
-        new_state = menu_edit_handler(option, inventory_db)
-    return new_state
+    if log is not None:
+        log.write(option + '\n')
+
+    return handler(option, inventory) if handler else 'inv'
+
+
+BatchResult = namedtuple('BatchResult', 'commands errors seconds state')
+
+
+def run_batch(commands, inventory, state='main', log=None):
+    """
+    Applies user entries to inventory without menus and messages, e.g. a session recorded with cmd_menu_handler
+
+    Every entry is handled like in the interactive app, an invalid one returns to the main menu.
+
+    :param commands: iterable of user entries, e.g. lines of a file
+    :param inventory: inventory to change
+    :param state: state before the first entry
+    :param log: file receiving every applied entry
+    :return: BatchResult with number of entries, line numbers of invalid ones, duration and final state
+    """
+    start = time.perf_counter()
+    errors = []
+    line_number = 0
+    for line_number, option in enumerate(commands, 1):
+        option = option.rstrip('\r\n')
+        if log is not None:
+            log.write(option + '\n')
+        handler = MENUS.get(state, (None, None))[1]
+        state = handler(option, inventory, verbose=False) if handler else 'inv'
+        if state == 'inv':
+            errors.append(line_number)
+            state = 'main'
+        elif state == 'exit':
+            break
+    return BatchResult(line_number, errors, time.perf_counter() - start, state)
 
 
 def exit_program(state):
@@ -147,8 +215,26 @@ def exit_program(state):
 
 
 if __name__ == '__main__':
-
-    while True:
-        current_state = cmd_menu_handler(current_state)
-        if exit_program(current_state):
-            break
+    parser = argparse.ArgumentParser(description='Inventory app')
+    parser.add_argument('--replay', default=None,
+                        help='file with user entries applied without menus, - reads standard input')
+    parser.add_argument('--record', default=None, help='file receiving every user entry of this session')
+    args = parser.parse_args()
+
+    command_log = open(args.record, 'w', buffering=1) if args.record else None
+    try:
+        if args.replay:
+            with open(args.replay) if args.replay != '-' else sys.stdin as replayed:
+                result = run_batch(replayed, inventory_db, log=command_log)
+            rate = result.commands / result.seconds if result.seconds else 0.0
+            print(f'{result.commands} commands in {result.seconds:.3f} s ({rate:,.0f} commands/s), '
+                  f'{len(result.errors)} invalid')
+            list_all(inventory_db)
+        else:
+            while True:
+                current_state = cmd_menu_handler(current_state, log=command_log)
+                if exit_program(current_state):
+                    break
+    finally:
+        if command_log is not None:
+            command_log.close()